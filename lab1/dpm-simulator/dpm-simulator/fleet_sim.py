@@ -0,0 +1,264 @@
+"""
+Fleet DPM simulator: one policy configuration over many devices at once.
+
+The work queues of all devices are held as padded NumPy arrays (one row
+per device) and every iteration advances all devices by one inactive +
+active phase. Inside an inactive phase the policies of dpm_policies.c
+reduce to a number of 0.1 ms steps in RUN, an optional RUN -> SLEEP
+transition and a number of steps in SLEEP, so they are computed in closed
+form instead of stepping the clock:
+
+- timeout:   sleep once the device has been inactive for more than `timeout`;
+- adaptive:  the Stage 3 history policy (sleep at once if the last inactive
+             time was >= t_be_sleep, else use the longest short inactive
+             time of the history window as timeout).
+
+The per-device results have the same names and units as the `[sim]` lines
+parsed by run_all.py (s, J), plus the latency of the work items.
+
+Usage (from lab1/dpm-simulator/dpm-simulator/):
+    python fleet_sim.py -psm example/psm.txt -wl ../../workloads/workloads/*.txt -t 0 5 20
+    python fleet_sim.py -psm example/psm.txt --synthetic 10000 --adaptive -o fleet.txt
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'tools'))
+from emiot_tools import count, timed  # noqa: E402
+
+__all__ = ['DT', 'HIST_WIND_SIZE', 'read_psm', 'load_workloads', 'synthetic_fleet',
+           'simulate_fleet', 'fleet_summary']
+
+# ==============================================================================
+# Constants of the C simulator (inc/psm.h, inc/dpm_policies.h)
+# ==============================================================================
+RUN, IDLE, SLEEP = 0, 1, 2
+PSM_TIME_UNIT = 1e-3     # workload and PSM times are in ms
+PSM_ENERGY_UNIT = 1e-3   # PSM energies are in mJ (power in mW)
+DT = 1e-4 / PSM_TIME_UNIT  # simulation time step (ms)
+HIST_WIND_SIZE = 5
+EPS = 1e-9
+
+
+def read_psm(path):
+    """(power[3], tran_energy[3, 3], tran_time[3, 3]) of a PSM file (-1: not allowed)."""
+    with open(path) as f:
+        tokens = f.read().split()
+    power = np.array(tokens[:3], dtype=float)
+    costs = np.array([t.split('/') for t in tokens[3:12]], dtype=float)
+    return power, costs[:, 0].reshape(3, 3), costs[:, 1].reshape(3, 3)
+
+
+def _pad(queues):
+    """Padded (arrival, duration, n_items) arrays; padding arrives at +inf."""
+    n_items = np.array([len(q) for q in queues])
+    arrival = np.full((len(queues), n_items.max()), np.inf)
+    duration = np.zeros_like(arrival)
+    for i, q in enumerate(queues):
+        arrival[i, :len(q)] = q[:, 0]
+        duration[i, :len(q)] = q[:, 1]
+    return arrival, duration, n_items
+
+
+@timed('dpm.load_workloads')
+def load_workloads(paths):
+    """Padded work queues of workload files (`start duration` per line, ms)."""
+    return _pad([np.loadtxt(p, ndmin=2) for p in paths])
+
+
+def synthetic_fleet(n_devices, n_items=100, seed=0, active=(5, 300),
+                    short_idle=5.0, long_idle=2000.0):
+    """
+    Random work queues in the format of get_workload.py: integer active
+    times, and inactive times drawn from a short / long exponential mix
+    whose share of long idles differs per device.
+    """
+    rng = np.random.default_rng(seed)
+    p_long = rng.uniform(0.05, 0.5, (n_devices, 1))
+    idle = np.where(rng.random((n_devices, n_items)) < p_long,
+                    rng.exponential(long_idle, (n_devices, n_items)),
+                    rng.exponential(short_idle, (n_devices, n_items)))
+    duration = rng.integers(active[0], active[1] + 1, (n_devices, n_items)).astype(float)
+    gaps = np.round(idle) + duration
+    arrival = np.concatenate([np.zeros((n_devices, 1)), np.cumsum(gaps[:, :-1], axis=1)], axis=1)
+    return arrival + 2000, duration, np.full(n_devices, n_items)
+
+
+@timed('dpm.fleet')
+def simulate_fleet(psm, arrival, duration, n_items, policy='timeout', timeout=0.0,
+                   t_be_sleep=75.0):
+    """
+    Simulate all devices with the same policy. `psm` is the tuple of
+    `read_psm`, the queues those of `load_workloads` / `synthetic_fleet`.
+
+    Returns a DataFrame with one row per device.
+    """
+    power, tran_energy, tran_time = psm
+    if policy not in ('timeout', 'adaptive'):
+        raise ValueError(f'unsupported policy {policy}')
+    if tran_energy[RUN, SLEEP] == -1 or tran_energy[SLEEP, RUN] == -1:
+        raise ValueError('prohibited transition RUN <-> SLEEP')
+    n_dev = len(n_items)
+    rows = np.arange(n_dev)
+
+    t = np.zeros(n_dev)
+    idx = np.zeros(n_dev, dtype=int)
+    hist = np.zeros((n_dev, HIST_WIND_SIZE))
+    t_state = np.zeros((n_dev, 3))
+    t_waiting = np.zeros(n_dev)
+    n_tran = np.zeros(n_dev, dtype=int)
+    lat_sum = np.zeros(n_dev)
+    lat_max = np.zeros(n_dev)
+
+    live = idx < n_items
+    while live.any():
+        # 1. Inactive phase: RUN steps until the timeout expires, then SLEEP
+        a = np.where(live, arrival[rows, np.minimum(idx, n_items - 1)], t)
+        inactive = a - t
+        if policy == 'timeout':
+            tout = np.full(n_dev, float(timeout))
+        else:
+            short = np.where(hist < t_be_sleep, hist, 0).max(axis=1)
+            tout = np.where(hist[:, -1] >= t_be_sleep, -np.inf, short)
+        # steps taken while t <= t_start + tout and t < arrival
+        n_run = np.minimum(np.floor(tout / DT + EPS) + 1, np.ceil(inactive / DT - EPS))
+        t_run = np.maximum(n_run, 0) * DT
+        sleep = live & (inactive - t_run > EPS)
+        t_end = t + t_run + np.where(sleep, tran_time[RUN, SLEEP], 0)
+        t_sleep = np.where(sleep, np.maximum(np.ceil((a - t_end) / DT - EPS), 0) * DT, 0)
+        t_end += t_sleep
+
+        t_state[:, RUN] += t_run
+        t_state[:, SLEEP] += t_sleep
+        t_waiting += t_run
+        n_tran += 2 * sleep
+        hist[live] = np.column_stack([hist[live, 1:], (t_end - t)[live]])
+        # 2. Active phase: wake up and run every queued item
+        t = t_end + np.where(sleep, tran_time[SLEEP, RUN], 0)
+        while True:
+            ready = live & (idx < n_items)
+            ready[ready] = arrival[rows[ready], idx[ready]] <= t[ready] + EPS
+            if not ready.any():
+                break
+            r = rows[ready]
+            lat = t[r] - arrival[r, idx[r]]
+            lat_sum[r] += lat
+            lat_max[r] = np.maximum(lat_max[r], lat)
+            t[r] += duration[r, idx[r]]
+            t_state[r, RUN] += duration[r, idx[r]]
+            idx[r] += 1
+        live = idx < n_items
+
+    # baseline without DPM: always RUN, items start on arrival (or when the previous ends)
+    valid = np.arange(arrival.shape[1]) < n_items[:, None]
+    t_active = np.where(valid, duration, 0).sum(axis=1)
+    t_no_dpm = arrival[rows, n_items - 1] + duration[rows, n_items - 1]
+
+    e_tran_one = tran_energy[RUN, SLEEP] + tran_energy[SLEEP, RUN]
+    e_tran = n_tran / 2 * e_tran_one
+    energy = (t_state @ power) * PSM_TIME_UNIT + e_tran
+    t_tran = n_tran / 2 * (tran_time[RUN, SLEEP] + tran_time[SLEEP, RUN])
+    return pd.DataFrame({
+        'active_time': t_active * PSM_TIME_UNIT,
+        'inactive_time': (t_no_dpm - t_active) * PSM_TIME_UNIT,
+        'time_no_dpm': t_no_dpm * PSM_TIME_UNIT,
+        'time_dpm': t * PSM_TIME_UNIT,
+        'time_run': t_state[:, RUN] * PSM_TIME_UNIT,
+        'time_idle': t_state[:, IDLE] * PSM_TIME_UNIT,
+        'time_sleep': t_state[:, SLEEP] * PSM_TIME_UNIT,
+        'time_waiting': t_waiting * PSM_TIME_UNIT,
+        'time_transitions': t_tran * PSM_TIME_UNIT,
+        'transitions': n_tran,
+        'energy_transitions': e_tran * PSM_ENERGY_UNIT,
+        'energy_no_dpm': power[RUN] * t_no_dpm * PSM_TIME_UNIT * PSM_ENERGY_UNIT,
+        'energy_dpm': energy * PSM_ENERGY_UNIT,
+        'latency_mean': lat_sum / n_items * PSM_TIME_UNIT,
+        'latency_max': lat_max * PSM_TIME_UNIT,
+    })
+
+
+def fleet_summary(df):
+    """Fleet aggregates of a `simulate_fleet` result."""
+    return pd.Series({
+        'devices': len(df),
+        'energy_dpm': df['energy_dpm'].sum(),
+        'energy_no_dpm': df['energy_no_dpm'].sum(),
+        'saving_pct': 100 * (1 - df['energy_dpm'].sum() / df['energy_no_dpm'].sum()),
+        'transitions': df['transitions'].sum(),
+        'delay_mean': (df['time_dpm'] - df['time_no_dpm']).mean(),
+        'latency_mean': df['latency_mean'].mean(),
+        'latency_p95': df['latency_max'].quantile(0.95),
+        'latency_max': df['latency_max'].max(),
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batched DPM simulation of a device fleet')
+    parser.add_argument('-psm', type=str, required=True, help='Power state machine file')
+    parser.add_argument('-wl', type=str, nargs='*', default=[], help='Workload files (one per device)')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Simulate N random devices instead of workload files')
+    parser.add_argument('--items', type=int, default=100, help='Work items per synthetic device')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-t', type=float, nargs='*', default=[0.0], help='Timeouts to evaluate (ms)')
+    parser.add_argument('--adaptive', action='store_true', help='Use the adaptive history policy')
+    parser.add_argument('--t-be-sleep', type=float, default=75.0,
+                        help='Break-even time of the adaptive policy (ms)')
+    parser.add_argument('-o', type=str, help='Save the per-device results (tab separated)')
+    parser.add_argument('--store', type=str, metavar='DB',
+                        help='Append the runs to a results store (tools/results_store.py)')
+    args = parser.parse_args()
+
+    psm = read_psm(args.psm)
+    if args.synthetic:
+        fleet = synthetic_fleet(args.synthetic, args.items, args.seed)
+        names = [f'device_{i}' for i in range(args.synthetic)]
+    elif args.wl:
+        fleet = load_workloads(args.wl)
+        names = [os.path.basename(p) for p in args.wl]
+    else:
+        parser.error('give workload files (-wl) or --synthetic N')
+
+    configs = [('adaptive', None)] if args.adaptive else [('timeout', t) for t in args.t]
+    results, summary = [], []
+    for policy, timeout in configs:
+        t0 = time.perf_counter()
+        df = simulate_fleet(psm, *fleet, policy=policy, timeout=timeout or 0.0,
+                            t_be_sleep=args.t_be_sleep)
+        df.attrs['runtime'] = (time.perf_counter() - t0) / len(df)
+        count('dpm.device_runs', len(df))
+        df.insert(0, 'device', names)
+        df.insert(1, 'policy', policy)
+        df.insert(2, 'timeout', timeout)
+        results.append(df)
+        summary.append(fleet_summary(df).rename(f'{policy} {timeout if timeout is not None else ""}'))
+
+    print(pd.DataFrame(summary).to_string(float_format=lambda x: f'{x:.6g}'))
+    if args.o:
+        pd.concat(results).to_csv(args.o, sep='\t', index=False, float_format='%.6f')
+        print(f"\nResults saved to: {args.o}")
+    if args.store:
+        from emiot_tools import ResultsStore
+        paths = dict(zip(names, args.wl))
+
+        def run(row, runtime):
+            device, policy, timeout = row.pop('device'), row.pop('policy'), row.pop('timeout')
+            params = {'device': device}
+            if policy == 'adaptive':
+                params['t_be_sleep'] = args.t_be_sleep
+            else:
+                params['timeout'] = timeout
+            if args.synthetic:
+                params['seed'] = args.seed
+            return dict(kind='dpm_fleet', metrics=row, params=params, policy=policy, psm=args.psm,
+                        workload=paths.get(device), lab='lab1', runtime=runtime)
+
+        with ResultsStore(args.store) as store:
+            for df in results:
+                store.add_runs(run(row, df.attrs['runtime']) for row in df.to_dict('records'))
+        print(f"Runs appended to: {args.store}")
@@ -0,0 +1,280 @@
+"""
+PSM design-space explorer: which power-state improvements pay off on our
+workloads.
+
+A PSM file (`example/psm.txt` format: state powers on the first line, then
+the `energy/time` transition matrix, -1/-1 for a prohibited transition) is
+parsed and validated, families of variants are generated from it (scaled
+sleep / idle power, scaled transition costs, an added deep-sleep state)
+and every variant is evaluated on the inactive periods of a workload set,
+in parallel. For each state reachable from Run (and back) it reports the
+break-even time
+
+    T_be = max(t_tr, (E_tr - P_s * t_tr) / (P_run - P_s))
+
+and two energies over all workloads:
+
+- oracle:   every inactive period spent in its best state (lower bound);
+- timeout:  timeout policy with timeout = T_be of its target state, best
+            target state (what a simple policy actually gets).
+
+The variants are ranked by their gain over the base PSM.
+
+Usage (from lab1/dpm-simulator/dpm-simulator/):
+    python psm_explorer.py -psm example/psm.txt -wl ../../workloads/workloads/*.txt
+    python psm_explorer.py -psm example/psm.txt -wl ../../workloads/workloads/workload_1.txt \
+        --sleep-power 0.5 0.1 --tran-cost 0.5 2 --deep-state 0.1 4 --compare example/origin_psm.txt
+"""
+import argparse
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fleet_sim import PSM_ENERGY_UNIT, PSM_TIME_UNIT, load_workloads
+
+__all__ = ['Psm', 'STATE_NAMES', 'parse_psm', 'write_psm', 'breakeven_times', 'inactive_periods',
+           'psm_variants', 'evaluate_psm', 'explore']
+
+STATE_NAMES = ('Run', 'Idle', 'Sleep')
+RUN = 0
+PSM_POWER_UNIT = 1e-3
+# power * time -> energy, as psm_state_energy in src/psm.c
+ENERGY_SCALE = PSM_POWER_UNIT * PSM_TIME_UNIT / PSM_ENERGY_UNIT
+
+Psm = namedtuple('Psm', ['states', 'power', 'tran_energy', 'tran_time'])
+
+
+# ==============================================================================
+# PSM files
+# ==============================================================================
+def _validate(psm, source):
+    n = len(psm.states)
+    if psm.tran_energy.shape != (n, n) or psm.tran_time.shape != (n, n):
+        raise ValueError(f'{source}: {n} states need a {n}x{n} transition matrix')
+    if (psm.power < 0).any():
+        raise ValueError(f'{source}: negative state power')
+    prohibited = psm.tran_energy == -1
+    if (prohibited != (psm.tran_time == -1)).any():
+        raise ValueError(f'{source}: energy/time must be both -1 for a prohibited transition')
+    if (psm.tran_energy[~prohibited] < 0).any() or (psm.tran_time[~prohibited] < 0).any():
+        raise ValueError(f'{source}: negative transition cost')
+    if np.diag(psm.tran_energy).any() or np.diag(psm.tran_time).any():
+        raise ValueError(f'{source}: self transitions must cost 0/0')
+    if psm.power.argmax() != RUN:
+        raise ValueError(f'{source}: {psm.states[RUN]} must be the highest-power state')
+    return psm
+
+
+def parse_psm(path):
+    """Read and validate a PSM file; the number of states is that of the first line."""
+    with open(path) as f:
+        lines = [line.split() for line in f if line.strip()]
+    n = len(lines[0])
+    try:
+        power = np.array(lines[0], dtype=float)
+        costs = np.array([t.split('/') for row in lines[1:] for t in row], dtype=float)
+    except ValueError:
+        raise ValueError(f'{path}: malformed PSM entry')
+    if len(lines) != n + 1 or costs.shape != (n * n, 2):
+        raise ValueError(f'{path}: expected {n} powers and a {n}x{n} matrix of energy/time pairs')
+    states = STATE_NAMES[:n] + tuple(f'S{i}' for i in range(len(STATE_NAMES), n))
+    return _validate(Psm(states, power, costs[:, 0].reshape(n, n), costs[:, 1].reshape(n, n)), path)
+
+
+def write_psm(path, psm):
+    """Write a PSM in the input format of dpm_simulator."""
+    def fmt(x):
+        return f'{x:g}'
+    with open(path, 'w') as f:
+        f.write('\t'.join(fmt(p) for p in psm.power) + '\n')
+        for e_row, t_row in zip(psm.tran_energy, psm.tran_time):
+            f.write('\t'.join(f'{fmt(e)}/{fmt(t)}' for e, t in zip(e_row, t_row)) + '\n')
+
+
+def _usable(psm):
+    """States with direct transitions Run -> s and s -> Run."""
+    return [s for s in range(1, len(psm.states))
+            if psm.tran_energy[RUN, s] != -1 and psm.tran_energy[s, RUN] != -1]
+
+
+def breakeven_times(psm):
+    """{state: T_be (ms)} for every state reachable from Run and back."""
+    t_be = {}
+    for s in _usable(psm):
+        e_tr = psm.tran_energy[RUN, s] + psm.tran_energy[s, RUN]
+        t_tr = psm.tran_time[RUN, s] + psm.tran_time[s, RUN]
+        saving = psm.power[RUN] - psm.power[s]
+        if saving <= 0:
+            t_be[psm.states[s]] = np.inf
+        else:
+            t_be[psm.states[s]] = max(t_tr, (e_tr / ENERGY_SCALE - psm.power[s] * t_tr) / saving)
+    return t_be
+
+
+# ==============================================================================
+# Variant families
+# ==============================================================================
+def _scaled(psm, power=None, cost=None):
+    p, e, t = psm.power.copy(), psm.tran_energy.copy(), psm.tran_time.copy()
+    for s, k in (power or {}).items():
+        p[s] *= k
+    for s, k in (cost or {}).items():
+        for i, j in ((RUN, s), (s, RUN)):
+            if e[i, j] != -1:
+                e[i, j] *= k
+                t[i, j] *= k
+    return Psm(psm.states, p, e, t)
+
+
+def _with_state(psm, power, e_in, t_in, e_out, t_out, name='Deep'):
+    n = len(psm.states)
+    e = np.full((n + 1, n + 1), -1.0)
+    t = np.full((n + 1, n + 1), -1.0)
+    e[:n, :n], t[:n, :n] = psm.tran_energy, psm.tran_time
+    e[n, n] = t[n, n] = 0
+    e[RUN, n], t[RUN, n], e[n, RUN], t[n, RUN] = e_in, t_in, e_out, t_out
+    return Psm(psm.states + (name,), np.append(psm.power, power), e, t)
+
+
+def psm_variants(base, sleep_power=(), idle_power=(), tran_cost=(), deep_state=()):
+    """
+    (name, Psm) pairs: the base PSM, then Sleep / Idle power scaled by each
+    factor, Sleep transition costs scaled by each factor, and a Deep state
+    for each (power factor, cost factor) pair relative to Sleep.
+    """
+    sleep = base.states.index('Sleep')
+    idle = base.states.index('Idle')
+    yield 'base', base
+    for k in sleep_power:
+        yield f'sleep power x{k:g}', _scaled(base, power={sleep: k})
+    for k in idle_power:
+        yield f'idle power x{k:g}', _scaled(base, power={idle: k})
+    for k in tran_cost:
+        yield f'sleep transitions x{k:g}', _scaled(base, cost={sleep: k})
+    for kp, kc in deep_state:
+        yield (f'deep state (power x{kp:g}, transitions x{kc:g})',
+               _with_state(base, base.power[sleep] * kp,
+                           base.tran_energy[RUN, sleep] * kc, base.tran_time[RUN, sleep] * kc,
+                           base.tran_energy[sleep, RUN] * kc, base.tran_time[sleep, RUN] * kc))
+
+
+# ==============================================================================
+# Evaluation
+# ==============================================================================
+def inactive_periods(arrival, duration, n_items):
+    """Flat array of the inactive periods (ms) of padded work queues, and the active time."""
+    valid = np.arange(arrival.shape[1]) < n_items[:, None]
+    prev_end = np.concatenate([np.zeros((len(arrival), 1)), (arrival + duration)[:, :-1]], axis=1)
+    with np.errstate(invalid='ignore'):  # padding: inf - inf
+        idle = np.maximum(arrival - prev_end, 0)
+    return idle[valid], duration[valid].sum()
+
+
+def evaluate_psm(psm, idle, t_active):
+    """Energies (J) and wake-up delay (s) of one PSM over the inactive periods `idle` (ms)."""
+    p_run = psm.power[RUN]
+    e_run = p_run * idle * ENERGY_SCALE
+    base = p_run * t_active * ENERGY_SCALE
+    t_be = breakeven_times(psm)
+    oracle = e_run.copy()
+    best = {'energy_timeout': np.inf, 'delay_timeout': 0.0, 'timeout_state': psm.states[RUN]}
+    for s in _usable(psm):
+        e_in, e_out = psm.tran_energy[RUN, s], psm.tran_energy[s, RUN]
+        t_in, t_out = psm.tran_time[RUN, s], psm.tran_time[s, RUN]
+        # oracle: enter at once, wake up in time (the period must fit both transitions)
+        fits = idle >= t_in + t_out
+        e_s = e_in + e_out + psm.power[s] * (idle - t_in - t_out) * ENERGY_SCALE
+        oracle = np.where(fits, np.minimum(oracle, e_s), oracle)
+        # timeout = T_be: Run until the timeout, then s until the arrival, then wake up
+        tout = t_be[psm.states[s]]
+        goes = idle > tout
+        e_t = np.where(goes, p_run * tout * ENERGY_SCALE + e_in + e_out
+                       + psm.power[s] * np.maximum(idle - tout - t_in, 0) * ENERGY_SCALE, e_run)
+        if e_t.sum() < best['energy_timeout']:
+            delay = np.where(goes, t_out + np.maximum(tout + t_in - idle, 0), 0)
+            best = {'energy_timeout': e_t.sum(), 'delay_timeout': delay.sum(),
+                    'timeout_state': psm.states[s]}
+    if not np.isfinite(best['energy_timeout']):
+        best['energy_timeout'] = e_run.sum()
+    return {
+        'energy_no_dpm': (base + e_run.sum()) * PSM_ENERGY_UNIT,
+        'energy_oracle': (base + oracle.sum()) * PSM_ENERGY_UNIT,
+        'energy_timeout': (base + best['energy_timeout']) * PSM_ENERGY_UNIT,
+        'timeout_state': best['timeout_state'],
+        'delay_timeout': best['delay_timeout'] * PSM_TIME_UNIT,
+    }
+
+
+def _evaluate(task):
+    name, psm, idle, t_active = task
+    row = {'variant': name}
+    row.update({f'T_be_{s}': t for s, t in breakeven_times(psm).items()})
+    row.update(evaluate_psm(psm, idle, t_active))
+    return row
+
+
+def explore(variants, workloads, workers=None):
+    """
+    Ranked DataFrame of `variants` ((name, Psm) pairs, the first one is the
+    reference) evaluated on the union of the `workloads` files.
+    """
+    idle, t_active = inactive_periods(*load_workloads(workloads))
+    tasks = [(name, psm, idle, t_active) for name, psm in variants]
+    if workers == 1:
+        rows = [_evaluate(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(_evaluate, tasks))
+    df = pd.DataFrame(rows)
+    for col in ('oracle', 'timeout'):
+        ref = df[f'energy_{col}'].iloc[0]
+        df[f'gain_{col}_pct'] = 100 * (1 - df[f'energy_{col}'] / ref)
+    return df.sort_values('energy_timeout').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Explore PSM variants on a workload set')
+    parser.add_argument('-psm', type=str, required=True, help='Base power state machine file')
+    parser.add_argument('-wl', type=str, nargs='+', required=True, help='Workload files')
+    parser.add_argument('--compare', type=str, nargs='*', default=[],
+                        help='Other PSM files to rank with the variants')
+    parser.add_argument('--sleep-power', type=float, nargs='*', default=[0.5, 0.25, 0.1],
+                        help='Sleep power scale factors')
+    parser.add_argument('--idle-power', type=float, nargs='*', default=[0.5],
+                        help='Idle power scale factors')
+    parser.add_argument('--tran-cost', type=float, nargs='*', default=[0.5, 0.25, 2],
+                        help='Sleep transition energy/time scale factors')
+    parser.add_argument('--deep-state', type=float, nargs=2, action='append',
+                        metavar=('POWER', 'COST'), default=None,
+                        help='Add a state with POWER x Sleep power and COST x Sleep transitions')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('-o', type=str, help='Save the ranking (tab separated)')
+    parser.add_argument('--write-dir', type=str,
+                        help='Write every variant as a PSM file in this directory '
+                             '(dpm_simulator reads 3-state PSMs only)')
+    args = parser.parse_args()
+
+    base = parse_psm(args.psm)
+    deep = args.deep_state if args.deep_state is not None else [(0.1, 4)]
+    variants = list(psm_variants(base, args.sleep_power, args.idle_power, args.tran_cost, deep))
+    variants += [(os.path.basename(p), parse_psm(p)) for p in args.compare]
+
+    print(f"{args.psm}: break-even times " +
+          ', '.join(f'{s} {t:.3f} ms' for s, t in breakeven_times(base).items()))
+    df = explore(variants, args.wl, args.workers)
+    cols = ['variant'] + [c for c in df.columns if c.startswith('T_be_')] + [
+        'energy_oracle', 'gain_oracle_pct', 'energy_timeout', 'gain_timeout_pct',
+        'timeout_state', 'delay_timeout']
+    print(df[cols].to_string(float_format=lambda x: f'{x:.4f}'))
+
+    if args.o:
+        df.to_csv(args.o, sep='\t', index=False, float_format='%.6f')
+        print(f"\nResults saved to: {args.o}")
+    if args.write_dir:
+        os.makedirs(args.write_dir, exist_ok=True)
+        for i, (name, psm) in enumerate(variants):
+            write_psm(os.path.join(args.write_dir, f'psm_{i:02d}.txt'), psm)
+        print(f"Variants written to: {args.write_dir}")
@@ -1,8 +1,15 @@
+import argparse
+import os
 import subprocess
 import re
+import sys
+import time
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'tools'))
+from emiot_tools import count, stage, timed  # noqa: E402
+
 # ==============================================================================
 # 1. Configuration - modify according to your experiment
 # ==============================================================================
@@ -11,7 +18,7 @@ SIMULATOR_EXEC = './dpm_simulator'
 
 
 #WORKLOAD_FILE = '../../workloads/workloads/workload_2.txt'
-#WORKLOAD_FILE = '../../workloads/workloads/workload_1.txt'
+WORKLOAD_FILE = '../../workloads/workloads/workload_1.txt'
 
 PSM_FILE = 'example/psm.txt'
 
@@ -19,10 +26,40 @@ PSM_FILE = 'example/psm.txt'
 # e.g. range(1, 101, 2) means 1 to 100, step 2 (1, 3, 5...)
 TIMEOUT_RANGE = range(0,101, 1)
 
+# Results store (tools/results_store.py): every run is appended to it if set
+# e.g. RESULTS_DB = '../../../results.db'
+RESULTS_DB = None
+
+# State the timeout policy moves to (the build of the simulator decides it);
+# recorded with the runs so that the idle and sleep sweeps stay apart
+TIMEOUT_STATE = 'sleep'
+
+# Show the plot window at the end (the figure is saved either way)
+SHOW_PLOT = True
+
+# The values above can also be given on the command line (`emiot dpm sweep` uses these flags)
+parser = argparse.ArgumentParser(description='Timeout sweep of the DPM simulator')
+parser.add_argument('-wl', type=str, default=WORKLOAD_FILE, help='Workload file')
+parser.add_argument('-psm', type=str, default=PSM_FILE, help='PSM file')
+parser.add_argument('-t', type=int, nargs=3, metavar=('START', 'STOP', 'STEP'),
+                    help='Timeout range (ms), as range(START, STOP, STEP)')
+parser.add_argument('--sim', type=str, default=SIMULATOR_EXEC, help='Simulator executable')
+parser.add_argument('--db', type=str, default=RESULTS_DB, help='Results store to append to')
+parser.add_argument('--state', type=str, default=TIMEOUT_STATE, choices=('idle', 'sleep'),
+                    help='State the timeout policy moves to, recorded in the results store')
+parser.add_argument('--no-show', action='store_true', help='Only save the plot')
+args = parser.parse_args()
+SIMULATOR_EXEC, WORKLOAD_FILE, PSM_FILE, RESULTS_DB = args.sim, args.wl, args.psm, args.db
+TIMEOUT_STATE = args.state
+if args.t:
+    TIMEOUT_RANGE = range(*args.t)
+SHOW_PLOT = SHOW_PLOT and not args.no_show
+
 # ==============================================================================
 # 2. Core script functions - no modification needed
 # ==============================================================================
 
+@timed('dpm.simulate')
 def run_simulation(timeout, workload_path, psm_path):
     """Build command, run simulator and return output"""
     command = [
@@ -34,6 +71,7 @@ def run_simulation(timeout, workload_path, psm_path):
     result = subprocess.run(command, capture_output=True, text=True, check=True)
     return result.stdout
 
+@timed('dpm.parse')
 def parse_output(output_text):
     """Parse all key data from output text using regex"""
     patterns = {
@@ -65,6 +103,7 @@ def parse_output(output_text):
 
 
 
+@timed('dpm.workload_analysis')
 def analyze_workload_distribution(filepath):
     """
     Read workload file and compute idle time distribution.
@@ -117,16 +156,20 @@ analyze_workload_distribution(WORKLOAD_FILE)
 
 # --- Main program ---
 all_results = []
+runtimes = {}
 print(f"Starting batch test for {WORKLOAD_FILE}...")
 print(f"Timeout range: {TIMEOUT_RANGE.start}ms to {TIMEOUT_RANGE.stop - 1}ms")
 
 for t in TIMEOUT_RANGE:
     try:
         print(f"Running t = {t}ms...", end='', flush=True)
+        t0 = time.perf_counter()
         output = run_simulation(t, WORKLOAD_FILE, PSM_FILE)
+        runtimes[t] = time.perf_counter() - t0
         data = parse_output(output)
         data['timeout'] = t
         all_results.append(data)
+        count('dpm.runs')
         print(" done")
     except subprocess.CalledProcessError as e:
         print(f"\nError: simulator failed (t={t}ms).")
@@ -149,9 +192,20 @@ print(df_results)
 output_txt_filename = f'results_{WORKLOAD_FILE.split("/")[-1].split(".")[0]}.txt'
 
 # Save DataFrame to text file
-df_results.to_csv(output_txt_filename, sep='\t', index=False, float_format='%.6f')
+with stage('dpm.save'):
+    df_results.to_csv(output_txt_filename, sep='\t', index=False, float_format='%.6f')
 print(f"\nResults saved to: {output_txt_filename}")
 
+if RESULTS_DB:
+    from emiot_tools import ResultsStore
+    with ResultsStore(RESULTS_DB) as store:
+        for row in df_results.to_dict('records'):
+            t = row.pop('timeout')
+            store.add_run('dpm_sweep', row, params={'timeout': t, 'state': TIMEOUT_STATE},
+                          workload=WORKLOAD_FILE, psm=PSM_FILE, policy='timeout', lab='lab1',
+                          runtime=runtimes.get(t))
+    print(f"Runs appended to: {RESULTS_DB}")
+
 # ==============================================================================
 # 3. Visualization
 # ==============================================================================
@@ -182,6 +236,8 @@ if not df_results.empty and 'energy_dpm' in df_results.columns and df_results['e
     fig.legend(loc="upper right", bbox_to_anchor=(1,1), bbox_transform=ax1.transAxes)
 
     output_filename = f'analysis_{WORKLOAD_FILE.split("/")[-1].split(".")[0]}.png'
-    plt.savefig(output_filename)
+    with stage('dpm.plot'):
+        plt.savefig(output_filename)
     print(f"\nPlot saved as: {output_filename}")
-    plt.show()
+    if SHOW_PLOT:
+        plt.show()
@@ -0,0 +1,220 @@
+#!/usr/bin/python
+"""
+Jumper virtual-lab GPIO capture streamed into a DPM workload file.
+
+The pin edges reported by `on_pin_level_event` are pushed into a
+preallocated ring buffer (no per-edge list growth). The simulation runs in
+chunks of device time; after each chunk the buffer is drained and the
+edges are paired into work items (active edge -> inactive edge), which are
+appended to the output in the workload format of the DPM simulator
+(`arrival duration`, ms per line). Memory stays bounded however long the
+capture is, and the result can be passed straight to `dpm_simulator -wl`.
+
+A printed timestamp log (one edge time per line, as test_script.py prints
+them) can be converted the same way with `convert`.
+
+Usage (from lab1/extra_jumper/jumper/):
+    python gpio_capture.py capture BME280-example.hex -o workload_jumper.txt --ms 3600000
+    python gpio_capture.py convert jumper_log.txt -o workload_jumper.txt --skip-edges 20 --plot
+"""
+from __future__ import division, print_function
+
+import argparse
+import itertools
+import threading
+
+import numpy as np
+
+__all__ = ['EdgeRing', 'WorkloadConverter', 'capture', 'convert_log', 'plot_workload']
+
+
+class EdgeRing(object):
+    """Fixed-capacity buffer of (time, level) edges; the oldest are dropped on overflow."""
+
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.time = np.empty(capacity)
+        self.level = np.empty(capacity, dtype=np.int8)
+        self.head = 0          # next write position
+        self.count = 0
+        self.dropped = 0
+        self.peak = 0          # highest occupancy seen
+        self._lock = threading.Lock()
+
+    def push(self, t, level):
+        with self._lock:
+            if self.count == self.capacity:
+                self.count -= 1
+                self.dropped += 1
+            self.time[self.head] = t
+            self.level[self.head] = level
+            self.head = (self.head + 1) % self.capacity
+            self.count += 1
+            self.peak = max(self.peak, self.count)
+
+    def drain(self):
+        """(times, levels) of the buffered edges, oldest first; empties the buffer."""
+        with self._lock:
+            idx = (self.head - self.count + np.arange(self.count)) % self.capacity
+            self.count = 0
+            return self.time[idx], self.level[idx]
+
+
+class WorkloadConverter(object):
+    """
+    Pairs edges into (arrival, duration) work items and writes them to `out`.
+
+    Repeated levels are ignored, the first `skip_edges` edges (boot
+    activity) are discarded, and an item still active at the end is kept
+    pending until the next `feed`.
+    """
+
+    def __init__(self, out, active_level=1, skip_edges=0, min_duration=0.0, precision=3):
+        self.out = out
+        self.active_level = active_level
+        self.skip_edges = skip_edges
+        self.min_duration = min_duration
+        self.fmt = '%.{0}f'.format(precision)
+        self.items = 0
+        self.active_time = 0.0
+        self._level = None     # level of the last edge
+        self._start = None     # arrival of the pending item
+
+    def feed(self, times, levels):
+        if self.skip_edges:
+            n = min(self.skip_edges, len(times))
+            times, levels = times[n:], levels[n:]
+            self.skip_edges -= n
+        if len(times) == 0:
+            return 0
+        active = (levels == self.active_level)
+        prev = np.concatenate(([self._level == self.active_level], active[:-1]))
+        if self._level is None:
+            prev[0] = not active[0]
+        change = active != prev
+        t, active = times[change], active[change]
+        if len(t):
+            self._level = self.active_level if active[-1] else 1 - self.active_level
+        starts, ends = t[active], t[~active]
+        if self._start is not None:
+            starts = np.concatenate(([self._start], starts))
+        elif len(ends) and (not len(starts) or ends[0] < starts[0]):
+            ends = ends[1:]  # capture started during an active phase
+        n = len(ends)
+        self._start = starts[n] if len(starts) > n else None
+
+        items = np.column_stack([starts[:n], ends - starts[:n]])
+        items = items[items[:, 1] >= self.min_duration]
+        if len(items):
+            np.savetxt(self.out, items, fmt=self.fmt)
+            self.out.flush()
+            self.items += len(items)
+            self.active_time += items[:, 1].sum()
+        return len(items)
+
+
+def capture(hex_file, out_path, duration_ms, pin=None, chunk_ms=1000, capacity=1 << 16,
+            working_directory='.', platform='nrf52832', **kw):
+    """
+    Run the firmware on the Jumper virtual lab for `duration_ms` and stream
+    the work items of `pin` (all pins if None) into `out_path`.
+    Returns the converter and the ring buffer (for their statistics).
+    """
+    from jumper.vlab import Vlab  # only needed for a live capture
+
+    ring = EdgeRing(capacity)
+    v = Vlab(working_directory=working_directory, platform=platform, print_uart=False)
+    v.load(hex_file)
+
+    def on_edge(number, level):
+        if pin is None or number == pin:
+            ring.push(v.get_device_time_ms(), level)
+
+    v.on_pin_level_event(on_edge)
+    with open(out_path, 'w') as out:
+        conv = WorkloadConverter(out, **kw)
+        elapsed = 0
+        while elapsed < duration_ms:
+            step = min(chunk_ms, duration_ms - elapsed)
+            v.run_for_ms(step)
+            elapsed += step
+            conv.feed(*ring.drain())
+        v.stop()
+    return conv, ring
+
+
+def _timestamps(f):
+    # numeric lines only: the log also holds the script and UART messages
+    for line in f:
+        try:
+            yield float(line)
+        except ValueError:
+            continue
+
+
+def convert_log(log_path, out_path, first_level=1, block=1 << 16, **kw):
+    """Convert a log of edge timestamps (levels alternate, starting at `first_level`)."""
+    with open(log_path) as f, open(out_path, 'w') as out:
+        conv = WorkloadConverter(out, **kw)
+        stamps = _timestamps(f)
+        n_edges = 0
+        while True:
+            times = np.fromiter(itertools.islice(stamps, block), dtype=float)
+            if not len(times):
+                break
+            levels = ((first_level + n_edges + np.arange(len(times))) % 2).astype(np.int8)
+            conv.feed(times, levels)
+            n_edges += len(times)
+    return conv
+
+
+def plot_workload(path, max_items=2000):
+    """Activity wave of the first `max_items` work items (one step plot)."""
+    import matplotlib.pyplot as plt
+
+    wl = np.loadtxt(path, ndmin=2, max_rows=max_items)
+    t = np.column_stack([wl[:, 0], wl[:, 0] + wl[:, 1]]).ravel()
+    val = np.tile([1, 0], len(wl))
+    plt.figure()
+    plt.step(np.concatenate(([0], t)), np.concatenate(([0], val)), where='post')
+    plt.xlabel('Time (ms)')
+    plt.ylabel('Active')
+    plt.title(path)
+    plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Jumper GPIO capture to DPM workload')
+    sub = parser.add_subparsers(dest='cmd')
+    cap = sub.add_parser('capture', help='Run the firmware on the virtual lab')
+    cap.add_argument('hex', type=str, help='Firmware image')
+    cap.add_argument('--ms', type=int, default=4000, help='Device time to simulate (ms)')
+    cap.add_argument('--pin', type=int, default=None, help='Only this GPIO pin')
+    cap.add_argument('--chunk-ms', type=int, default=1000, help='Device time between drains')
+    cap.add_argument('--capacity', type=int, default=1 << 16, help='Ring buffer size (edges)')
+    conv = sub.add_parser('convert', help='Convert a log of edge timestamps')
+    conv.add_argument('log', type=str, help='Timestamp log (one edge per line)')
+    conv.add_argument('--first-level', type=int, default=1, choices=(0, 1),
+                      help='Level of the first edge of the log')
+    for p in (cap, conv):
+        p.add_argument('-o', type=str, default='workload_jumper.txt', help='Output workload file')
+        p.add_argument('--active-level', type=int, default=1, choices=(0, 1))
+        p.add_argument('--skip-edges', type=int, default=20,
+                       help='Boot edges to discard (test_script.py skips 20)')
+        p.add_argument('--min-duration', type=float, default=0.0,
+                       help='Drop work items shorter than this (ms)')
+        p.add_argument('--plot', action='store_true', help='Plot the resulting workload')
+    args = parser.parse_args()
+
+    kw = dict(active_level=args.active_level, skip_edges=args.skip_edges,
+              min_duration=args.min_duration)
+    if args.cmd == 'capture':
+        conv, ring = capture(args.hex, args.o, args.ms, args.pin, args.chunk_ms, args.capacity, **kw)
+        print('Ring buffer peak: {0} edges, dropped: {1}'.format(ring.peak, ring.dropped))
+    elif args.cmd == 'convert':
+        conv = convert_log(args.log, args.o, args.first_level, **kw)
+    else:
+        parser.error('choose capture or convert')
+    print('{0} work items, {1:.3f} ms active -> {2}'.format(conv.items, conv.active_time, args.o))
+    if args.plot:
+        plot_workload(args.o)
@@ -0,0 +1,57 @@
+"""
+Compare the fused DVS kernel (`dvs_display`) with the notebook chain
+(`compute_pixel_current` + `compute_panel_power` + `displayed_image`).
+
+Run from lab2/:
+    python benchmarks/bench_dvs.py
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from harness import measure
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from image_power import (compute_panel_power, compute_pixel_current,  # noqa: E402
+                         displayed_image, dvs_display)
+
+SIZES = {'720p': (720, 1280), '1080p': (1080, 1920), '4K': (2160, 3840)}
+
+
+def chain(img, vdd):
+    i_cell = compute_pixel_current(img, vdd)
+    power = compute_panel_power(i_cell, vdd)
+    _, out = displayed_image(i_cell, vdd, orig_vdd=15.0)
+    i_cell_max = 4.251e-5 * vdd - 3.029e-4 + 3.024e-5
+    return out, power, np.mean(i_cell > i_cell_max)
+
+
+def main(vdd, repeat):
+    rng = np.random.default_rng(0)
+    print(f"{'size':<8}{'impl':<8}{'time (ms)':>12}{'MP/s':>10}{'peak (MB)':>12}")
+    for name, (h, w) in SIZES.items():
+        img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        buf = np.empty_like(img)
+
+        ref, _, _ = chain(img, vdd)
+        out, _, _ = dvs_display(img, vdd, out=buf)
+        assert np.array_equal(ref, out), 'fused kernel differs from chain'
+
+        mp = h * w / 1e6
+        for impl, func in (('chain', lambda: chain(img, vdd)),
+                           ('fused', lambda: dvs_display(img, vdd, out=buf))):
+            t, peak = measure(func, repeat)
+            print(f"{name:<8}{impl:<8}{t * 1e3:>12.1f}{mp / t:>10.1f}{peak / 2**20:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the fused DVS kernel')
+    parser.add_argument('--vdd', type=float, default=12.0,
+                        help='Panel voltage of the candidate')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Timed runs per case (best is reported)')
+    args = parser.parse_args()
+
+    main(args.vdd, args.repeat)
@@ -0,0 +1,163 @@
+"""
+Benchmark suite for the lab2 image-power hot paths.
+
+The functions the notebooks import from image_power are run on synthetic
+frames (720p, 1080p, 4K) and on the bundled test_images corpus; throughput (megapixels/s) and peak traced
+memory are printed and appended to `benchmarks/results.jsonl`, together
+with the git revision. Each run is compared with the previous one and
+slowdowns above `--tolerance` are flagged. A function the notebooks
+define inline again would no longer be the one measured here, so the
+suite warns about it before running.
+
+Run from lab2/:
+    python benchmarks/bench_image_power.py
+    python benchmarks/bench_image_power.py -k distortion --sizes 720p
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from harness import append_run, load_last_run, measure
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from image_corpus import load_images_from_folder  # noqa: E402
+from image_power import (apply_compensation, apply_contrast_brightness,  # noqa: E402
+                         apply_gamma, apply_hist_eq, apply_hungry_blue,
+                         compute_distortion, compute_panel_power,
+                         compute_pixel_current, compute_power, displayed_image,
+                         dvs_display)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.jsonl')
+TEST_IMAGES = os.path.join(BENCH_DIR, '..', 'test_images')
+NOTEBOOKS = os.path.join(BENCH_DIR, '..', 'lab2_*.ipynb')
+
+SIZES = {'720p': (720, 1280), '1080p': (1080, 1920), '4K': (2160, 3840)}
+VDD = 12.0
+
+
+def _modified(img):
+    # a fixed, realistic "after" image for the distortion benchmark
+    return apply_hungry_blue(img, 40)
+
+
+# name -> (setup(img) -> args, func(*args))
+CASES = {
+    'compute_power': (lambda img: (img,), compute_power),
+    'compute_distortion': (lambda img: (img, _modified(img)), compute_distortion),
+    'apply_hungry_blue': (lambda img: (img, 40), apply_hungry_blue),
+    'apply_contrast_brightness': (lambda img: (img, 0.7), apply_contrast_brightness),
+    'apply_hist_eq': (lambda img: (img, 0.4), apply_hist_eq),
+    'apply_gamma': (lambda img: (img, 1.6), apply_gamma),
+    'apply_compensation': (lambda img: (img, 15.0, VDD), apply_compensation),
+    'compute_pixel_current': (lambda img: (img, VDD), compute_pixel_current),
+    'compute_panel_power': (lambda img: (compute_pixel_current(img, VDD), VDD),
+                            compute_panel_power),
+    'displayed_image': (lambda img: (compute_pixel_current(img, VDD), VDD),
+                        displayed_image),
+    'dvs_display': (lambda img: (img, VDD, np.empty_like(img)), dvs_display),
+}
+
+
+def inline_definitions(pattern=NOTEBOOKS):
+    """(notebook, function) pairs of benchmarked functions a notebook defines itself."""
+    found = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding='utf-8') as f:
+            cells = json.load(f)['cells']
+        source = '\n'.join(''.join(c['source']) for c in cells if c['cell_type'] == 'code')
+        for name in CASES:
+            if re.search(rf'^def {name}\(', source, re.MULTILINE):
+                found.append((os.path.basename(path), name))
+    return found
+
+
+def synthetic_frame(h, w, seed=0):
+    """Smooth gradients plus noise: closer to a photo than uniform noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([x / w, y / h, (x + y) / (w + h)], axis=-1) * 200
+    noise = rng.normal(0, 20, (h, w, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def datasets(sizes, corpus_limit):
+    for name in sizes:
+        h, w = SIZES[name]
+        yield name, [synthetic_frame(h, w)]
+    if corpus_limit:
+        images = load_images_from_folder(TEST_IMAGES, limit=corpus_limit)
+        if images:
+            yield f'test_images[{len(images)}]', images
+
+
+def run_case(func, setup, images, repeat):
+    args = [setup(img) for img in images]
+    mpix = sum(img.shape[0] * img.shape[1] for img in images) / 1e6
+
+    def call():
+        for a in args:
+            func(*a)
+
+    t, peak = measure(call, repeat)
+    return {'time_s': t, 'mpix_per_s': mpix / t, 'peak_mb': peak / 2**20}
+
+
+def compare(case, previous, tolerance):
+    # throughput change (in %) against the same case of the previous run
+    if previous is None:
+        return ''
+    for old in previous['cases']:
+        if old['name'] == case['name'] and old['dataset'] == case['dataset']:
+            delta = (case['mpix_per_s'] / old['mpix_per_s'] - 1) * 100
+            flag = '  << REGRESSION' if delta < -tolerance else ''
+            return f'{delta:+9.1f}%{flag}'
+    return ''
+
+
+def main(selected, sizes, corpus_limit, repeat, tolerance, save):
+    for notebook, name in inline_definitions():
+        print(f'WARNING: {notebook} defines {name} itself; '
+              f'the notebook does not run the benchmarked code')
+    previous = load_last_run(RESULTS_FILE)
+    cases = []
+
+    print(f"{'function':<27}{'dataset':<18}{'MP/s':>10}{'peak (MB)':>12}{'vs last':>10}")
+    for dataset, images in datasets(sizes, corpus_limit):
+        for name, (setup, func) in CASES.items():
+            if selected and not any(k in name for k in selected):
+                continue
+            case = {'name': name, 'dataset': dataset,
+                    **run_case(func, setup, images, repeat)}
+            cases.append(case)
+            print(f"{name:<27}{dataset:<18}{case['mpix_per_s']:>10.1f}"
+                  f"{case['peak_mb']:>12.1f}{compare(case, previous, tolerance)}")
+
+    if save and cases:
+        append_run(RESULTS_FILE, cases)
+        print(f"\nResults appended to: {RESULTS_FILE}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark lab2 image-power functions')
+    parser.add_argument('-k', '--keyword', action='append', default=[],
+                        help='Only run functions whose name contains this (repeatable)')
+    parser.add_argument('--sizes', nargs='*', default=list(SIZES),
+                        choices=list(SIZES), help='Synthetic frame sizes')
+    parser.add_argument('--corpus-limit', type=int, default=50,
+                        help='Number of test_images to use (0 to skip)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Timed runs per case (best is reported)')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='Slowdown (%%) vs the last run flagged as regression')
+    parser.add_argument('--no-save', action='store_true',
+                        help='Do not append this run to results.jsonl')
+    args = parser.parse_args()
+
+    main(args.keyword, args.sizes, args.corpus_limit, args.repeat,
+         args.tolerance, not args.no_save)
@@ -0,0 +1,63 @@
+"""Timing / peak-memory helpers shared by the lab2 benchmarks."""
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+__all__ = ['measure', 'git_revision', 'append_run', 'load_last_run']
+
+
+def measure(func, repeat):
+    """Best wall time (s) of `repeat` runs and peak traced memory (bytes)."""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    # memory is traced on a separate run: tracemalloc slows numpy down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_last_run(results_file):
+    """Return the last run stored in a JSON-lines results file (or None)."""
+    if not os.path.exists(results_file):
+        return None
+    last = None
+    with open(results_file) as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def append_run(results_file, cases):
+    """Append one run (list of case dicts) with its metadata."""
+    run = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git': git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cases': cases,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+    with open(results_file, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+    return run
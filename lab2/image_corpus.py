@@ -0,0 +1,178 @@
+"""
+Streaming loader for the lab2 image corpora (test_images/, myscreen/, ...).
+
+Images are decoded in a thread pool, normalized to RGB uint8 and stored as
+.npy files in a cache folder, so the next session maps them from disk
+instead of decoding the JPEG/PNG again. Images are yielded lazily (one by
+one or in fixed-size batches): only the images in flight are held in RAM.
+"""
+import hashlib
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from emiot_tools import count, timed  # noqa: E402
+
+__all__ = [
+    'VALID_EXTENSIONS', 'DEFAULT_CACHE_DIR',
+    'list_images', 'decode_image', 'load_image',
+    'iter_images', 'iter_image_batches',
+    'load_images_from_folder',
+]
+
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+# Cache folder, relative to the notebook working directory
+DEFAULT_CACHE_DIR = '.image_cache'
+
+
+def list_images(folder_path, limit=None):
+    """Return the sorted paths of the images in `folder_path`."""
+    try:
+        filenames = sorted(os.listdir(folder_path))
+    except FileNotFoundError:
+        print(f"Error: folder '{folder_path}'")
+        return []
+
+    paths = [os.path.join(folder_path, name) for name in filenames
+             if name.lower().endswith(VALID_EXTENSIONS)]
+    if limit is not None:
+        paths = paths[:limit]
+    return paths
+
+
+@timed('image.decode')
+def decode_image(file_path):
+    """Decode an image file to an RGB uint8 array of shape (h, w, 3)."""
+    with Image.open(file_path) as img:
+        return np.asarray(img.convert('RGB'), dtype=np.uint8)
+
+
+def _cache_key(file_path, hash_content=False):
+    # mtime + size is enough to notice a re-exported screenshot; the content
+    # hash is slower but survives a `git checkout` that touches the mtime
+    st = os.stat(file_path)
+    h = hashlib.sha1(os.path.abspath(file_path).encode())
+    if hash_content:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    else:
+        h.update(f'{st.st_mtime_ns}:{st.st_size}'.encode())
+    return h.hexdigest()
+
+
+def load_image(file_path, cache_dir=DEFAULT_CACHE_DIR, hash_content=False):
+    """
+    Return the RGB uint8 array of `file_path`.
+
+    With a `cache_dir` the decoded array is saved as .npy on the first call
+    and returned as a read-only memory map afterwards. Pass
+    `cache_dir=None` to always decode.
+    """
+    if cache_dir is None:
+        return decode_image(file_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = _cache_key(file_path, hash_content)
+    cache_file = os.path.join(cache_dir, f'{key}.npy')
+
+    if not os.path.exists(cache_file):
+        count('image.cache_miss')
+        arr = decode_image(file_path)
+        # write to a temp name first so a killed run never leaves a
+        # truncated array behind
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_file, cache_file)
+
+    return np.load(cache_file, mmap_mode='r')
+
+
+def iter_images(folder_path, limit=None, cache_dir=DEFAULT_CACHE_DIR,
+                workers=None, prefetch=None, hash_content=False):
+    """
+    Yield `(filename, image)` pairs for the images in `folder_path`.
+
+    Images are decoded by `workers` threads (PIL releases the GIL while
+    decoding) and come out in sorted filename order. At most `prefetch`
+    images are in flight at the same time, so memory stays bounded no
+    matter how many files the folder holds. Unreadable files are reported
+    and skipped; they do not count towards `limit`, which caps the number
+    of images yielded.
+    """
+    paths = list_images(folder_path)
+    if workers is None:
+        workers = min(8, os.cpu_count() or 1)
+    if prefetch is None:
+        prefetch = 2 * workers
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        path_iter = iter(paths)
+
+        def submit_next():
+            path = next(path_iter, None)
+            if path is not None:
+                pending.append((path, pool.submit(load_image, path,
+                                                  cache_dir, hash_content)))
+
+        for _ in range(prefetch):
+            submit_next()
+
+        loaded = 0
+        try:
+            while pending and (limit is None or loaded < limit):
+                path, future = pending.popleft()
+                submit_next()
+                try:
+                    img = future.result()
+                except Exception as e:
+                    print(f"Failed to load image {os.path.basename(path)}: {e}")
+                    continue
+                loaded += 1
+                yield os.path.basename(path), img
+        finally:
+            # stop the prefetched loads that are no longer needed, also when
+            # the consumer stops early (break closes the generator)
+            for _, future in pending:
+                future.cancel()
+
+
+def iter_image_batches(folder_path, batch_size, **kwargs):
+    """
+    Yield lists of at most `batch_size` `(filename, image)` pairs.
+
+    Images of a folder can have different sizes, so a batch is a list and
+    not a stacked array. Keyword arguments are passed to `iter_images`.
+    """
+    batch = []
+    for item in iter_images(folder_path, **kwargs):
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_images_from_folder(folder_path, limit=50, cache_dir=DEFAULT_CACHE_DIR,
+                            **kwargs):
+    """
+    Load images from a folder into a list, as the notebooks expect.
+
+    Arrays are copied out of the cache memory map, so they are writable
+    like the ones the old PIL-only loader returned.
+    """
+    print(f"Loading images from {folder_path}...")
+    images_list = [np.array(img) for _, img in
+                   iter_images(folder_path, limit=limit, cache_dir=cache_dir,
+                               **kwargs)]
+    print(f"Loaded {len(images_list)} images successfully.")
+    return images_list
@@ -0,0 +1,487 @@
+"""
+OLED power and distortion models used by the lab2 notebooks.
+
+The first part holds the functions the notebooks import (power model,
+Lab distortion, DVS display model, image transformations), so the
+notebooks, the scripts and the benchmarks all run the same code.
+The second part adds a fast-estimate mode for parameter searches:
+candidates are scored on a stratified pixel sample with a confidence
+bound, and only the candidates that can still be the best one are
+evaluated exactly at full resolution.
+"""
+import os
+import sys
+from typing import Tuple
+
+import numpy as np
+from skimage import color, exposure
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+from emiot_tools import stage, timed  # noqa: E402
+
+__all__ = [
+    'compute_power', 'estimate_power_part1', 'pixel_power',
+    'compute_distortion', 'pixel_distortion', 'MAX_LAB_DIST',
+    'compute_pixel_current', 'compute_panel_power', 'displayed_image',
+    'apply_hungry_blue', 'apply_contrast_brightness', 'apply_hist_eq',
+    'apply_gamma', 'apply_compensation',
+    'dvs_luts', 'dvs_display', 'dvs_candidate', 'dvs_base_power',
+    'find_best_saving_under_limit',
+    'stratified_sample', 'take_sample',
+    'estimate_power', 'estimate_distortion', 'search_under_limit',
+]
+
+# ==========================================
+# 1. Power model (part 1)
+# ==========================================
+GAMMA = 0.7755
+W0 = 1.48169521e-6
+W_RGB = (2.13636845e-7, 1.77746705e-7, 2.14348309e-7)
+
+
+def pixel_power(image):
+    """Per-pixel power of an RGB image (without the constant term `w0`)."""
+    img = image.astype(np.float64)
+    w_r, w_g, w_b = W_RGB
+
+    r_pow = w_r * np.power(img[..., 0], GAMMA)
+    g_pow = w_g * np.power(img[..., 1], GAMMA)
+    b_pow = w_b * np.power(img[..., 2], GAMMA)
+
+    return r_pow + g_pow + b_pow
+
+
+@timed('image.power')
+def compute_power(image):
+    return W0 + np.sum(pixel_power(image))
+
+
+def estimate_power_part1(img):
+    return compute_power(img)
+
+
+# ==========================================
+# 2. Distortion in the Lab space
+# ==========================================
+MAX_LAB_DIST = np.sqrt(100**2 + 255**2 + 255**2)
+
+
+def pixel_distortion(original_img, modified_img):
+    """Per-pixel Euclidean distance in the Lab space."""
+    with stage('image.rgb2lab'):
+        lab_orig = color.rgb2lab(original_img)
+        lab_mod = color.rgb2lab(modified_img)
+
+    diff = lab_orig - lab_mod
+    return np.sqrt(np.sum(np.square(diff), axis=-1))
+
+
+@timed('image.distortion')
+def compute_distortion(original_img, modified_img):
+    if original_img.shape != modified_img.shape:
+        original_img = original_img[:, :, :3]
+        modified_img = modified_img[:, :, :3]
+
+    total_error = np.sum(pixel_distortion(original_img, modified_img))
+
+    h, w, _ = original_img.shape
+    return (total_error / (h * w * MAX_LAB_DIST)) * 100
+
+
+# ==========================================
+# 3. OLED panel with DVS (part 2)
+# ==========================================
+def compute_pixel_current(image: np.ndarray, vdd: float,
+                          p1: float = 4.251e-5,
+                          p2: float = -3.029e-4,
+                          p3: float = 3.024e-5) -> np.ndarray:
+    # : (p1 * Vdd * D) / 255 + (p2 * D) / 255 + p3
+    D_rgb = image.astype(np.float32)
+
+    term1 = (p1 * vdd * D_rgb) / 255.0
+    term2 = (p2 * D_rgb) / 255.0
+    term3 = p3
+
+    i_cell = term1 + term2 + term3
+
+    return i_cell
+
+
+def compute_panel_power(i_cell: np.ndarray, vdd: float) -> float:
+    total_current = np.sum(i_cell)
+
+    # P = V * I
+    power = vdd * total_current
+
+    return power
+
+
+#professor provides
+def displayed_image(
+        i_cell: np.ndarray,
+        vdd: float,
+        p1: float = 4.251e-5,
+        p2: float = -3.029e-4,
+        p3: float = 3.024e-5,
+        orig_vdd: float = 15,
+        ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Display an image on the OLED display taking into account the effect of DVS.
+
+    :param i_cell: An array of the currents drawn by each pixel of the display.
+    :param vdd: The new voltage of the display.
+    """
+    i_cell_max = (p1 * vdd * 1) + (p2 * 1) + p3
+    image_rgb_max = (i_cell_max - p3) / (p1 * orig_vdd + p2) * 255
+    out = np.round((i_cell - p3) / (p1 * orig_vdd + p2) * 255)
+    original_image = out.copy()
+
+    # Clip the values exceeding `i_cell_max` to `image_rgb_max`
+    out[i_cell > i_cell_max] = image_rgb_max
+
+    return original_image.astype(np.uint8), out.astype(np.uint8)
+
+
+# ==========================================
+# 4. Image transformations
+# ==========================================
+def apply_hungry_blue(img, k):
+    img_mod = img.astype(np.int16) #default uint8[0,255] underflow
+    img_mod[..., 2] = img_mod[..., 2] - k
+    img_mod = np.clip(img_mod, 0, 255)
+    return img_mod.astype(np.uint8)
+
+
+def apply_contrast_brightness(img, scale_v):
+    # Convert to HSV (skimage returns 0-1 float)
+    hsv = color.rgb2hsv(img)
+    hsv[..., 2] = hsv[..., 2] * scale_v # adjust V channel
+    hsv[..., 2] = np.clip(hsv[..., 2], 0, 1) # clip to 0-1
+    # Convert back to RGB and scale to 0-255
+    return (color.hsv2rgb(hsv) * 255).astype(np.uint8)
+
+
+def apply_hist_eq(img, alpha):
+    """Blend the image with its V-channel histogram equalization."""
+    hsv = color.rgb2hsv(img)
+    hsv[..., 2] = exposure.equalize_hist(hsv[..., 2])
+    img_eq = (color.hsv2rgb(hsv) * 255).astype(np.uint8)
+    img_mixed = (img.astype(float) * (1 - alpha) + img_eq.astype(float) * alpha)
+    return np.clip(img_mixed, 0, 255).astype(np.uint8)
+
+
+def apply_gamma(img, gamma):
+    hsv = color.rgb2hsv(img)
+    hsv[..., 2] = exposure.adjust_gamma(hsv[..., 2], gamma=gamma)
+    return (color.hsv2rgb(hsv) * 255).astype(np.uint8)
+
+
+def apply_compensation(image, vdd_orig, vdd_new, method='both', off_coeff=0.2, fac_coeff=0.5):
+    img_hsv = color.rgb2hsv(image)
+    v_channel = img_hsv[..., 2]
+
+    voltage_ratio = (vdd_orig - vdd_new) / vdd_orig
+    b_offset = voltage_ratio * off_coeff
+    b_factor = 1 + (voltage_ratio * fac_coeff)
+
+    if method == 'brightness':
+        v_channel = v_channel + b_offset
+    elif method == 'contrast':
+        v_channel = v_channel * b_factor
+    elif method == 'both':
+        v_channel = (v_channel * b_factor) + b_offset
+
+    img_hsv[..., 2] = np.clip(v_channel, 0, 1)
+    img_comp = (color.hsv2rgb(img_hsv) * 255).astype(np.uint8)
+
+    return img_comp, b_offset, b_factor
+
+
+# sub-pixels processed per step by `dvs_display`
+_DVS_CHUNK = 1 << 18
+
+
+def dvs_luts(vdd, p1=4.251e-5, p2=-3.029e-4, p3=3.024e-5, orig_vdd=15):
+    """
+    Tabulate the DVS chain for the 256 possible sub-pixel values.
+
+    `compute_pixel_current` and `displayed_image` work on each sub-pixel
+    on its own, so running them on `arange(256)` gives, bit for bit, what
+    they give on a whole image. Returns the current (float32), displayed
+    value (uint8) and saturation flag (bool) of each value.
+    """
+    levels = np.arange(256, dtype=np.uint8)
+    i_lut = compute_pixel_current(levels, vdd, p1, p2, p3)
+    _, disp_lut = displayed_image(i_lut, vdd, p1, p2, p3, orig_vdd)
+    i_cell_max = (p1 * vdd * 1) + (p2 * 1) + p3
+    return i_lut, disp_lut, i_lut > i_cell_max
+
+
+@timed('image.dvs')
+def dvs_display(img_comp, vdd, out=None, p1=4.251e-5, p2=-3.029e-4,
+                p3=3.024e-5, orig_vdd=15):
+    """
+    Fused `compute_pixel_current` -> `compute_panel_power` -> `displayed_image`.
+
+    Returns `(displayed, power, saturation)`: the displayed uint8 image
+    (written into `out` if given, a C-contiguous uint8 buffer of the image
+    shape, so a search loop can reuse one buffer),
+    the panel power and the fraction of sub-pixels clipped by DVS.
+
+    The image is read twice (one histogram, one table lookup) and no
+    float temporary of the image size is created; the chain it replaces
+    allocates about ten. The displayed image is identical to the chain's;
+    the power is accumulated in float64 instead of float32, so it differs
+    from `compute_panel_power` only in the last float32 digits.
+    """
+    img_comp = np.ascontiguousarray(img_comp, dtype=np.uint8)
+    i_lut, disp_lut, sat_lut = dvs_luts(vdd, p1, p2, p3, orig_vdd)
+
+    if out is None:
+        out = np.empty_like(img_comp)
+    elif out.shape != img_comp.shape or out.dtype != np.uint8:
+        raise ValueError(f'out must be a uint8 array of shape {img_comp.shape}')
+    elif not out.flags.c_contiguous:
+        # reshape would copy it and the result would never reach `out`
+        raise ValueError('out must be C-contiguous')
+    src, dst = img_comp.reshape(-1), out.reshape(-1)
+
+    # bincount/take cast the uint8 indices to intp, so go through the image
+    # in chunks to keep that copy small
+    hist = np.zeros(256, dtype=np.int64)
+    for start in range(0, src.size, _DVS_CHUNK):
+        chunk = src[start:start + _DVS_CHUNK]
+        hist += np.bincount(chunk, minlength=256)
+        np.take(disp_lut, chunk, out=dst[start:start + _DVS_CHUNK])
+
+    power = vdd * float(hist @ i_lut.astype(np.float64))
+    saturation = hist[sat_lut].sum() / img_comp.size
+    return out, power, saturation
+
+
+def dvs_candidate(img, param, vdd_orig=15.0):
+    """
+    Run the part 2 chain for `param = (vdd, method, off_coeff, fac_coeff)`.
+
+    Returns the displayed image and the per-pixel panel power, since with
+    DVS the power depends on the compensated image, not on what is shown.
+    """
+    vdd, method, oc, fc = param
+    img_comp, _, _ = apply_compensation(img, vdd_orig, vdd, method=method,
+                                        off_coeff=oc, fac_coeff=fc)
+    i_lut, disp_lut, _ = dvs_luts(vdd, orig_vdd=vdd_orig)
+    pixel_i = np.take(i_lut.astype(np.float64), img_comp).sum(axis=-1)
+    return np.take(disp_lut, img_comp), vdd * pixel_i
+
+
+def dvs_base_power(img, vdd_orig=15.0):
+    """Per-pixel panel power of the uncompensated image at `vdd_orig`."""
+    i_lut, _, _ = dvs_luts(vdd_orig, orig_vdd=vdd_orig)
+    return vdd_orig * np.take(i_lut.astype(np.float64), img).sum(axis=-1)
+
+
+# ==========================================
+# 5. Exact parameter search
+# ==========================================
+def find_best_saving_under_limit(img_list, transform_func, params, strategy_name, dist_limit=3.0):
+    best_saving = 0
+    best_param = None
+    best_dist = 0
+
+    print(f"Scanning all parameters for {strategy_name}...")
+    for p in params:
+        savings = []
+        dists = []
+        for img in img_list:
+            p_orig = estimate_power_part1(img)
+            img_new = transform_func(img, p)
+            p_new = estimate_power_part1(img_new)
+
+            saving = (p_orig - p_new) / p_orig * 100 if p_orig > 0 else 0
+            dist = compute_distortion(img, img_new)
+
+            savings.append(saving)
+            dists.append(dist)
+
+        avg_saving = np.mean(savings)
+        avg_dist = np.mean(dists)
+
+        # Core logic: distortion must be strictly below limit (3.0%)
+        if avg_dist < dist_limit:
+            # Among valid parameters, find the one with max saving
+            if avg_saving > best_saving:
+                best_saving = avg_saving
+                best_param = p
+                best_dist = avg_dist
+
+    print(f"  -> Best param: {best_param}, distortion: {best_dist:.2f}%, saving: {best_saving:.2f}%")
+    return best_saving, best_param, best_dist
+
+
+# ==========================================
+# 6. Fast-estimate mode
+# ==========================================
+def stratified_sample(shape, ratio, seed=0):
+    """
+    Pick about `ratio * h * w` pixel positions, one per square tile.
+
+    The image is cut in `s x s` tiles with `s = round(1/sqrt(ratio))` and
+    one random pixel is drawn in each tile, so every region of the image
+    is represented (unlike a plain random sample). Returns `(rows, cols)`.
+    """
+    h, w = shape[:2]
+    s = max(1, int(round(1 / np.sqrt(ratio))))
+    rng = np.random.default_rng(seed)
+
+    tile_r, tile_c = np.meshgrid(np.arange(0, h, s), np.arange(0, w, s),
+                                 indexing='ij')
+    tile_r, tile_c = tile_r.ravel(), tile_c.ravel()
+    # tiles on the last row/column can be smaller than s x s
+    rows = tile_r + (rng.random(tile_r.size) * np.minimum(s, h - tile_r)).astype(int)
+    cols = tile_c + (rng.random(tile_c.size) * np.minimum(s, w - tile_c)).astype(int)
+    return rows, cols
+
+
+def take_sample(image, sample):
+    """Gather sampled pixels as a `(1, n, 3)` strip that behaves like an image."""
+    rows, cols = sample
+    return image[rows, cols][np.newaxis]
+
+
+def _scaled_sum(values, n_total):
+    # Estimate of the full-image sum and its standard error
+    n = values.size
+    est = values.mean() * n_total
+    err = values.std(ddof=1) / np.sqrt(n) * n_total if n > 1 else np.inf
+    return est, err
+
+
+def estimate_power(image, ratio=0.05, seed=0):
+    """Sampled `compute_power`: returns `(estimate, standard_error)`."""
+    sample = stratified_sample(image.shape, ratio, seed)
+    est, err = _scaled_sum(pixel_power(take_sample(image, sample)),
+                           image.shape[0] * image.shape[1])
+    return W0 + est, err
+
+
+def estimate_distortion(original_img, modified_img, ratio=0.05, seed=0):
+    """Sampled `compute_distortion`: returns `(estimate, standard_error)` in %."""
+    sample = stratified_sample(original_img.shape, ratio, seed)
+    d = pixel_distortion(take_sample(original_img[..., :3], sample),
+                         take_sample(modified_img[..., :3], sample))
+    scale = 100 / MAX_LAB_DIST
+    return d.mean() * scale, d.std(ddof=1) / np.sqrt(d.size) * scale
+
+
+def _candidate_metrics(img, transform_func, p, base_power, power_func):
+    # Saving (%) and distortion (%) of one candidate, plus the per-pixel
+    # terms the estimate is built on
+    out = transform_func(img, p)
+    if isinstance(out, tuple):
+        img_new, new_power = out
+    else:
+        img_new, new_power = out, power_func(out)
+    saving_px = (base_power - new_power) / base_power.sum() * 100
+    dist_px = pixel_distortion(img, img_new) / MAX_LAB_DIST * 100
+    return saving_px, dist_px
+
+
+def _evaluate(img_list, transform_func, p, base_power_func, power_func,
+              samples=None):
+    # Average saving/distortion over the images. With `samples` the per-image
+    # values come from the sampled pixels and an error is also returned.
+    savings, dists, s_err2, d_err2 = [], [], 0.0, 0.0
+    for i, img in enumerate(img_list):
+        img = img[..., :3]
+        if samples is not None:
+            img = take_sample(img, samples[i])
+        base_power = base_power_func(img)
+        saving_px, dist_px = _candidate_metrics(img, transform_func, p,
+                                                base_power, power_func)
+        # saving_px sums to the image saving (the constant w0 of
+        # compute_power is left out, it is ~1e-6 of an image's power)
+        savings.append(saving_px.sum())
+        dists.append(dist_px.mean())
+        if samples is not None:
+            n = dist_px.size
+            s_err2 += saving_px.var(ddof=1) * n if n > 1 else np.inf
+            d_err2 += dist_px.var(ddof=1) / n if n > 1 else np.inf
+    n_img = len(img_list)
+    return (np.mean(savings), np.mean(dists),
+            np.sqrt(s_err2) / n_img, np.sqrt(d_err2) / n_img)
+
+
+def search_under_limit(img_list, transform_func, params, dist_limit=3.0,
+                       ratio=0.05, z=3.0, max_promoted=None, seed=0,
+                       strict=True, power_func=None, base_power_func=None,
+                       verbose=True):
+    """
+    Find the parameter with the best average saving under `dist_limit`.
+
+    Same question as `find_best_saving_under_limit`, answered in two steps:
+
+    1. every parameter is scored on a stratified sample of about `ratio`
+       of the pixels of each image (same positions for all parameters, so
+       candidates are compared on paired data); the error bound of each
+       estimate is `z` standard errors;
+    2. the parameters that can still win -- distortion lower bound under
+       the limit and saving upper bound above the best guaranteed saving --
+       are promoted and evaluated exactly on the full images. At most
+       `max_promoted` of them are kept (by estimated saving) if given.
+
+    `transform_func(img, p)` returns the new image, or `(image,
+    pixel_power)` when the power of the candidate is not the power of the
+    returned image (see `dvs_candidate`). `power_func` / `base_power_func`
+    give the per-pixel power of a transformed / original image and default
+    to `pixel_power`. Use `strict=False` for a `<=` limit.
+
+    Returns a dict with the exact `best_saving`, `best_param`, `best_dist`
+    and the per-parameter `table` of estimates and exact values.
+    """
+    if power_func is None:
+        power_func = pixel_power
+    if base_power_func is None:
+        base_power_func = power_func
+    params = list(params)
+
+    def under(d):
+        return d < dist_limit if strict else d <= dist_limit
+
+    # 1. Estimates on the stratified samples
+    samples = [stratified_sample(img.shape, ratio, seed + i)
+               for i, img in enumerate(img_list)]
+    table = []
+    for p in params:
+        saving, dist, s_err, d_err = _evaluate(img_list, transform_func, p,
+                                               base_power_func, power_func,
+                                               samples)
+        table.append({'param': p, 'saving': saving, 'saving_err': z * s_err,
+                      'dist': dist, 'dist_err': z * d_err, 'promoted': False,
+                      'exact_saving': None, 'exact_dist': None})
+
+    # 2. Prune with the error bounds, then evaluate the survivors exactly
+    sure = [r['saving'] - r['saving_err'] for r in table
+            if under(r['dist'] + r['dist_err'])]
+    floor = max(sure, default=-np.inf)
+    promoted = [r for r in table
+                if under(r['dist'] - r['dist_err'])
+                and r['saving'] + r['saving_err'] >= floor]
+    promoted.sort(key=lambda r: r['saving'], reverse=True)
+    if max_promoted is not None:
+        promoted = promoted[:max_promoted]
+
+    best = {'best_saving': 0, 'best_param': None, 'best_dist': 0}
+    for r in promoted:
+        saving, dist, _, _ = _evaluate(img_list, transform_func, r['param'],
+                                       base_power_func, power_func)
+        r.update(promoted=True, exact_saving=saving, exact_dist=dist)
+        if under(dist) and saving > best['best_saving']:
+            best = {'best_saving': saving, 'best_param': r['param'],
+                    'best_dist': dist}
+
+    if verbose:
+        print(f"  -> {len(promoted)}/{len(params)} candidates promoted to exact evaluation")
+        print(f"  -> Best param: {best['best_param']}, distortion: "
+              f"{best['best_dist']:.2f}%, saving: {best['best_saving']:.2f}%")
+    best['table'] = table
+    return best
@@ -0,0 +1,142 @@
+"""
+Pareto front of (power saving, distortion) results.
+
+Any strategy (hungry blue, brightness scaling, histogram equalization,
+gamma, DVS) can add its results; the front keeps only the non-dominated
+points, sorted by distortion, so "best saving under a distortion budget"
+is a binary search and fronts of different strategies merge in linear
+time.
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from heapq import merge as _heap_merge
+
+import numpy as np
+
+__all__ = ['ParetoPoint', 'ParetoFront', 'merge_fronts']
+
+# `info` is free: strategy name, parameter, image index, ... (None if omitted)
+ParetoPoint = namedtuple('ParetoPoint', ['saving', 'dist', 'info'], defaults=(None,))
+
+
+class ParetoFront:
+    """
+    Non-dominated (saving, distortion) points: more saving and less
+    distortion are better.
+
+    Along the front distortion and saving are both strictly increasing,
+    which is what makes budget queries a bisection.
+    """
+
+    def __init__(self, points=()):
+        self._dist = []
+        self._saving = []
+        self._info = []
+        # a list, tuple, generator or (n, 2|3) array of (saving, dist[, info])
+        points = list(points)
+        if points:
+            self._sweep(sorted(self._as_points(points),
+                               key=lambda p: (p.dist, -p.saving)))
+
+    @staticmethod
+    def _as_points(points):
+        for p in points:
+            yield p if isinstance(p, ParetoPoint) else ParetoPoint(*p)
+
+    def _sweep(self, sorted_points):
+        # points sorted by (dist asc, saving desc): a point is on the front
+        # iff its saving beats every point before it -> O(n) after the sort
+        for p in sorted_points:
+            if not self._saving or p.saving > self._saving[-1]:
+                self._dist.append(p.dist)
+                self._saving.append(p.saving)
+                self._info.append(p.info)
+
+    @classmethod
+    def from_records(cls, records, saving_key, dist_key, info=None):
+        """
+        Build a front from dict-like records (list of dicts, DataFrame rows).
+
+        `info` is a constant attached to every point (e.g. the strategy
+        name) or a callable `info(record)`.
+        """
+        if hasattr(records, 'to_dict'):
+            records = records.to_dict('records')
+        return cls(ParetoPoint(r[saving_key], r[dist_key],
+                               info(r) if callable(info) else info)
+                   for r in records)
+
+    def add(self, saving, dist, info=None):
+        """Insert a point; returns False if it is dominated (and dropped)."""
+        i = bisect_left(self._dist, dist)
+        # dominated by the closest point with less (or equal) distortion
+        if i > 0 and self._saving[i - 1] >= saving:
+            return False
+        if i < len(self._dist) and self._dist[i] == dist and self._saving[i] >= saving:
+            return False
+        # the points it dominates follow it contiguously
+        j = i
+        while j < len(self._saving) and self._saving[j] <= saving:
+            j += 1
+        self._dist[i:j] = [dist]
+        self._saving[i:j] = [saving]
+        self._info[i:j] = [info]
+        return True
+
+    def update(self, points):
+        """Insert many points; returns the number that entered the front."""
+        return sum(self.add(*p) for p in self._as_points(points))
+
+    def best_under(self, budget, strict=True):
+        """
+        Point with the highest saving and distortion `< budget`
+        (`<= budget` with `strict=False`), or None.
+        """
+        find = bisect_left if strict else bisect_right
+        i = find(self._dist, budget)
+        if i == 0:
+            return None
+        return ParetoPoint(self._saving[i - 1], self._dist[i - 1], self._info[i - 1])
+
+    def best_savings(self, budgets, strict=True):
+        """Vectorized `best_under`: best saving for each budget (NaN if none)."""
+        side = 'left' if strict else 'right'
+        idx = np.searchsorted(self._dist, np.asarray(budgets, dtype=float), side=side)
+        saving = np.asarray(self._saving + [np.nan], dtype=float)
+        # index -1 (no feasible point) maps to the NaN sentinel
+        return saving[np.where(idx > 0, idx - 1, -1)]
+
+    def dominates(self, saving, dist):
+        """True if some point of the front is at least as good on both axes."""
+        best = self.best_under(dist, strict=False)
+        return best is not None and best.saving >= saving
+
+    def __len__(self):
+        return len(self._dist)
+
+    def __iter__(self):
+        return (ParetoPoint(s, d, i)
+                for s, d, i in zip(self._saving, self._dist, self._info))
+
+    def __repr__(self):
+        return f'ParetoFront({len(self)} points)'
+
+    @property
+    def savings(self):
+        return np.asarray(self._saving, dtype=float)
+
+    @property
+    def dists(self):
+        return np.asarray(self._dist, dtype=float)
+
+
+def merge_fronts(*fronts):
+    """
+    Merge fronts (e.g. one per strategy) into the combined front.
+
+    The inputs are already sorted by distortion, so this is a k-way merge
+    plus one sweep, linear in the total number of points.
+    """
+    merged = ParetoFront()
+    merged._sweep(_heap_merge(*fronts, key=lambda p: (p.dist, -p.saving)))
+    return merged
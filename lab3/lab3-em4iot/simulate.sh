@@ -1,18 +1,40 @@
 #!/bin/bash
 
+# EMIOT_PERF=<file>: time each step into the per-stage report (tools/emiot_perf.py)
+PERF="$(cd "$(dirname "$0")/../.." && pwd)/tools/emiot_perf.py"
+step() {
+    if [ -n "$EMIOT_PERF" ]; then
+        python "$PERF" run "$1" -- "${@:2}"
+    else
+        "${@:2}"
+    fi
+}
+if [ -n "$EMIOT_PERF" ]; then
+    export EMIOT_PERF_RUN=${EMIOT_PERF_RUN:-sim$$}
+fi
+
 cd simulator
 
 # Python codegen
 cd codegen
 sim_setup_path=$1
-python codegen.py -f ../../${sim_setup_path}
+step simulate.codegen python codegen.py -f ../../${sim_setup_path} "${@:2}"
 cd ..
 
 # Compile
-make clean
-make
+step simulate.clean make clean
+step simulate.compile make
 
-# launch the simulation
-./bin/run.x
+# launch the simulation (WATCH=1: analyse the trace live; survival is not
+# a default stop, since the full run is what gives the lifetime)
+if [ -n "$WATCH" ]; then
+    step simulate.run python ../../scripts/trace_watch.py sim_trace.txt --stop-on death --run ./bin/run.x
+else
+    step simulate.run ./bin/run.x
+fi
 
 cd ..
+
+if [ -n "$EMIOT_PERF" ] && [ "$EMIOT_PERF" != "-" ]; then
+    python "$PERF" report "$EMIOT_PERF" --run "$EMIOT_PERF_RUN"
+fi
@@ -1,15 +1,25 @@
 import argparse
+import os
+import sys
 from pathlib import Path
 
 import json
 
 import codegen_func
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', '..', '..', 'tools'))
+from emiot_tools import stage  # noqa: E402
 
-def main(input_file, template_dir, output_dir):
+
+def main(input_file, template_dir, output_dir, trace_format='tabular',
+         traced=None, decimation=1, precision='float'):
     # Load input settings file
     with open(input_file, "r") as f:
         settings = json.load(f)
+    # checked before anything is written, for the tabular trace too
+    traced = codegen_func.check_trace_signals(settings, traced)
+    decimation = codegen_func.check_trace_decimation(decimation)
 
     header_dir = output_dir / 'inc'
     header_dir.mkdir(parents=True, exist_ok=True)
@@ -17,30 +27,49 @@ def main(input_file, template_dir, output_dir):
     src_dir.mkdir(parents=True, exist_ok=True)
 
     # Generate `config.h` file
-    codegen_func.config_gen(settings, template_dir, header_dir)
+    with stage('codegen.config'):
+        codegen_func.config_gen(settings, template_dir, header_dir)
 
     # Generate `X_sensor.h` file
-    codegen_func.sensor_h_gen(settings, template_dir, header_dir)
+    with stage('codegen.sensor_h'):
+        codegen_func.sensor_h_gen(settings, template_dir, header_dir)
     # Generate `X_sensor.cpp` file
-    codegen_func.sensor_cpp_gen(settings, template_dir, src_dir)
+    with stage('codegen.sensor_cpp'):
+        codegen_func.sensor_cpp_gen(settings, template_dir, src_dir)
     # Generate `X_converter_sensor.h` file
     # codegen_func.conv_sensor_h_gen(settings, template_dir, header_dir)
     # Generate `X_converter_sensor.cpp` file
     # codegen_func.conv_sensor_cpp_gen(settings, template_dir, src_dir)
 
     # Generate `mcu.cpp` file
-    codegen_func.mcu_cpp_gen(settings, template_dir, src_dir)
+    with stage('codegen.mcu_cpp'):
+        codegen_func.mcu_cpp_gen(settings, template_dir, src_dir)
 
     # Generate `rf.cpp` file
-    codegen_func.rf_cpp_gen(settings, template_dir, src_dir)
+    with stage('codegen.rf_cpp'):
+        codegen_func.rf_cpp_gen(settings, template_dir, src_dir)
 
     # Generate `bus.h` file
-    codegen_func.bus_h_gen(settings, template_dir, header_dir)
+    with stage('codegen.bus_h'):
+        codegen_func.bus_h_gen(settings, template_dir, header_dir)
     # Generate `bus.cpp` file
-    codegen_func.bus_cpp_gen(settings, template_dir, src_dir)
+    with stage('codegen.bus_cpp'):
+        codegen_func.bus_cpp_gen(settings, template_dir, src_dir)
+
+    # Generate `trace_recorder.h/.cpp` files (binary trace only)
+    if trace_format == 'binary':
+        with stage('codegen.trace_recorder'):
+            codegen_func.trace_recorder_gen(settings, template_dir, header_dir,
+                                            src_dir, traced, decimation, precision)
+    else:
+        # a recorder left by a previous binary build would still be compiled
+        (header_dir / 'trace_recorder.h').unlink(missing_ok=True)
+        (src_dir / 'trace_recorder.cpp').unlink(missing_ok=True)
 
     # Generate `main.cpp` file
-    codegen_func.main_cpp_gen(settings, template_dir, src_dir)
+    with stage('codegen.main_cpp'):
+        codegen_func.main_cpp_gen(settings, template_dir, src_dir, trace_format,
+                                  traced)
 
 
 if __name__ == '__main__':
@@ -53,10 +82,26 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--output-dir', type=str, metavar='PATH',
                         default='..',
                         help='Path where code will be generated')
+    parser.add_argument('--trace-format', choices=codegen_func.TRACE_FORMATS,
+                        default='tabular',
+                        help='tabular: sim_trace.txt (SystemC-AMS); '
+                             'binary: change-only sim_trace.bin')
+    parser.add_argument('--trace-signals', nargs='+', metavar='SIGNAL',
+                        help='Signals to trace (default: all)')
+    parser.add_argument('--trace-decimation', type=int, default=1,
+                        help='Binary trace: keep one sample every N steps')
+    parser.add_argument('--trace-precision', choices=list(codegen_func.TRACE_VALUE_TYPES),
+                        default='float',
+                        help='Binary trace value type')
     args = parser.parse_args()
 
     input_file = Path(args.input_file)
     template_dir = Path(args.template_dir)
     output_dir = Path(args.output_dir)
 
-    main(input_file, template_dir, output_dir)
+    try:
+        with stage('codegen'):
+            main(input_file, template_dir, output_dir, args.trace_format,
+                 args.trace_signals, args.trace_decimation, args.trace_precision)
+    except ValueError as e:
+        parser.error(str(e))
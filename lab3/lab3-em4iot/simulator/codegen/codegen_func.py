@@ -9,8 +9,14 @@ __all__ = [
     'mcu_cpp_gen',
     'rf_cpp_gen',
     'sensor_h_gen', 'sensor_cpp_gen',
+    'trace_signals', 'check_trace_signals', 'check_trace_decimation', 'trace_recorder_gen',
+    'TRACE_FORMATS', 'TRACE_VALUE_TYPES',
 ]
 
+TRACE_FORMATS = ('tabular', 'binary')
+# binary trace value type; float keeps the ~6 digits of the tabular trace
+TRACE_VALUE_TYPES = {'float': 'float', 'double': 'double'}
+
 
 def bus_h_gen(settings, template_dir, output_dir):
     with open(template_dir / 'h' / 'bus_h.txt') as temp:
@@ -123,7 +129,8 @@ def conv_sensor_cpp_gen(settings, template_dir, output_dir):
                 f.write(template.render(sensor_id=sensor_id))
 
 
-def main_cpp_gen(settings, template_dir, output_dir):
+def main_cpp_gen(settings, template_dir, output_dir, trace_format='tabular',
+                 traced=None):
     with open(template_dir / 'cpp' / 'main_cpp.txt') as temp:
         template = Template(temp.read())
         with open(output_dir / 'main.cpp', 'w') as f:
@@ -131,7 +138,10 @@ def main_cpp_gen(settings, template_dir, output_dir):
             sensor_names = []
             for sensor in active_sensors:
                 sensor_names.append(sensor['name'])
-            f.write(template.render(active_sensors=sensor_names))
+            traced = check_trace_signals(settings, traced)
+            f.write(template.render(active_sensors=sensor_names,
+                                    trace_format=trace_format,
+                                    trace_signals=traced))
 
 
 def makefile_gen(settings, template_dir, output_dir):
@@ -181,3 +191,46 @@ def sensor_cpp_gen(settings, template_dir, output_dir):
             sensor_name = sensor['name']
             with open(output_dir / f'{sensor_name}.cpp', 'w') as f:
                 f.write(template.render(sensor_name=sensor_name))
+
+
+def trace_signals(settings):
+    # all the signals of main.cpp, in the order of the tabular trace
+    signals = ['soc', 'i_tot', 'i_mcu', 'i_rf', 'i_pv', 'v_pv', 'real_i_pv',
+               'i_batt', 'v_batt']
+    for sensor in settings['sensors']:
+        signals.append(f"i_{sensor['name']}")
+    return signals
+
+
+def check_trace_signals(settings, traced=None):
+    # selected signals (all if None), for both trace formats
+    if traced is None:
+        return trace_signals(settings)
+    unknown = set(traced) - set(trace_signals(settings))
+    if unknown:
+        raise ValueError(f'unknown trace signals: {sorted(unknown)}')
+    return list(traced)
+
+
+def check_trace_decimation(decimation):
+    # the recorder keeps the steps with cnt % decimation == 0 (uint32_t)
+    if int(decimation) < 1:
+        raise ValueError(f'trace decimation must be >= 1, got {decimation}')
+    return int(decimation)
+
+
+def trace_recorder_gen(settings, template_dir, header_dir, src_dir, traced=None,
+                       decimation=1, precision='float',
+                       trace_file='sim_trace.bin'):
+    traced = check_trace_signals(settings, traced)
+    params = dict(signals=traced, decimation=check_trace_decimation(decimation),
+                  value_type=TRACE_VALUE_TYPES[precision],
+                  trace_file=trace_file)
+    with open(template_dir / 'h' / 'trace_recorder_h.txt') as temp:
+        template = Template(temp.read())
+        with open(header_dir / 'trace_recorder.h', 'w') as f:
+            f.write(template.render(**params))
+    with open(template_dir / 'cpp' / 'trace_recorder_cpp.txt') as temp:
+        template = Template(temp.read())
+        with open(src_dir / 'trace_recorder.cpp', 'w') as f:
+            f.write(template.render(**params))
@@ -0,0 +1,361 @@
+"""
+NumPy surrogate of the lab3 SystemC-AMS harvesting simulator.
+
+Same chain as the C++ modules: pv_panel -> converter_pv -> bus <- loads,
+bus -> converter_battery -> battery (battery_voc + battery_char), with the
+LUTs read from the simulator headers (config_pv.h, config_converter_*.h),
+the load timings from the sim_setting JSON and the irradiance from
+input_files/gmonths.txt. The TDF delays are kept: i_batt, soc and r_s
+are one step late, exactly like in the simulator trace.
+
+Instead of stepping second by second, each chunk of time steps (one day
+by default) is solved on whole arrays: the only feedback loop is the
+battery voltage, which changes very slowly with SOC, so a few fixed-point
+sweeps over the chunk converge to float precision.
+
+Usage (from lab3/scripts/):
+    python harvest_surrogate.py -f ../lab3-em4iot/sim_setting/parallel.json
+    python harvest_surrogate.py -f ... --n-pv 4 --n-batt 2
+    python harvest_surrogate.py -f ... --validate ../sim_trace.txt
+"""
+import argparse
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+
+__all__ = [
+    'SIM_DIR', 'DEATH_SOC', 'C_NOM_SINGLE',
+    'load_settings', 'load_luts', 'lut_get_val', 'load_irradiance',
+    'load_profile', 'simulate', 'lifetime', 'simulate_reference',
+    'compare_with_trace',
+]
+
+SIM_DIR = Path(__file__).resolve().parents[1] / 'lab3-em4iot' / 'simulator'
+
+DEATH_SOC = 0.01          # battery_voc stops the simulation at SOC <= 1%
+C_NOM_SINGLE = 3200.0     # mAh, battery_voc single battery capacity
+TRACE_PERIOD = 900        # s, irradiance sampling period (config_pv.h)
+
+# SOC -> Voc and SOC -> Rs polynomials of battery_voc.cpp (highest power first)
+VOC_POLY = (-18.64842845, 44.69486002, -36.60037106, 12.55851751, 2.05464539)
+RS_POLY = (-0.00045524, 0.00116024, -0.00091822, 0.000177, 0.00010329)
+
+
+# ==========================================
+# 1. Inputs: settings, LUTs, irradiance
+# ==========================================
+def load_settings(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _read_c_array(text, name):
+    m = re.search(rf'{name}\s*\[[^\]]*\]\s*=\s*\{{([^}}]*)\}}', text)
+    if m is None:
+        raise ValueError(f'array {name} not found')
+    return np.array([float(x) for x in m.group(1).split(',')])
+
+
+def load_luts(inc_dir=SIM_DIR / 'inc'):
+    """Read the LUTs the C++ modules are compiled with."""
+    inc_dir = Path(inc_dir)
+    pv = (inc_dir / 'config_pv.h').read_text()
+    conv_pv = (inc_dir / 'config_converter_pv.h').read_text()
+    conv_batt = (inc_dir / 'config_converter_battery.h').read_text()
+    return {
+        'pv_i': (_read_c_array(pv, 'G'), _read_c_array(pv, 'I_MPP')),
+        'pv_v': (_read_c_array(pv, 'G'), _read_c_array(pv, 'V_MPP')),
+        'conv_pv': (_read_c_array(conv_pv, 'V_CONV_PV'),
+                    _read_c_array(conv_pv, 'ETA_CONV_PV')),
+        'conv_batt': (_read_c_array(conv_batt, 'I_CONV_BATT'),
+                      _read_c_array(conv_batt, 'ETA_CONV_BATT')),
+    }
+
+
+def lut_get_val(lut, query):
+    """
+    Vectorized `LUT::get_val`: piecewise-linear, extrapolating with the
+    first/last segment outside the table.
+
+    (The C++ loop reads past the table for queries >= the last key; here
+    the last segment is used instead.)
+    """
+    key, val = lut
+    query = np.asarray(query, dtype=float)
+    i = np.searchsorted(key[1:-1], query, side='right')
+    return val[i] + (query - key[i]) * (val[i + 1] - val[i]) / (key[i + 1] - key[i])
+
+
+def load_irradiance(n_steps, g_file=SIM_DIR / 'input_files' / 'gmonths.txt',
+                    trace_period=TRACE_PERIOD, sim_step=1):
+    """Irradiance seen by pv_panel at each of the first `n_steps` steps."""
+    g = np.loadtxt(g_file, ndmin=1)
+    steps_per_sample = max(1, int(round(trace_period / sim_step)))
+    idx = np.arange(n_steps) // steps_per_sample
+    # pv_panel keeps the last value once the file is exhausted
+    return g[np.minimum(idx, g.size - 1)]
+
+
+def load_profile(settings):
+    """
+    Per-component load current (mA) over one `period`, as the generated
+    sensor/mcu/rf modules produce it (same timings as codegen_func.config_gen).
+    """
+    period = int(settings['period'])
+    cnt = np.arange(period)
+    profile = {}
+
+    max_sensing_time = 0
+    for sensor in settings['sensors']:
+        act = int(sensor['activation_time'])
+        t_on = int(sensor['time_on'])
+        on = (cnt >= act) & (cnt < act + t_on)
+        profile[f"i_{sensor['name']}"] = np.where(
+            on, float(sensor['current_on']), float(sensor['current_idle']))
+        max_sensing_time = max(max_sensing_time, act + t_on)
+
+    # mcu.cpp / rf.cpp only use the state named ON
+    mcu, rf = settings['mcu'], settings['rf']
+    mcu_on = next(s for s in mcu['states'] if s['name'] == 'ON')
+    rf_on = next(s for s in rf['states'] if s['name'] == 'ON')
+    mcu_act = max_sensing_time + 1
+    rf_act = mcu_act + int(mcu_on['time_on']) + 1
+
+    on = (cnt >= mcu_act) & (cnt < mcu_act + int(mcu_on['time_on']))
+    profile['i_mcu'] = np.where(on, float(mcu_on['current']), float(mcu['current_idle']))
+    on = (cnt >= rf_act) & (cnt < rf_act + int(rf_on['time_on']))
+    profile['i_rf'] = np.where(on, float(rf_on['current']), float(rf['current_idle']))
+    return profile
+
+
+# ==========================================
+# 2. Vectorized simulation
+# ==========================================
+def _clamped_soc(s_prev, drop, a):
+    """
+    s_k = a * min-clamped(s_{k-1} - drop_k) with s_k <= 1, on a whole chunk.
+
+    With a = 1 - selfdisch_factor, dividing by a^k turns the recurrence
+    into a cumulative sum with a moving upper barrier a^-k; the barrier is
+    handled with the running maximum of the excess (one-sided reflection).
+    """
+    k = np.arange(1, drop.size + 1)
+    scale = a ** -k if a != 1.0 else 1.0
+    # unclamped, in scaled units: u_k = s_prev - sum_{j<=k} drop_j / a^(j-1)
+    u = s_prev - np.cumsum(drop * (a ** -(k - 1) if a != 1.0 else 1.0))
+    excess = np.maximum.accumulate(np.maximum(u - scale, 0.0))
+    return (u - excess) / scale
+
+
+def simulate(settings, n_steps=None, n_pv=3.0, n_batt=1.0, soc_init=None,
+             g=None, luts=None, stop_at_death=True, chunk=86400,
+             tol=1e-12, max_iter=20, record=(), k_start=0):
+    """
+    Simulate the harvesting system.
+
+    `n_pv` multiplies the PV current on the bus (bus.cpp `num_pv_panels`)
+    and `n_batt` the battery capacity (battery_voc.cpp `num_batteries`).
+    `g` overrides the irradiance per step (see `load_irradiance`).
+    With `k_start` the run starts at that step (same load phase and
+    irradiance as in the full run) with SOC `soc_init`; `n_steps` is
+    still the absolute end step.
+
+    Returns a dict with `time` (s) and `soc` (as traced, i.e. one step
+    late), `soc_end` (SOC after the last step), `lifetime` (s at which
+    SOC <= 1%, or None) and the columns named
+    in `record` (any of i_tot, i_pv, v_pv, real_i_pv, i_batt, v_batt).
+    """
+    if n_steps is None:
+        n_steps = int(settings['sim_len'] / settings['sim_step'])
+    if soc_init is None:
+        soc_init = float(settings['soc_init'])
+    if luts is None:
+        luts = load_luts()
+    if g is None:
+        g = load_irradiance(n_steps, sim_step=settings['sim_step'])
+
+    dt = float(settings['sim_step'])
+    vref = float(settings['vref_bus'])
+    a = 1.0 - float(settings['selfdisch_factor'])
+    c_nom = C_NOM_SINGLE * n_batt
+    soc_gain = dt / (2 * 3600 * c_nom)
+
+    profile = load_profile(settings)
+    i_load_period = np.sum(list(profile.values()), axis=0)
+    period = i_load_period.size
+
+    out = {'time': [], 'soc': []}
+    for name in record:
+        out[name] = []
+
+    # state carried between chunks
+    tmpsoc = soc_init
+    # r_s and soc signals (delayed) at the chunk start: zero at t=0, like the
+    # TDF delay initial value; the current state when resuming mid-run
+    rs_prev = 0.0 if k_start == 0 else np.polyval(RS_POLY, soc_init)
+    soc_prev = 0.0 if k_start == 0 else soc_init
+    i_b_prev = 0.0       # i_batt at the last step of the previous chunk
+    i_b_next = 0.0       # i_batt computed for the first step of this chunk
+    v_guess = None
+    life = None
+
+    for k0 in range(k_start, n_steps, chunk):
+        k = np.arange(k0, min(k0 + chunk, n_steps))
+
+        # open-loop part: PV, loads, bus
+        gk = g[k]
+        i_pv = np.where(gk <= 0, 0.0, lut_get_val(luts['pv_i'], gk))
+        v_pv = np.where(gk <= 0, 0.0, lut_get_val(luts['pv_v'], gk))
+        real_i_pv = i_pv * v_pv * lut_get_val(luts['conv_pv'], v_pv) / 100 / vref
+        i_tot = i_load_period[k % period] - real_i_pv * n_pv
+        # converter_battery: i_batt[k+1] = i_num[k] / v_batt[k]
+        i_num = i_tot * vref / (lut_get_val(luts['conv_batt'], np.abs(i_tot)) / 100)
+
+        # closed loop through v_batt: fixed-point sweeps over the chunk
+        if v_guess is None:
+            v_guess = np.polyval(VOC_POLY, tmpsoc)
+        v_b = np.full(k.size, v_guess)
+        for _ in range(max_iter):
+            i_b = np.empty(k.size)
+            i_b[0] = i_b_next
+            i_b[1:] = i_num[:-1] / np.where(v_b[:-1] == 0, 3.6, v_b[:-1])
+            i_b_before = np.concatenate(([i_b_prev], i_b[:-1]))
+            s = _clamped_soc(tmpsoc, (i_b + i_b_before) * soc_gain, a)
+            s_before = np.concatenate(([tmpsoc], s[:-1]))
+            rs = np.concatenate(([rs_prev], np.polyval(RS_POLY, s_before[1:])))
+            v_new = np.polyval(VOC_POLY, s) - rs * i_b
+            done = np.max(np.abs(v_new - v_b)) < tol
+            v_b = v_new
+            if done:
+                break
+
+        soc_trace = np.concatenate(([soc_prev], s[:-1]))
+        n_keep = k.size
+        dead = np.flatnonzero(s <= DEATH_SOC)
+        if dead.size and stop_at_death:
+            # sc_stop() at the step where tmpsoc <= 1%: that step is the last
+            n_keep = dead[0] + 1
+        if dead.size and life is None:
+            life = float(k[dead[0]] * dt)
+
+        out['time'].append(k[:n_keep] * dt)
+        out['soc'].append(soc_trace[:n_keep])
+        cols = {'i_tot': i_tot, 'i_pv': i_pv, 'v_pv': v_pv,
+                'real_i_pv': real_i_pv, 'i_batt': i_b, 'v_batt': v_b}
+        for name in record:
+            out[name].append(cols[name][:n_keep])
+
+        if n_keep < k.size:
+            break
+        tmpsoc = s[-1]
+        soc_prev = s[-1]
+        rs_prev = np.polyval(RS_POLY, s[-1])
+        i_b_prev = i_b[-1]
+        i_b_next = i_num[-1] / (3.6 if v_b[-1] == 0 else v_b[-1])
+        v_guess = v_b[-1]
+
+    result = {name: np.concatenate(vals) for name, vals in out.items()}
+    result['lifetime'] = life
+    result['soc_end'] = float(s[n_keep - 1])
+    return result
+
+
+def lifetime(settings, **kwargs):
+    """Seconds until SOC <= 1% (None if the battery survives `sim_len`)."""
+    return simulate(settings, **kwargs)['lifetime']
+
+
+# ==========================================
+# 3. Validation
+# ==========================================
+def simulate_reference(settings, n_steps, n_pv=3.0, n_batt=1.0, luts=None, g=None):
+    """
+    Step-by-step port of the C++ modules (slow, for validating `simulate`
+    on short horizons). Returns the traced SOC.
+    """
+    if luts is None:
+        luts = load_luts()
+    if g is None:
+        g = load_irradiance(n_steps, sim_step=settings['sim_step'])
+    dt = float(settings['sim_step'])
+    vref = float(settings['vref_bus'])
+    a = 1.0 - float(settings['selfdisch_factor'])
+    c_nom = C_NOM_SINGLE * n_batt
+    i_load = np.sum(list(load_profile(settings).values()), axis=0)
+
+    def get(lut, x):
+        return float(lut_get_val(lut, x))
+
+    tmpsoc = float(settings['soc_init'])
+    prev_i = 0.0
+    i_batt = 0.0           # delayed output of converter_battery
+    soc_sig, rs_sig = 0.0, 0.0
+    soc_trace = np.empty(n_steps)
+    for k in range(n_steps):
+        gk = g[k]
+        i_pv = 0.0 if gk <= 0 else get(luts['pv_i'], gk)
+        v_pv = 0.0 if gk <= 0 else get(luts['pv_v'], gk)
+        real_i_pv = i_pv * v_pv * get(luts['conv_pv'], v_pv) / 100 / vref
+        i_tot = i_load[k % i_load.size] - real_i_pv * n_pv
+
+        # battery_voc
+        soc_trace[k] = soc_sig
+        tmpsoc -= (i_batt + prev_i) * dt / (2 * 3600 * c_nom)
+        prev_i = i_batt
+        tmpsoc = min(a * tmpsoc, 1.0)
+        v_oc = np.polyval(VOC_POLY, tmpsoc)
+        v_batt = v_oc - rs_sig * i_batt
+        soc_sig, rs_sig = tmpsoc, np.polyval(RS_POLY, tmpsoc)
+
+        # converter_battery (output seen at the next step)
+        eta = get(luts['conv_batt'], abs(i_tot)) / 100
+        i_batt = i_tot * vref / (eta * (3.6 if v_batt == 0 else v_batt))
+        if tmpsoc <= DEATH_SOC:
+            return soc_trace[:k + 1]
+    return soc_trace
+
+
+def compare_with_trace(trace_file, settings, **kwargs):
+    """
+    Run the surrogate over the span of a recorded sim_trace.txt and return
+    the max absolute SOC error and both lifetimes (s).
+    """
+    trace = np.loadtxt(trace_file, comments='%', usecols=(0, 1))
+    t, soc = trace[:, 0], trace[:, 1]
+    dt = float(settings['sim_step'])
+    res = simulate(settings, n_steps=int(round(t[-1] / dt)) + 1, **kwargs)
+    sur = np.interp(t, res['time'], res['soc'])
+    n = min(len(t), np.searchsorted(t, res['time'][-1], side='right'))
+    dead = np.flatnonzero(soc <= DEATH_SOC + 1e-4)
+    return {
+        'max_soc_error': float(np.max(np.abs(sur[:n] - soc[:n]))),
+        'lifetime_trace': float(t[dead[0]]) if dead.size else None,
+        'lifetime_surrogate': res['lifetime'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fast lifetime estimate of the lab3 system')
+    parser.add_argument('-f', '--input-file', type=str, metavar='PATH', required=True,
+                        help='Path to JSON input simulation settings')
+    parser.add_argument('--n-pv', type=float, default=3.0,
+                        help='Number of PV panels on the bus')
+    parser.add_argument('--n-batt', type=float, default=1.0,
+                        help='Number of batteries (capacity multiplier)')
+    parser.add_argument('--validate', type=str, metavar='PATH',
+                        help='Compare against a recorded sim_trace.txt')
+    args = parser.parse_args()
+
+    settings = load_settings(args.input_file)
+    if args.validate:
+        print(compare_with_trace(args.validate, settings,
+                                 n_pv=args.n_pv, n_batt=args.n_batt))
+    else:
+        res = simulate(settings, n_pv=args.n_pv, n_batt=args.n_batt)
+        if res['lifetime'] is None:
+            print(f"ALIVE after {res['time'][-1] / 86400:.2f} days, "
+                  f"final SOC {res['soc'][-1] * 100:.1f}%")
+        else:
+            print(f"DEAD after {res['lifetime'] / 86400:.2f} days")
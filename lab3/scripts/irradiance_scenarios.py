@@ -0,0 +1,135 @@
+"""
+Synthetic irradiance years built from the recorded gmonths trace.
+
+The recorded trace (input_files/gmonths.txt, one sample every 900 s) is
+cut into days; new traces are drawn day by day from that library:
+
+- bootstrap: days drawn independently, with replacement;
+- markov:    days are classified into cloud states (clear / partly cloudy /
+             overcast, by daily energy) and the state sequence follows a
+             Markov chain fitted on the recorded day sequence, so runs of
+             bad weather appear like in the data;
+- seasonal scaling (both methods): each day is scaled by a smooth yearly
+             factor relative to the season of the recorded trace.
+
+A scenario is fully defined by its seed, so worker processes regenerate
+it instead of receiving the trace.
+"""
+import numpy as np
+
+from harvest_surrogate import SIM_DIR, TRACE_PERIOD
+
+__all__ = [
+    'SAMPLES_PER_DAY', 'STATES', 'HeldIrradiance',
+    'day_library', 'classify_days', 'fit_markov', 'seasonal_factor',
+    'generate_scenario',
+]
+
+SAMPLES_PER_DAY = 86400 // TRACE_PERIOD
+STATES = ('overcast', 'partly', 'clear')
+
+
+class HeldIrradiance:
+    """
+    Per-step view of a per-sample irradiance trace (each sample held for
+    TRACE_PERIOD steps, like pv_panel), without materializing one value
+    per second. Indexing with a step or an array of steps works like
+    indexing the array returned by `harvest_surrogate.load_irradiance`.
+    """
+
+    def __init__(self, samples, steps_per_sample=TRACE_PERIOD):
+        self.samples = np.asarray(samples, dtype=float)
+        self.steps_per_sample = steps_per_sample
+
+    def __len__(self):
+        return self.samples.size * self.steps_per_sample
+
+    def __getitem__(self, k):
+        idx = np.asarray(k) // self.steps_per_sample
+        return self.samples[np.minimum(idx, self.samples.size - 1)]
+
+
+def day_library(g_file=SIM_DIR / 'input_files' / 'gmonths.txt'):
+    """
+    Distinct days of the recorded trace, in order of first appearance,
+    and the recorded day sequence as indices into them.
+    """
+    g = np.loadtxt(g_file, ndmin=1)
+    n_days = g.size // SAMPLES_PER_DAY
+    days = g[:n_days * SAMPLES_PER_DAY].reshape(n_days, SAMPLES_PER_DAY)
+    # gmonths repeats the same days: keep each profile once
+    library, first, sequence = np.unique(days, axis=0, return_index=True,
+                                         return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return library[order], rank[np.ravel(sequence)]
+
+
+def classify_days(library, n_states=len(STATES)):
+    """Cloud state of each library day: daily-energy quantile (0 = darkest)."""
+    energy = library.sum(axis=1)
+    edges = np.quantile(energy, np.linspace(0, 1, n_states + 1)[1:-1])
+    return np.searchsorted(edges, energy, side='right')
+
+
+def fit_markov(states, n_states=len(STATES), alpha=1.0):
+    """
+    Transition matrix of the day-to-day state sequence (the recorded trace
+    loops, so the last day is followed by the first). `alpha` is a
+    Laplace prior: every transition stays possible with a short record.
+    """
+    counts = np.full((n_states, n_states), alpha)
+    np.add.at(counts, (states, np.roll(states, -1)), 1)
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def seasonal_factor(day_of_year, amplitude, ref_day=0, peak_day=172):
+    """
+    Yearly irradiance scaling `1 + amplitude * cos(...)` (peak on
+    `peak_day`), relative to `ref_day`, the season of the recorded trace.
+    """
+    def f(d):
+        return 1 + amplitude * np.cos(2 * np.pi * (np.asarray(d) - peak_day) / 365.0)
+    return f(day_of_year) / f(ref_day)
+
+
+def generate_scenario(seed, n_days=365, method='markov', season_amp=0.0,
+                      start_day=0, ref_day=0, resolution=1.0, library=None):
+    """
+    One synthetic trace of `n_days` days, one sample per TRACE_PERIOD.
+
+    `resolution` (W/m^2) rounds the samples: scaled days would otherwise
+    give a new irradiance level every sample, and the lifetime cache of
+    soc_extrapolation is keyed by irradiance. Use 0 to keep full precision.
+    """
+    if library is None:
+        library = day_library()
+    days, sequence = library
+    rng = np.random.default_rng(seed)
+
+    if method == 'bootstrap':
+        picks = rng.integers(0, len(days), n_days)
+    elif method == 'markov':
+        states = classify_days(days)
+        trans = fit_markov(states[sequence])
+        pools = [np.flatnonzero(states == s) for s in range(trans.shape[0])]
+        # start from the stationary distribution of the chain
+        w, v = np.linalg.eig(trans.T)
+        stat = np.abs(np.real(v[:, np.argmin(np.abs(w - 1))]))
+        s = rng.choice(len(stat), p=stat / stat.sum())
+        picks = np.empty(n_days, dtype=int)
+        for d in range(n_days):
+            picks[d] = rng.choice(pools[s])
+            s = rng.choice(len(stat), p=trans[s])
+    else:
+        raise ValueError(f'unknown method: {method}')
+
+    trace = days[picks]
+    if season_amp:
+        day_of_year = (start_day + np.arange(n_days)) % 365
+        trace = trace * seasonal_factor(day_of_year, season_amp, ref_day)[:, None]
+    trace = np.maximum(trace.ravel(), 0.0)
+    if resolution:
+        trace = np.round(trace / resolution) * resolution
+    return trace
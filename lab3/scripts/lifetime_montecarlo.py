@@ -0,0 +1,168 @@
+"""
+Lifetime distribution of PV / battery sizings over synthetic irradiance
+years (see irradiance_scenarios.py).
+
+Every (configuration, scenario) pair is one task on a process pool; a task
+only carries the seed of its scenario, and each worker loads the LUTs and
+the day library once. Lifetimes come from soc_extrapolation, so one task
+takes a fraction of a second even for a year-long horizon.
+
+Usage (from lab3/scripts/):
+    python lifetime_montecarlo.py -f ../lab3-em4iot/sim_setting/parallel.json \\
+        --n-pv 0.3 0.5 1 --n-batt 1 2 -n 200 --days 365 --season-amp 0.3
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from harvest_surrogate import load_luts, load_settings
+from irradiance_scenarios import HeldIrradiance, day_library, generate_scenario
+from soc_extrapolation import extrapolate_soc
+
+__all__ = ['run_lifetimes', 'censored_percentile', 'summarize']
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# per-process state, set by _init_worker
+_WORKER = {}
+
+
+def _init_worker(settings, scenario_kw):
+    _WORKER['settings'] = settings
+    _WORKER['scenario_kw'] = scenario_kw
+    _WORKER['luts'] = load_luts()
+    _WORKER['library'] = day_library()
+
+
+def _lifetime_task(task):
+    config, seed = task
+    samples = generate_scenario(seed, library=_WORKER['library'],
+                                **_WORKER['scenario_kw'])
+    g = HeldIrradiance(samples)
+    res = extrapolate_soc(_WORKER['settings'], n_steps=len(g), g=g,
+                          luts=_WORKER['luts'], **config)
+    # survived the whole horizon: censored at the horizon length
+    life = res['lifetime']
+    return {**config, 'seed': seed,
+            'lifetime_days': np.inf if life is None else life / 86400}
+
+
+def run_lifetimes(settings, configs, n_scenarios, seed=0, workers=None,
+                  n_days=365, method='markov', season_amp=0.0, **scenario_kw):
+    """
+    Lifetime (days, inf if the battery outlives `n_days`) of every
+    configuration on every scenario. `configs` are keyword dicts for
+    `extrapolate_soc` (n_pv, n_batt, ...). Scenario `i` uses seed
+    `seed + i` for every configuration, so configurations are compared on
+    the same weather.
+    """
+    scenario_kw = dict(n_days=n_days, method=method, season_amp=season_amp,
+                       **scenario_kw)
+    tasks = [(config, seed + i) for config in configs for i in range(n_scenarios)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(settings, scenario_kw)
+        rows = [_lifetime_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(settings, scenario_kw)) as pool:
+            rows = list(pool.map(_lifetime_task, tasks,
+                                 chunksize=max(1, len(tasks) // (4 * workers))))
+    return pd.DataFrame(rows)
+
+
+def censored_percentile(x, p):
+    """
+    Percentile of lifetimes where survivors (inf) are censored at the
+    horizon: inf when the percentile falls among the survivors, the
+    usual interpolated value when it falls among the deaths.
+    """
+    # np.percentile's linear interpolation, except that it would give NaN
+    # (inf - inf, or inf * 0) next to the survivors
+    xs = np.sort(np.asarray(x, dtype=float))
+    pos = p / 100 * (xs.size - 1)
+    lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+    if np.isinf(xs[hi]):
+        return np.inf
+    return float(xs[lo] + (xs[hi] - xs[lo]) * (pos - lo))
+
+
+def summarize(df, percentiles=PERCENTILES):
+    """
+    Lifetime percentiles (days) and survival rate per configuration.
+
+    A percentile above the death rate is inf: the lifetime is only known
+    to exceed the scenario length.
+    """
+    keys = [c for c in df.columns if c not in ('seed', 'lifetime_days')]
+
+    def stats(x):
+        out = {f'p{p}': censored_percentile(x, p) for p in percentiles}
+        out['survived'] = np.isinf(x).mean()
+        return pd.Series(out)
+
+    return df.groupby(keys)['lifetime_days'].apply(stats).unstack()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lifetime percentiles over irradiance scenarios')
+    parser.add_argument('-f', '--input-file', type=str, metavar='PATH', required=True,
+                        help='Path to JSON input simulation settings')
+    parser.add_argument('--n-pv', type=float, nargs='+', default=[3.0],
+                        help='PV panel counts to evaluate')
+    parser.add_argument('--n-batt', type=float, nargs='+', default=[1.0],
+                        help='Battery counts to evaluate')
+    parser.add_argument('-n', '--scenarios', type=int, default=100,
+                        help='Number of irradiance scenarios')
+    parser.add_argument('--days', type=int, default=365,
+                        help='Scenario length (days)')
+    parser.add_argument('--method', choices=['markov', 'bootstrap'], default='markov')
+    parser.add_argument('--season-amp', type=float, default=0.0,
+                        help='Seasonal irradiance amplitude (0 = no seasons)')
+    parser.add_argument('--start-day', type=int, default=0,
+                        help='Day of year of the scenario start')
+    parser.add_argument('--ref-day', type=int, default=0,
+                        help='Day of year of the recorded trace (seasonal reference)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Worker processes (default: all CPUs)')
+    parser.add_argument('-o', '--output', type=str, metavar='PATH',
+                        help='Save the per-scenario lifetimes as CSV')
+    parser.add_argument('--store', type=str, metavar='DB',
+                        help='Append the runs to a results store (tools/results_store.py)')
+    args = parser.parse_args()
+
+    configs = [{'n_pv': p, 'n_batt': b} for p, b in itertools.product(args.n_pv, args.n_batt)]
+    t0 = time.perf_counter()
+    df = run_lifetimes(load_settings(args.input_file), configs, args.scenarios,
+                       seed=args.seed, workers=args.workers, n_days=args.days,
+                       method=args.method, season_amp=args.season_amp,
+                       start_day=args.start_day, ref_day=args.ref_day)
+    print(f"{len(df)} runs in {time.perf_counter() - t0:.1f} s "
+          f"({args.scenarios} scenarios x {len(configs)} configurations)\n")
+    # survivors outlive the scenario: their percentiles read '>days'
+    print(summarize(df).to_string(
+        float_format=lambda x: f'>{args.days}' if np.isinf(x) else f'{x:.2f}'))
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f"\nSaved to: {args.output}")
+    if args.store:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+        from emiot_tools import ResultsStore, montecarlo_topology
+        runtime = (time.perf_counter() - t0) / len(df)
+        scenario_kw = {'days': args.days, 'method': args.method, 'season_amp': args.season_amp,
+                       'start_day': args.start_day, 'ref_day': args.ref_day}
+        with ResultsStore(args.store) as store:
+            store.add_runs(dict(kind='lab3_montecarlo', metrics={'lifetime_days': row.pop('lifetime_days')},
+                                params={**row, **scenario_kw}, scenario=args.input_file,
+                                topology=montecarlo_topology(row), lab='lab3', runtime=runtime)
+                           for row in df.to_dict('records'))
+        print(f"Runs appended to: {args.store}")
@@ -0,0 +1,338 @@
+"""
+Analytic load profile of a sim_setting JSON and schedule explorer.
+
+The load side of the simulator is fully defined by the settings: each
+sensor is ON in [activation_time, activation_time + time_on) of every
+period, the MCU starts one step after the last sensor ends and the RF one
+step after the MCU (same rules as codegen_func.config_gen). So the total
+load current is piecewise constant and its charge, peak and overlaps are
+exact sums over the breakpoints; no compile or simulation is needed to
+compare sequential.json with parallel.json.
+
+The explorer moves the sensor activations (orderings of back-to-back
+sensors and grids of offsets), evaluates whole batches of candidate
+schedules as (candidates x period) arrays on a process pool and ranks
+them by peak current, battery IR drop or charge drawn from the battery.
+
+Usage (from lab3/scripts/):
+    python load_schedule.py -f ../lab3-em4iot/sim_setting/parallel.json \\
+        --compare ../lab3-em4iot/sim_setting/sequential.json
+    python load_schedule.py -f ... --objective ir_drop --offset-step 6 -o best.json
+"""
+import argparse
+import copy
+import itertools
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from harvest_surrogate import RS_POLY, VOC_POLY, load_luts, load_settings, lut_get_val
+
+__all__ = [
+    'Window', 'OBJECTIVES', 'MAX_CANDIDATES',
+    'load_windows', 'build_profile', 'profile_metrics', 'battery_metrics',
+    'permutation_candidates', 'offset_grid_size', 'offset_candidates', 'evaluate_batch',
+    'explore', 'apply_schedule',
+]
+
+# one load component: ON during [start, start + duration) of each period
+Window = namedtuple('Window', ['name', 'start', 'duration', 'i_on', 'i_idle'])
+
+OBJECTIVES = ('peak', 'ir_drop', 'battery_charge')
+# explore() refuses larger searches: the ranked table alone is ~100 B/schedule
+MAX_CANDIDATES = 5_000_000
+
+
+# ==========================================
+# 1. Piecewise-constant profile
+# ==========================================
+def _mcu_rf_windows(settings, sensing_end):
+    mcu, rf = settings['mcu'], settings['rf']
+    mcu_on = next(s for s in mcu['states'] if s['name'] == 'ON')
+    rf_on = next(s for s in rf['states'] if s['name'] == 'ON')
+    mcu_act = sensing_end + 1
+    rf_act = mcu_act + int(mcu_on['time_on']) + 1
+    return [
+        Window('mcu', mcu_act, int(mcu_on['time_on']),
+               float(mcu_on['current']), float(mcu['current_idle'])),
+        Window('rf', rf_act, int(rf_on['time_on']),
+               float(rf_on['current']), float(rf['current_idle'])),
+    ]
+
+
+def load_windows(settings):
+    """ON windows of every load component, as the generated code runs them."""
+    windows = [Window(s['name'], int(s['activation_time']), int(s['time_on']),
+                      float(s['current_on']), float(s['current_idle']))
+               for s in settings['sensors']]
+    sensing_end = max(w.start + w.duration for w in windows)
+    return windows + _mcu_rf_windows(settings, sensing_end)
+
+
+def build_profile(windows, period):
+    """
+    Total load current over one period: `(edges, current)`, with
+    `current[j]` flowing in `[edges[j], edges[j + 1])`.
+
+    Windows are clipped to the period (the generated modules reset their
+    counter every `period` steps, nothing wraps around).
+    """
+    edges = {0, period}
+    for w in windows:
+        edges.update(min(max(t, 0), period) for t in (w.start, w.start + w.duration))
+    edges = np.array(sorted(edges))
+    mid = (edges[:-1] + edges[1:]) / 2
+    current = np.zeros(mid.size)
+    n_on = np.zeros(mid.size, dtype=int)
+    for w in windows:
+        on = (mid >= w.start) & (mid < w.start + w.duration)
+        current += np.where(on, w.i_on, w.i_idle)
+        n_on += on
+    return edges, current, n_on
+
+
+def profile_metrics(windows, period):
+    """Charge (mAs), average and peak current (mA) and overlaps of one period."""
+    edges, current, n_on = build_profile(windows, period)
+    width = np.diff(edges)
+    overlap = {}
+    for a, b in itertools.combinations(windows, 2):
+        lo = max(a.start, b.start)
+        hi = min(a.start + a.duration, b.start + b.duration, period)
+        if hi > lo:
+            overlap[(a.name, b.name)] = hi - lo
+    return {
+        'charge_mAs': float(np.sum(current * width)),
+        'avg_mA': float(np.sum(current * width) / period),
+        'peak_mA': float(current.max()),
+        'overlap_s': float(width[n_on >= 2].sum()),   # time with >= 2 loads ON
+        'overlaps': overlap,
+        'busy_s': float(width[n_on >= 1].sum()),
+    }
+
+
+def battery_metrics(windows, period, vref, soc=1.0, luts=None):
+    """
+    What the battery sees for this load with no PV (night): charge drawn
+    (mAs, converter losses included), peak battery current and the worst
+    IR drop `Rs * i_batt` at the given SOC. `vref` is the bus voltage
+    (`settings['vref_bus']`).
+    """
+    if luts is None:
+        luts = load_luts()
+    edges, current, _ = build_profile(windows, period)
+    i_batt, drop = _battery_side(current, soc, luts, vref)
+    return {
+        'battery_charge_mAs': float(np.sum(i_batt * np.diff(edges))),
+        'peak_i_batt_mA': float(i_batt.max()),
+        'ir_drop_mV': float(drop.max()),
+    }
+
+
+def _battery_side(i_load, soc, luts, vref):
+    # converter_battery: i_batt = i_bus * Vref / (eta * v_batt),
+    # v_batt = Voc - Rs * i_batt (one fixed-point step, Rs * i << Voc)
+    voc, rs = np.polyval(VOC_POLY, soc), np.polyval(RS_POLY, soc)
+    eta = lut_get_val(luts['conv_batt'], np.abs(i_load)) / 100
+    i_batt = i_load * vref / (eta * voc)
+    i_batt = i_load * vref / (eta * (voc - rs * i_batt))
+    # battery_char uses i_batt in mA, so Rs * i_batt is in V
+    return i_batt, rs * i_batt * 1e3     # mA, mV
+
+
+# ==========================================
+# 2. Candidate schedules
+# ==========================================
+def _sensors(settings):
+    return [(s['name'], int(s['time_on']), float(s['current_on']),
+             float(s['current_idle'])) for s in settings['sensors']]
+
+
+def permutation_candidates(settings, gaps=(0,)):
+    """Sensors back to back (`gap` s apart) in every order."""
+    durations = np.array([d for _, d, _, _ in _sensors(settings)])
+    out = []
+    for order in itertools.permutations(range(durations.size)):
+        for gap in gaps:
+            acts = np.empty(durations.size, dtype=int)
+            t = 0
+            for s in order:
+                acts[s] = t
+                t += durations[s] + gap
+            out.append(acts)
+    return np.array(out)
+
+
+def offset_grid_size(settings, step):
+    """Number of schedules of the offset grid: (period / step) ** sensors."""
+    return len(range(0, int(settings['period']), step)) ** len(settings['sensors'])
+
+
+def offset_candidates(settings, step, start=0, stop=None):
+    """
+    Every combination of activation times on a `step`-second grid, or only
+    its rows [start, stop): they are built from their flat index, so a
+    slice of the grid never needs the whole grid in memory.
+    """
+    grid = np.arange(0, int(settings['period']), step)
+    size = offset_grid_size(settings, step)
+    stop = size if stop is None else min(stop, size)
+    idx = np.unravel_index(np.arange(start, stop), (grid.size,) * len(settings['sensors']))
+    return grid[np.stack(idx, axis=1)]
+
+
+# ==========================================
+# 3. Batch evaluation
+# ==========================================
+def evaluate_batch(settings, acts, soc=1.0, luts=None):
+    """
+    Metrics of many schedules at once. `acts` is (candidates x sensors)
+    activation times; the per-step load is built as a (candidates x period)
+    array, exact here since every time in the settings is a whole step.
+    Schedules whose RF burst does not fit in the period are dropped.
+    """
+    if luts is None:
+        luts = load_luts()
+    period = int(settings['period'])
+    acts = np.asarray(acts, dtype=int)
+    sensors = _sensors(settings)
+    dur = np.array([d for _, d, _, _ in sensors])
+    i_on = np.array([i for _, _, i, _ in sensors])
+    i_idle = np.array([i for _, _, _, i in sensors])
+
+    ends = acts + dur
+    sensing_end = ends.max(axis=1)
+    mcu, rf = _mcu_rf_windows(settings, 0)
+    mcu_act = sensing_end + 1
+    rf_act = mcu_act + mcu.duration + 1
+    ok = (rf_act + rf.duration <= period) & (ends.max(axis=1) <= period)
+    acts, ends, mcu_act, rf_act = acts[ok], ends[ok], mcu_act[ok], rf_act[ok]
+
+    t = np.arange(period)
+    on = (t >= acts[:, :, None]) & (t < ends[:, :, None])            # (c, s, t)
+    i_load = np.einsum('cst,s->ct', on, i_on - i_idle) + i_idle.sum()
+    for w, act in ((mcu, mcu_act), (rf, rf_act)):
+        w_on = (t >= act[:, None]) & (t < act[:, None] + w.duration)
+        i_load += np.where(w_on, w.i_on, w.i_idle)
+
+    i_batt, drop = _battery_side(i_load, soc, luts, float(settings['vref_bus']))
+    n_on = on.sum(axis=1)
+    return pd.DataFrame({
+        **{f'act_{name}': acts[:, j] for j, (name, _, _, _) in enumerate(sensors)},
+        'peak_mA': i_load.max(axis=1),
+        'charge_mAs': i_load.sum(axis=1),
+        'battery_charge': i_batt.sum(axis=1),
+        'ir_drop': drop.max(axis=1),
+        'overlap_s': (n_on >= 2).sum(axis=1),
+        'sensing_end': ends.max(axis=1),
+    })
+
+
+def _evaluate_chunk(args):
+    # offset grid chunks are (step, start, stop), built in the worker
+    settings, acts, soc = args
+    if isinstance(acts, tuple):
+        acts = offset_candidates(settings, *acts)
+    return evaluate_batch(settings, acts, soc)
+
+
+def explore(settings, objective='peak', offset_step=None, gaps=(0,), soc=1.0,
+            workers=None, chunk=20000, max_candidates=MAX_CANDIDATES):
+    """
+    Rank candidate schedules by `objective` (`peak`, `ir_drop` or
+    `battery_charge`; ties broken by the earliest end of sensing).
+    Candidates are every back-to-back ordering (`gaps`) plus, with
+    `offset_step`, the full offset grid; chunks run on a process pool.
+    More than `max_candidates` schedules raise ValueError.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f'objective must be one of {OBJECTIVES}')
+    perms = np.unique(permutation_candidates(settings, gaps), axis=0)
+    n_grid = 0
+    if offset_step:
+        n_grid = offset_grid_size(settings, offset_step)
+        # orderings already on the grid would be evaluated twice
+        on_grid = ((perms % offset_step == 0) & (perms < int(settings['period']))).all(axis=1)
+        perms = perms[~on_grid]
+    if len(perms) + n_grid > max_candidates:
+        raise ValueError(f'{len(perms) + n_grid} candidate schedules (offset step {offset_step} s) '
+                         f'exceed max_candidates={max_candidates}; use a coarser offset step')
+    chunks = [(settings, perms[i:i + chunk], soc) for i in range(0, len(perms), chunk)]
+    chunks += [(settings, (offset_step, i, i + chunk), soc) for i in range(0, n_grid, chunk)]
+
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(chunks))
+    if workers <= 1:
+        parts = [_evaluate_chunk(c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_evaluate_chunk, chunks))
+
+    column = {'peak': 'peak_mA', 'ir_drop': 'ir_drop',
+              'battery_charge': 'battery_charge'}[objective]
+    df = pd.concat(parts, ignore_index=True)
+    return df.sort_values([column, 'sensing_end']).reset_index(drop=True)
+
+
+def apply_schedule(settings, row):
+    """Copy of `settings` with the activation times of a result row."""
+    new = copy.deepcopy(settings)
+    for sensor in new['sensors']:
+        # the JSON keeps numbers as strings, like the original files
+        sensor['activation_time'] = str(int(row[f"act_{sensor['name']}"]))
+    return new
+
+
+def _print_metrics(label, settings, luts):
+    windows = load_windows(settings)
+    period = int(settings['period'])
+    m = profile_metrics(windows, period)
+    b = battery_metrics(windows, period, float(settings['vref_bus']), luts=luts)
+    print(f"{label}: charge {m['charge_mAs']:.3f} mAs/period, avg {m['avg_mA']:.3f} mA, "
+          f"peak {m['peak_mA']:.3f} mA, overlap {m['overlap_s']:.0f} s | battery: "
+          f"{b['battery_charge_mAs']:.3f} mAs, peak {b['peak_i_batt_mA']:.3f} mA, "
+          f"IR drop {b['ir_drop_mV']:.4f} mV")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analytic load profile and schedule search')
+    parser.add_argument('-f', '--input-file', type=str, metavar='PATH', required=True,
+                        help='Path to JSON input simulation settings')
+    parser.add_argument('--compare', type=str, nargs='*', default=[], metavar='PATH',
+                        help='Other settings files to compare with')
+    parser.add_argument('--objective', choices=OBJECTIVES, default='peak')
+    parser.add_argument('--offset-step', type=int, default=None,
+                        help='Also search all activation offsets on this grid (s)')
+    parser.add_argument('--gaps', type=int, nargs='+', default=[0],
+                        help='Gaps (s) between back-to-back sensors')
+    parser.add_argument('--soc', type=float, default=1.0,
+                        help='SOC used for the battery-side metrics')
+    parser.add_argument('--max-candidates', type=int, default=MAX_CANDIDATES,
+                        help='Refuse searches with more candidate schedules than this')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('-o', '--output', type=str, metavar='PATH',
+                        help='Write the settings of the best schedule to this JSON')
+    args = parser.parse_args()
+
+    settings = load_settings(args.input_file)
+    luts = load_luts()
+    _print_metrics(args.input_file, settings, luts)
+    for path in args.compare:
+        _print_metrics(path, load_settings(path), luts)
+
+    try:
+        ranked = explore(settings, args.objective, args.offset_step, args.gaps,
+                         args.soc, args.workers, max_candidates=args.max_candidates)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"\n{len(ranked)} schedules evaluated, best by {args.objective}:")
+    print(ranked.head(args.top).to_string(float_format=lambda x: f'{x:.4f}'))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(apply_schedule(settings, ranked.iloc[0]), f, indent=4)
+        print(f"\nSaved to: {args.output}")
@@ -1,7 +1,8 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from trace_reader import read_trace
+
 # 1. Load simulation log data
 # Ensure column names match sim_trace.txt headers exactly
 columns = [
@@ -12,7 +13,8 @@ columns = [
 
 # Read data, skip comment lines starting with '%'
 # Ensure 'sim_trace(1).txt' is in the same directory as this script
-df = pd.read_csv('sim_trace(1).txt', sep=r'\s+', comment='%', names=columns)
+df = read_trace('sim_trace(1).txt', columns=columns[1:])
+df.columns = columns
 
 # 2. Filter battery charging phase
 # During charging, bus current i_tot is negative (PV produces more than load needs)
@@ -1,12 +1,13 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from trace_reader import read_trace
+
 # ==========================================
 # 1. Data loading and preprocessing
 # ==========================================
 def load_and_clean_data(filepath):
-    df = pd.read_csv(filepath, sep='\s+', engine='python')
+    df = read_trace(filepath)
     df.columns = df.columns.str.replace('%', '')
     df['day'] = df['time'] / 86400 
     
@@ -1,13 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+from trace_index import TraceIndex
+from trace_reader import read_trace
+
 # ==========================================
 # 1. Define data loading and processing function
 # ==========================================
 def load_simulation_data(filepath):
     # Read data and clean column headers
-    df = pd.read_csv(filepath, sep='\s+', engine='python')
+    df = read_trace(filepath)
     df.columns = df.columns.str.replace('%', '')
     df['day'] = df['time'] / 86400 
     
@@ -38,12 +40,14 @@ def load_simulation_data(filepath):
 
 # Load data (ensure filename 'sim_trace.txt' is correct)
 df_parallel = load_simulation_data('sim_trace.txt')
+# time is sorted: windows below are binary searches returning row slices
+idx = TraceIndex(df_parallel)
 
 
 # ==========================================
 # Plot 1: macro trend (7-day global view)
 # ==========================================
-df_macro = df_parallel[df_parallel['day'] <= 7]
+df_macro = idx.frame(None, 7 * 86400)
 
 fig, axs = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
 axs[0].plot(df_macro['day'], df_macro['P_load'], label='True Load Power (mW)', color='red', alpha=0.8)
@@ -76,7 +80,7 @@ plt.show()
 # ==========================================
 start_time = 3 * 3600
 end_time = 5 * 3600
-df_micro = df_parallel[(df_parallel['time'] >= start_time) & (df_parallel['time'] <= end_time)]
+df_micro = idx.frame(start_time, end_time)
 
 fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
 
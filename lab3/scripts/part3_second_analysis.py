@@ -1,10 +1,11 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from trace_reader import read_trace
+
 def load_simulation_data(filepath):
     # sep='\s+' 表示匹配任意数量的空格，engine='python' 更加稳定
-    df = pd.read_csv(filepath, sep='\s+', engine='python')
+    df = read_trace(filepath)
     
     # 去掉表头中可能存在的 '%' 符号 (例如 %time -> time)
     df.columns = df.columns.str.replace('%', '')
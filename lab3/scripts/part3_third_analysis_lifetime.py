@@ -1,6 +1,8 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 
+from trace_index import TraceIndex
+from trace_reader import read_trace
+
 
 FILENAME = 'sim_trace.txt'
 OUTPUT_IMG = 'lifetime_analysis.png'
@@ -11,20 +13,18 @@ def plot_lifetime_optimized():
     
     try:
        
-        df = pd.read_csv(FILENAME, delim_whitespace=True, engine='c')
+        df = read_trace(FILENAME)
     except FileNotFoundError:
         print(f"Error: file not found: {FILENAME}")
         return
 
     
     df.rename(columns={'%time': 'time'}, inplace=True)
+    idx = TraceIndex(df)
 
     
-    
-    df.drop(df[df['time'] < 10].index, inplace=True)
-    
-    
-    df.reset_index(drop=True, inplace=True)
+    # skip the start-up transient (t < 10 s) as a slice, no copy
+    df = df.iloc[idx.rows(10, None)]
 
     if df.empty:
         print("Error: data is empty (possibly all filtered out)")
@@ -41,9 +41,9 @@ def plot_lifetime_optimized():
         status = "DEAD (Depleted)"
         color_status = "red"
         
-        dead_rows = df[df['soc'] <= 0.0101]
-        if not dead_rows.empty:
-            lifetime_days = dead_rows.iloc[0]['time'] / 86400.0
+        dead = idx.first_crossing('soc', 0.0101, start=10)
+        if dead is not None:
+            lifetime_days = dead[1] / 86400.0
     else:
         status = "ALIVE (Running)"
         color_status = "green"
@@ -0,0 +1,242 @@
+"""
+Periodic steady-state extrapolation of the lab3 battery SOC.
+
+The load repeats every `period` (120 s) and the irradiance only changes
+every TRACE_PERIOD (900 s), so within one irradiance interval the battery
+current is a periodic signal that depends only on the irradiance, on the
+load phase at which the interval starts and (weakly, through the battery
+voltage) on the SOC. One load period is solved for each
+(irradiance, phase, SOC bucket) and cached; the SOC is then advanced one
+whole irradiance interval at a time by adding the cached deltas.
+
+Only when the SOC gets close to the 1% threshold is the interval replayed
+step by step with `harvest_surrogate.simulate`, so the death time keeps
+the one-second resolution.
+
+Usage (from lab3/scripts/):
+    python soc_extrapolation.py -f ../lab3-em4iot/sim_setting/parallel.json --n-pv 0.3
+"""
+import argparse
+
+import numpy as np
+
+from harvest_surrogate import (C_NOM_SINGLE, DEATH_SOC, RS_POLY, TRACE_PERIOD,
+                               VOC_POLY, load_irradiance, load_luts,
+                               load_profile, load_settings, lut_get_val,
+                               simulate)
+
+__all__ = ['IntervalCache', 'extrapolate_soc']
+
+
+def _horner(coeffs, x):
+    # scalar np.polyval without the array overhead (called once per interval)
+    y = 0.0
+    for c in coeffs:
+        y = y * x + c
+    return y
+
+
+class IntervalCache:
+    """
+    SOC change over one irradiance interval, keyed by
+    (irradiance, load phase, SOC bucket).
+
+    A bucket is filled for a whole block of irradiance levels at once, as a
+    (levels x period) array problem; `blocks` assigns each level to a block
+    (e.g. by the week it first appears, so a battery that dies early never
+    pays for the rest of the horizon). Between bucket edges the
+    values are interpolated after multiplying by Voc: the battery current
+    is ~ P_bus / Voc, so `delta * Voc` is almost flat in SOC and coarse
+    buckets keep the precision.
+    """
+
+    def __init__(self, settings, g_levels, phases, n_pv=3.0, n_batt=1.0,
+                 luts=None, soc_res=0.05, interval=TRACE_PERIOD, n_iter=4,
+                 blocks=None):
+        if luts is None:
+            luts = load_luts()
+        self.soc_res = soc_res
+        self.interval = interval
+        self.n_iter = n_iter
+        dt = float(settings['sim_step'])
+        vref = float(settings['vref_bus'])
+        self.a_interval = (1.0 - float(settings['selfdisch_factor'])) ** interval
+        self.gain = dt / (2 * 3600 * C_NOM_SINGLE * n_batt)
+
+        # per-step battery-converter numerator over one period, per irradiance
+        i_load = np.sum(list(load_profile(settings).values()), axis=0)
+        self.period = i_load.size
+        g = np.asarray(g_levels, dtype=float)[:, None]
+        i_pv = np.where(g <= 0, 0.0, lut_get_val(luts['pv_i'], g))
+        v_pv = np.where(g <= 0, 0.0, lut_get_val(luts['pv_v'], g))
+        real_i_pv = i_pv * v_pv * lut_get_val(luts['conv_pv'], v_pv) / 100 / vref
+        i_tot = i_load[None, :] - real_i_pv * n_pv
+        self._i_num = i_tot * vref / (lut_get_val(luts['conv_batt'], np.abs(i_tot)) / 100)
+
+        n_edges = int(np.ceil(1.0 / soc_res)) + 1
+        shape = (len(g_levels), len(phases), n_edges)
+        self._phases = {p: j for j, p in enumerate(phases)}
+        # drop/rise: largest discharge/charge reached inside the interval
+        self.delta = np.full(shape, np.nan)
+        self.drop = np.full(shape, np.nan)
+        self.rise = np.full(shape, np.nan)
+        if blocks is None:
+            blocks = np.zeros(len(g_levels), dtype=int)
+        self._block = np.asarray(blocks).tolist()
+        self._block_rows = [np.flatnonzero(blocks == i)
+                            for i in range(max(self._block) + 1)]
+        self._filled = np.zeros((len(self._block_rows), n_edges), dtype=bool)
+        self.misses = 0
+        self.hits = 0
+
+    def _fill(self, block, b):
+        rows = self._block_rows[block]
+        soc = min(b * self.soc_res, 1.0)
+        voc = np.polyval(VOC_POLY, soc)
+        rs = np.polyval(RS_POLY, soc)
+        # periodic steady state of i_b[k+1] = i_num[k] / v_b[k],
+        # v_b[k] = Voc - Rs * i_b[k] (converges in a few sweeps, Rs*i << Voc)
+        i_num = self._i_num[rows]
+        v_b = np.full(i_num.shape, voc)
+        for _ in range(self.n_iter):
+            i_b = np.roll(i_num / v_b, 1, axis=1)
+            v_b = voc - rs * i_b
+        d_soc = (i_b + np.roll(i_b, 1, axis=1)) * self.gain
+        n_full, rem = divmod(self.interval, self.period)
+        for p, j in self._phases.items():
+            # one load period starting at phase p; the interval is n_full of
+            # them plus `rem` steps, and the SOC path over it is
+            # n * total + cs[r]: its extremes are at the first or last period
+            cs = np.cumsum(np.roll(d_soc, -p, axis=1), axis=1)
+            total = cs[:, -1]
+            tail = cs[:, rem - 1] if rem else 0.0
+            hi, lo = cs.max(axis=1), cs.min(axis=1)
+            last_hi = n_full * total + (cs[:, :rem].max(axis=1) if rem else -np.inf)
+            last_lo = n_full * total + (cs[:, :rem].min(axis=1) if rem else np.inf)
+            drop = np.maximum.reduce([hi, (n_full - 1) * total + hi, last_hi,
+                                      np.zeros_like(hi)])
+            rise = -np.minimum.reduce([lo, (n_full - 1) * total + lo, last_lo,
+                                       np.zeros_like(lo)])
+            # stored times Voc, see the class docstring
+            self.delta[rows, j, b] = (n_full * total + tail) * voc
+            self.drop[rows, j, b] = drop * voc
+            self.rise[rows, j, b] = rise * voc
+        self._filled[block, b] = True
+        self.misses += 1
+
+    def lookup(self, g_idx, phase, soc):
+        """(delta, drop, rise) of SOC over one interval starting at `soc`."""
+        x = min(max(soc, 0.0), 1.0) / self.soc_res
+        b = min(int(x), self.delta.shape[2] - 2)
+        w = x - b
+        block = self._block[g_idx]
+        for edge in (b, b + 1):
+            if self._filled[block, edge]:
+                self.hits += 1
+            else:
+                self._fill(block, edge)
+        j = self._phases[phase]
+        voc = _horner(VOC_POLY, soc)
+        return tuple(((1 - w) * t[g_idx, j, b] + w * t[g_idx, j, b + 1]) / voc
+                     for t in (self.delta, self.drop, self.rise))
+
+
+def extrapolate_soc(settings, n_steps=None, n_pv=3.0, n_batt=1.0, soc_init=None,
+                    g=None, luts=None, soc_res=0.05, guard=0.005, replay_len=86400,
+                    block_days=7):
+    """
+    Lifetime estimate by interval-wise SOC extrapolation.
+
+    When the lowest SOC an interval can reach is within `guard` of the 1%
+    threshold, `replay_len` steps (rounded to whole intervals) are
+    simulated at full resolution from the start of that interval; if the
+    battery survives, the extrapolation resumes from the replayed SOC.
+    The cache is filled per `block_days` of horizon (see `IntervalCache`).
+
+    Returns a dict with `time`/`soc` at the interval boundaries (and the
+    replayed steps), `lifetime` (s or None) and cache/replay statistics.
+    """
+    dt = float(settings['sim_step'])
+    if n_steps is None:
+        n_steps = int(settings['sim_len'] / dt)
+    if soc_init is None:
+        soc_init = float(settings['soc_init'])
+    if luts is None:
+        luts = load_luts()
+    interval = int(round(TRACE_PERIOD / dt))
+    if g is None:
+        g = load_irradiance(n_steps, sim_step=dt)
+    replay_len = max(interval, replay_len // interval * interval)
+
+    period = int(settings['period'])
+    starts = np.arange(0, n_steps, interval)
+    g_levels, g_idx = np.unique(g[starts], return_inverse=True)
+    phases = sorted(set((starts % period).tolist()))
+    first_seen = np.full(g_levels.size, starts.size)
+    np.minimum.at(first_seen, g_idx, np.arange(starts.size))
+    blocks = first_seen // max(1, int(block_days * 86400 / (interval * dt)))
+    starts, g_idx = starts.tolist(), g_idx.tolist()
+    cache = IntervalCache(settings, g_levels, phases, n_pv=n_pv, n_batt=n_batt,
+                          luts=luts, soc_res=soc_res, interval=interval,
+                          blocks=blocks)
+
+    times, socs = [0.0], [soc_init]
+    soc = soc_init
+    life = None
+    replayed = 0
+    i = 0
+    while i < len(starts):
+        k0 = starts[i]
+        delta = cache.lookup(g_idx[i], k0 % period, soc)[0]
+        # Voc (hence the current) follows the SOC inside the interval:
+        # evaluate at the mid-interval SOC (midpoint rule)
+        delta, drop, rise = cache.lookup(g_idx[i], k0 % period, soc - delta / 2)
+        if soc - drop <= DEATH_SOC + guard:
+            k_end = min(k0 + replay_len, n_steps)
+            res = simulate(settings, n_steps=k_end, n_pv=n_pv, n_batt=n_batt,
+                           soc_init=soc, g=g, luts=luts, k_start=k0,
+                           chunk=4 * interval)
+            replayed += res['time'].size
+            times.extend(res['time'][1:])
+            socs.extend(res['soc'][1:])
+            if res['lifetime'] is not None:
+                life = res['lifetime']
+                break
+            soc = res['soc_end']
+            i += (k_end - k0) // interval
+            continue
+
+        # one-sided reflection at SOC = 1 (battery_voc clamps tmpsoc)
+        soc = (soc - delta - max(0.0, soc + rise - 1.0)) * cache.a_interval
+        i += 1
+        times.append(min(k0 + interval, n_steps) * dt)
+        socs.append(soc)
+
+    return {
+        'time': np.asarray(times), 'soc': np.asarray(socs), 'lifetime': life,
+        'cache_misses': cache.misses, 'cache_hits': cache.hits,
+        'replayed_steps': replayed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lifetime estimate by SOC extrapolation')
+    parser.add_argument('-f', '--input-file', type=str, metavar='PATH', required=True,
+                        help='Path to JSON input simulation settings')
+    parser.add_argument('--n-pv', type=float, default=3.0,
+                        help='Number of PV panels on the bus')
+    parser.add_argument('--n-batt', type=float, default=1.0,
+                        help='Number of batteries (capacity multiplier)')
+    parser.add_argument('--soc-res', type=float, default=0.05,
+                        help='SOC bucket size of the interval cache')
+    args = parser.parse_args()
+
+    res = extrapolate_soc(load_settings(args.input_file), n_pv=args.n_pv,
+                          n_batt=args.n_batt, soc_res=args.soc_res)
+    if res['lifetime'] is None:
+        print(f"ALIVE after {res['time'][-1] / 86400:.2f} days, "
+              f"final SOC {res['soc'][-1] * 100:.1f}%")
+    else:
+        print(f"DEAD after {res['lifetime'] / 86400:.2f} days")
+    print(f"cache: {res['cache_misses']} buckets filled, {res['cache_hits']} hits; "
+          f"{res['replayed_steps']} steps replayed")
@@ -0,0 +1,218 @@
+"""
+Indexed view of a simulator trace for window and threshold queries.
+
+The time column of a trace is sorted, so a time window is two
+`searchsorted` calls and comes back as a slice of the original arrays (no
+boolean mask over every row, no copy). For a signal such as the SOC the
+index also keeps its monotone segments (start/end row, min, max): a
+threshold crossing is looked up among the segments and then located inside
+its segment by binary search, O(log n) per segment instead of a full scan.
+Building the index costs one vectorised pass over the columns it is asked
+about; every query after that is independent of the trace length.
+
+    from trace_reader import read_trace
+    from trace_index import TraceIndex
+
+    df = read_trace('sim_trace.txt')
+    idx = TraceIndex(df)
+    idx.frame(3 * 3600, 5 * 3600)         # rows with 3 h <= time <= 5 h (view)
+    idx.column('soc', 10, None)           # numpy view of soc from t = 10 s
+    idx.first_crossing('soc', 0.0101)     # (row, time) of the first soc <= 1.01%
+    idx.crossings('soc', 0.5, 'up')       # every row where soc rises to 50%
+
+Usage (from lab3/scripts/):
+    python trace_index.py sim_trace.txt --signal soc --level 0.0101 --start 10
+"""
+import argparse
+import os
+import sys
+import time as _time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+from emiot_tools import timed  # noqa: E402
+
+__all__ = ['TIME_COLUMNS', 'Segments', 'TraceIndex']
+
+TIME_COLUMNS = ('%time', 'time')
+
+
+class Segments:
+    """
+    Monotone runs of one signal. Run k covers rows start[k]..end[k]
+    (inclusive; consecutive runs share their turning point) and is
+    non-decreasing if rising[k], non-increasing otherwise.
+    """
+
+    @timed('trace.segments')
+    def __init__(self, x):
+        n = len(x)
+        if n < 2:
+            self.start = self.end = np.zeros(min(n, 1), dtype=np.int64)
+            self.rising = np.ones(min(n, 1), dtype=bool)
+        else:
+            s = np.sign(np.diff(x))
+            # flat steps take the direction of the step before them
+            nz = np.flatnonzero(s)
+            if nz.size:
+                fill = np.maximum.accumulate(np.where(s != 0, np.arange(s.size), 0))
+                s = s[fill]
+                s[:nz[0]] = s[nz[0]]
+            turns = np.flatnonzero(s[1:] != s[:-1]) + 1
+            self.start = np.concatenate(([0], turns)).astype(np.int64)
+            self.end = np.concatenate((turns, [n - 1])).astype(np.int64)
+            self.rising = s[self.start] >= 0
+        first, last = x[self.start], x[self.end]
+        self.min = np.minimum(first, last)
+        self.max = np.maximum(first, last)
+        # running extremes, for the first crossing from the start of the trace
+        self._cummin = np.minimum.accumulate(self.min)
+        self._cummax = np.maximum.accumulate(self.max)
+
+    def __len__(self):
+        return len(self.start)
+
+    def containing(self, row):
+        """Index of the first segment that reaches `row`."""
+        return int(np.searchsorted(self.end, row, side='left'))
+
+
+class TraceIndex:
+    """
+    Window and threshold queries on a trace with a sorted time column.
+
+    `trace` is a DataFrame from `read_trace` (with `%time` or `time`) or
+    a `BinaryTrace`; columns are taken as numpy views and never copied.
+    """
+
+    def __init__(self, trace, time_column=None):
+        if time_column is None:
+            time_column = next((c for c in TIME_COLUMNS if c in trace), None)
+            if time_column is None:
+                raise ValueError('trace has no time column')
+        self.trace = trace
+        self.time = np.asarray(trace[time_column], dtype=float)
+        if self.time.size > 1 and np.any(self.time[1:] < self.time[:-1]):
+            raise ValueError(f'{time_column} is not sorted')
+        self._columns = {}
+        self._segments = {}
+
+    def __len__(self):
+        return self.time.size
+
+    def __getitem__(self, name):
+        """Whole column as a numpy array (a view of the DataFrame data)."""
+        if name not in self._columns:
+            self._columns[name] = np.asarray(self.trace[name])
+        return self._columns[name]
+
+    def rows(self, t0=None, t1=None):
+        """slice of the rows with t0 <= time <= t1 (None: open end)."""
+        i0 = 0 if t0 is None else int(np.searchsorted(self.time, t0, side='left'))
+        i1 = self.time.size if t1 is None else int(np.searchsorted(self.time, t1, side='right'))
+        return slice(i0, max(i0, i1))
+
+    def row_at(self, t):
+        """Last row with time <= t (the sample held at `t`)."""
+        return max(int(np.searchsorted(self.time, t, side='right')) - 1, 0)
+
+    def column(self, name, t0=None, t1=None):
+        """View of `name` over a time window."""
+        return self[name][self.rows(t0, t1)]
+
+    def frame(self, t0=None, t1=None):
+        """Rows of the DataFrame over a time window (positional slice)."""
+        return self.trace.iloc[self.rows(t0, t1)]
+
+    def segments(self, name):
+        """Monotone segments of `name`, built on first use."""
+        if name not in self._segments:
+            self._segments[name] = Segments(self[name])
+        return self._segments[name]
+
+    def _search(self, name, k, level, direction, lo=None):
+        # first row of segment k (from row `lo`) at or past `level`; the
+        # segment is monotone, so this is one binary search
+        seg = self.segments(name)
+        a = int(seg.start[k]) if lo is None else lo
+        x = self[name][a:int(seg.end[k]) + 1]
+        if seg.rising[k] != (direction == 'up'):
+            return a  # moving away from the level: only its first row can pass
+        if direction == 'up':
+            return a + int(np.searchsorted(x, level, side='left'))
+        return a + int(np.searchsorted(-x, -level, side='left'))
+
+    def first_crossing(self, name, level, direction='down', start=None):
+        """
+        (row, time) of the first sample at or after time `start` where
+        `name` <= level ('down') or >= level ('up'); None if it never does.
+        """
+        seg = self.segments(name)
+        row0 = 0 if start is None else self.rows(start).start
+        if row0 >= len(self):
+            return None
+        x = self[name]
+        passed = (lambda v: v <= level) if direction == 'down' else (lambda v: v >= level)
+        k0 = seg.containing(row0)
+        if passed(x[seg.end[k0]]) or passed(x[row0]):
+            row = self._search(name, k0, level, direction, lo=row0)
+            return row, float(self.time[row])
+
+        # first later segment that reaches the level; the running extreme is
+        # monotone, so it is a binary search unless an earlier segment (before
+        # `start`) already reached it
+        if direction == 'down':
+            k = int(np.searchsorted(-seg._cummin, -level, side='left'))
+        else:
+            k = int(np.searchsorted(seg._cummax, level, side='left'))
+        if k <= k0:
+            hit = passed(seg.min[k0 + 1:] if direction == 'down' else seg.max[k0 + 1:])
+            k = k0 + 1 + int(np.argmax(hit)) if hit.any() else len(seg)
+        if k >= len(seg):
+            return None
+        row = self._search(name, k, level, direction)
+        return row, float(self.time[row])
+
+    def crossings(self, name, level, direction='down', t0=None, t1=None):
+        """Rows where `name` passes `level` going down (or up) within a window."""
+        seg = self.segments(name)
+        x = self[name]
+        if direction == 'down':
+            cand = np.flatnonzero(~seg.rising & (x[seg.start] > level) & (x[seg.end] <= level))
+        else:
+            cand = np.flatnonzero(seg.rising & (x[seg.start] < level) & (x[seg.end] >= level))
+        rows = np.array([self._search(name, k, level, direction) for k in cand], dtype=np.int64)
+        window = self.rows(t0, t1)
+        return rows[(rows >= window.start) & (rows < window.stop)]
+
+
+if __name__ == '__main__':
+    from trace_reader import read_trace
+
+    parser = argparse.ArgumentParser(description='Threshold and window queries on a trace')
+    parser.add_argument('trace', type=str, nargs='?', default='sim_trace.txt')
+    parser.add_argument('--signal', type=str, default='soc')
+    parser.add_argument('--level', type=float, default=0.0101)
+    parser.add_argument('--direction', choices=('down', 'up'), default='down')
+    parser.add_argument('--start', type=float, default=10.0,
+                        help='Ignore samples before this time (s)')
+    args = parser.parse_args()
+
+    df = read_trace(args.trace)
+    tic = _time.perf_counter()
+    idx = TraceIndex(df)
+    idx.segments(args.signal)
+    build = _time.perf_counter() - tic
+
+    tic = _time.perf_counter()
+    hit = idx.first_crossing(args.signal, args.level, args.direction, args.start)
+    query = _time.perf_counter() - tic
+    print(f'{len(idx)} rows, {len(idx.segments(args.signal))} monotone segments of '
+          f'{args.signal} (index built in {build * 1e3:.1f} ms)')
+    if hit is None:
+        print(f'{args.signal} never reaches {args.level} ({query * 1e6:.0f} us)')
+    else:
+        print(f'first {args.signal} {"<=" if args.direction == "down" else ">="} {args.level}: '
+              f'row {hit[0]}, t = {hit[1]:.0f} s = {hit[1] / 86400:.2f} days '
+              f'({query * 1e6:.0f} us)')
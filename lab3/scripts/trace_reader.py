@@ -0,0 +1,175 @@
+"""
+Reader for the simulator traces, tabular (sim_trace.txt) or binary
+change-only (sim_trace.bin, codegen.py --trace-format binary).
+
+The binary file is memory-mapped and only the block headers are read when
+it is opened; a signal is expanded to a dense NumPy column the first time
+it is accessed. `read_trace` returns the same DataFrame for both formats
+(first column `%time`), so the analysis scripts do not care which one the
+simulator produced.
+
+    from trace_reader import read_trace
+    df = read_trace('sim_trace.txt')    # falls back to sim_trace.bin
+
+    trace = BinaryTrace('sim_trace.bin')
+    trace['soc']                        # dense column, lazily expanded
+    trace.changes('i_mcu')              # (time, value) of the changes only
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+from emiot_tools import stage, timed  # noqa: E402
+
+__all__ = ['MAGIC', 'BinaryTrace', 'is_binary_trace', 'resolve_trace', 'trace_columns',
+           'read_trace']
+
+MAGIC = b'EMTR'
+END_BLOCK = 0xFFFF
+
+_HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('n_signals', '<u2'),
+                    ('value_size', '<u2'), ('reserved', '<u2'),
+                    ('sim_step', '<f8'), ('decimation', '<u4')])
+_BLOCK = np.dtype([('id', '<u2'), ('n_runs', '<u4'), ('n_values', '<u4')])
+
+
+def is_binary_trace(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def resolve_trace(path):
+    """`path` if it exists, else the same name with the .bin suffix."""
+    if not os.path.exists(path):
+        alt = os.path.splitext(path)[0] + '.bin'
+        if os.path.exists(alt):
+            return alt
+    return path
+
+
+class BinaryTrace:
+    """Lazy view of a binary change-only trace."""
+
+    def __init__(self, path):
+        self.path = path
+        self._buf = np.memmap(path, dtype=np.uint8, mode='r')
+        head = self._buf[:_HEADER.itemsize].view(_HEADER)[0]
+        if head['magic'] != MAGIC:
+            raise ValueError(f'{path}: not a binary trace')
+        self.sim_step = float(head['sim_step'])
+        self.decimation = int(head['decimation'])
+        self._value_dtype = np.dtype('<f4' if head['value_size'] == 4 else '<f8')
+
+        pos = _HEADER.itemsize
+        self.columns = []
+        for _ in range(head['n_signals']):
+            n = int(self._buf[pos])
+            self.columns.append(bytes(self._buf[pos + 1:pos + 1 + n]).decode())
+            pos += 1 + n
+
+        # block index: signal id -> [(runs offset, n_runs, values offset, n_values)]
+        self._blocks = {i: [] for i in range(len(self.columns))}
+        self.n_samples = None
+        while pos + _BLOCK.itemsize <= self._buf.size:
+            blk = self._buf[pos:pos + _BLOCK.itemsize].view(_BLOCK)[0]
+            pos += _BLOCK.itemsize
+            if blk['id'] == END_BLOCK:
+                self.n_samples = int(blk['n_values'])
+                break
+            runs_at = pos
+            values_at = runs_at + 8 * int(blk['n_runs'])
+            pos = values_at + self._value_dtype.itemsize * int(blk['n_values'])
+            if pos > self._buf.size:
+                break  # truncated block of a killed simulation
+            self._blocks[int(blk['id'])].append(
+                (runs_at, int(blk['n_runs']), values_at, int(blk['n_values'])))
+
+        if self.n_samples is None:
+            # no closing block: the simulation did not end cleanly
+            last = [self._change_samples(i)[-1] for i in self._blocks if self._blocks[i]]
+            self.n_samples = int(max(last)) + 1 if last else 0
+        self._dense = {}
+
+    def __len__(self):
+        return self.n_samples
+
+    def __contains__(self, name):
+        return name in self.columns or name in ('time', '%time')
+
+    @property
+    def time(self):
+        return np.arange(self.n_samples) * (self.decimation * self.sim_step)
+
+    def _change_samples(self, i):
+        # sample index of every stored value of signal i (runs expanded)
+        parts = []
+        for runs_at, n_runs, _, _ in self._blocks[i]:
+            runs = self._buf[runs_at:runs_at + 8 * n_runs].view('<u4').reshape(-1, 2)
+            start, length = runs[:, 0].astype(np.int64), runs[:, 1].astype(np.int64)
+            # first sample of each run repeated along it, plus 0..len-1
+            offset = np.repeat(start - np.cumsum(length) + length, length)
+            parts.append(offset + np.arange(length.sum()))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _values(self, i):
+        parts = [self._buf[at:at + self._value_dtype.itemsize * n].view(self._value_dtype)
+                 for _, _, at, n in self._blocks[i]]
+        return np.concatenate(parts) if parts else np.empty(0, self._value_dtype)
+
+    def changes(self, name):
+        """(time, value) of the samples where `name` changed (sparse)."""
+        i = self.columns.index(name)
+        samples = self._change_samples(i)
+        return samples * (self.decimation * self.sim_step), self._values(i).astype(float)
+
+    def __getitem__(self, name):
+        """Dense column (one value per sample, float64)."""
+        if name in ('time', '%time'):
+            return self.time
+        if name not in self._dense:
+            with stage('trace.expand'):
+                i = self.columns.index(name)
+                samples, values = self._change_samples(i), self._values(i)
+                # value held from each change to the next one
+                col = np.full(self.n_samples, np.nan)
+                samples = samples[samples < self.n_samples]
+                if samples.size:
+                    hold = np.diff(samples, append=self.n_samples)
+                    col[samples[0]:] = np.repeat(values[:samples.size].astype(float), hold)
+            self._dense[name] = col
+        return self._dense[name]
+
+    def to_dataframe(self, columns=None):
+        """DataFrame with the columns of the tabular trace (`%time` first)."""
+        if columns is None:
+            columns = self.columns
+        data = {'%time': self.time}
+        data.update((c, self[c]) for c in columns if c not in ('time', '%time'))
+        return pd.DataFrame(data)
+
+
+def trace_columns(path):
+    """Signal names of a trace (`%time` first), read from its header only."""
+    path = resolve_trace(path)
+    if is_binary_trace(path):
+        return ['%time'] + BinaryTrace(path).columns
+    with open(path) as f:
+        return f.readline().split()
+
+
+@timed('trace.read')
+def read_trace(path, columns=None):
+    """
+    Load a simulator trace as a DataFrame, whatever its format.
+
+    `columns` selects signals (`%time` is always included). A missing
+    `sim_trace.txt` is looked up as `sim_trace.bin`.
+    """
+    path = resolve_trace(path)
+    if is_binary_trace(path):
+        return BinaryTrace(path).to_dataframe(columns)
+    usecols = None if columns is None else ['%time'] + [c for c in columns if c != '%time']
+    return pd.read_csv(path, sep=r'\s+', usecols=usecols)
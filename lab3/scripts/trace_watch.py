@@ -0,0 +1,361 @@
+"""
+Live analysis of sim_trace.txt while the simulator is still writing it.
+
+An asyncio task tails the tabular trace, parses the new rows in batches
+and keeps running metrics: SOC minimum, energy integrals, battery
+converter efficiency histograms and a death-time prediction from the
+trend of the daily SOC minima. The watcher can start the simulator itself
+(`--run`) or attach to a running one (`--pid`), and stops it as soon as
+the answer is known:
+
+- death:       SOC reached the death threshold;
+- survival:    for `--patience` days, the SOC minimum over the last
+               `--window` days (one full weather cycle) stays above the
+               threshold and, at its decline from the window before, would
+               not reach it before the end of the simulation (`--sim-len`);
+- prediction:  the predicted death time is stable for `--patience` days.
+
+The simulator itself stops as soon as SOC <= 1%, and the traced soc is one
+step late, so the last traced sample is usually just above the threshold:
+a run that exits early with SOC within one step of it is reported as dead.
+
+Usage (from lab3-em4iot/simulator/, after make):
+    python ../../scripts/trace_watch.py sim_trace.txt --stop-on death prediction --run ./bin/run.x
+    python ../../scripts/trace_watch.py sim_trace.txt --pid 12345
+"""
+import argparse
+import asyncio
+import os
+import signal
+import time
+
+import numpy as np
+
+__all__ = ['DEATH_SOC', 'SIM_LEN', 'WINDOW_DAYS', 'STOP_REASONS', 'RunningMetrics', 'follow',
+           'watch']
+
+DEATH_SOC = 0.01
+SIM_LEN = 7736400
+# the irradiance of input_files/gmonths.txt repeats a 15-day weather pattern
+WINDOW_DAYS = 15
+STOP_REASONS = ('death', 'survival', 'prediction')
+EFF_BINS = np.linspace(0, 100, 51)
+
+
+class RunningMetrics:
+    """Metrics of a trace fed batch by batch (columns from the header)."""
+
+    def __init__(self, vref=3.3, death_soc=DEATH_SOC, trend_days=7):
+        self.vref = vref
+        self.death_soc = death_soc
+        self.trend_days = trend_days
+        self.columns = None
+        self.rows = 0
+        self.time = 0.0
+        self.soc = None
+        self.step = 0.0              # time step of the trace (s)
+        self.soc_step = 0.0          # largest SOC drop between two samples
+        self.soc_min = np.inf
+        self.soc_min_time = None
+        self.death_time = None
+        # energy integrals (mA * V * s = mJ), trapezoid over the trace rows
+        self.energy = {'load': 0.0, 'pv': 0.0, 'battery_out': 0.0, 'battery_in': 0.0}
+        self.eff_discharge = np.zeros(EFF_BINS.size - 1, dtype=int)
+        self.eff_charge = np.zeros(EFF_BINS.size - 1, dtype=int)
+        self.daily_min = []          # SOC minimum of every completed day
+        self.predictions = []        # predicted death time after every day
+        self._day = 0
+        self._day_min = np.inf
+        self._last = None            # last row, to bridge the integrals
+
+    def set_columns(self, header):
+        self.columns = {name.lstrip('%'): j for j, name in enumerate(header.split())}
+
+    def _col(self, data, name):
+        return data[:, self.columns[name]]
+
+    def feed(self, data):
+        """Update with a (rows x columns) array of new trace rows."""
+        if data.size == 0:
+            return
+        t = self._col(data, 'time')
+        soc = self._col(data, 'soc')
+        # the soc signal is delayed: its first sample is the TDF initial value
+        valid = t > 0
+        prev = [self.soc] if self.soc is not None and self.time > 0 else []
+        s = np.concatenate((prev, soc[valid]))
+        if s.size >= 2:
+            self.soc_step = max(self.soc_step, float(np.max(s[:-1] - s[1:])))
+        if len(t) >= 2:
+            self.step = float(t[-1] - t[-2])
+        self.rows += len(data)
+        self.time = float(t[-1])
+        self.soc = float(soc[-1])
+        if valid.any():
+            i = int(np.argmin(np.where(valid, soc, np.inf)))
+            if soc[i] < self.soc_min:
+                self.soc_min, self.soc_min_time = float(soc[i]), float(t[i])
+            dead = valid & (soc <= self.death_soc)
+            if self.death_time is None and dead.any():
+                self.death_time = float(t[np.argmax(dead)])
+
+        i_tot, real_i_pv = self._col(data, 'i_tot'), self._col(data, 'real_i_pv')
+        p = {
+            'load': (i_tot + real_i_pv) * self.vref,
+            'pv': real_i_pv * self.vref,
+            'battery_out': np.maximum(self._col(data, 'i_batt'), 0) * self._col(data, 'v_batt'),
+            'battery_in': np.maximum(-self._col(data, 'i_batt'), 0) * self._col(data, 'v_batt'),
+        }
+        tt = t if self._last is None else np.concatenate(([self._last[0]], t))
+        for key, val in p.items():
+            if self._last is not None:
+                val = np.concatenate(([self._last[1][key]], val))
+            self.energy[key] += float(np.sum((val[1:] + val[:-1]) * np.diff(tt)) / 2)
+        self._last = (t[-1], {key: val[-1] for key, val in p.items()})
+
+        # battery converter efficiencies, as in the part3 analysis scripts
+        p_bus = np.abs(i_tot) * self.vref
+        p_batt = np.abs(self._col(data, 'i_batt')) * self._col(data, 'v_batt')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dis = (i_tot > 0) & (p_batt > 1e-6)
+            self.eff_discharge += np.histogram(p_bus[dis] / p_batt[dis] * 100, EFF_BINS)[0]
+            chg = (i_tot < 0) & (p_batt > 1e-6)
+            self.eff_charge += np.histogram(p_bus[chg] / p_batt[chg] * 100, EFF_BINS)[0]
+
+        # daily SOC minima (a batch can span several days)
+        day = (t // 86400).astype(int)
+        for d in np.unique(day[valid]):
+            m = float(soc[valid & (day == d)].min())
+            if d != self._day:
+                self._close_day()
+                self._day = d
+            self._day_min = min(self._day_min, m)
+
+    def _close_day(self):
+        if np.isfinite(self._day_min):
+            self.daily_min.append(self._day_min)
+            self.predictions.append(self.predict_death())
+        self._day_min = np.inf
+
+    def predict_death(self):
+        """Death time (s) from the linear trend of the last daily minima, or None."""
+        mins = np.array(self.daily_min[-self.trend_days:])
+        if mins.size < 2:
+            return None
+        slope, _ = np.polyfit(np.arange(mins.size), mins, 1)
+        if slope >= 0:
+            return None
+        days_left = (mins[-1] - self.death_soc) / -slope
+        # day len - 1 is the one whose minimum is mins[-1]
+        return (len(self.daily_min) - 1 + days_left) * 86400
+
+    def dead(self):
+        return self.death_time is not None
+
+    def finish(self, sim_len=SIM_LEN):
+        """
+        The simulator exited by itself. It stops at SOC <= death_soc one step
+        before that value is traced, so an early exit with SOC within one
+        step of the threshold is the death (at the last traced time).
+        """
+        if (self.death_time is None and self.soc is not None
+                and self.time + 2 * self.step < sim_len
+                and self.soc - self.death_soc <= self.soc_step):
+            self.death_time = self.time
+
+    def survives(self, patience, sim_len, window=WINDOW_DAYS):
+        """
+        For each of the last `patience` days, the SOC minimum over the last
+        `window` days is above the threshold and, extrapolating its decline
+        from the `window` days before, stays above it until `sim_len`.
+        A flat or rising 7-day trend is not enough: a few sunny days show
+        one while the battery still loses charge over a weather cycle.
+        """
+        mins = self.daily_min
+        if len(mins) < 2 * window + patience - 1:
+            return False
+        for end in range(len(mins) - patience + 1, len(mins) + 1):
+            last = min(mins[end - window:end])
+            decline = min(mins[end - 2 * window:end - window]) - last
+            if last <= self.death_soc:
+                return False
+            if decline > 0 and end + (last - self.death_soc) / decline * window <= sim_len / 86400:
+                return False
+        return True
+
+    def prediction_stable(self, patience, rel_tol):
+        preds = self.predictions[-patience:]
+        if len(preds) < patience or any(p is None for p in preds):
+            return False
+        return (max(preds) - min(preds)) / max(preds) < rel_tol
+
+    def summary(self):
+        pred = self.predict_death()
+        pred = f'{pred / 86400:.2f} d' if pred is not None else '-'
+        return (f"t={self.time / 86400:7.2f} d  soc={self.soc:.4f}  "
+                f"min={self.soc_min:.4f}  E_load={self.energy['load'] / 3.6e6:.3f} Wh  "
+                f"E_pv={self.energy['pv'] / 3.6e6:.3f} Wh  death~{pred}")
+
+
+async def follow(path, poll=0.5, done=None):
+    """
+    Yield lists of new complete lines of a growing file. Waits for the file
+    to appear; returns once `done` (an asyncio.Event) is set and the file
+    has been read to the end.
+    """
+    while not os.path.exists(path):
+        if done is not None and done.is_set():
+            return
+        await asyncio.sleep(poll)
+    with open(path, 'r') as f:
+        partial = ''
+        while True:
+            chunk = f.read(1 << 22)
+            if chunk:
+                lines = (partial + chunk).split('\n')
+                partial = lines.pop()  # incomplete last line, completed later
+                if lines:
+                    yield lines
+            elif done is not None and done.is_set():
+                return
+            else:
+                await asyncio.sleep(poll)
+
+
+def _parse(lines, metrics):
+    rows = []
+    for line in lines:
+        if line.startswith('%'):
+            metrics.set_columns(line)
+        elif line.strip():
+            rows.append(line)
+    if not rows or metrics.columns is None:
+        return np.empty((0, 0))
+    n = len(metrics.columns)
+    data = np.fromstring(' '.join(rows), sep=' ')
+    if data.size != n * len(rows):
+        # a malformed row (e.g. the simulator was killed mid-write)
+        rows = [r for r in rows if len(r.split()) == n]
+        data = np.fromstring(' '.join(rows), sep=' ')
+    return data.reshape(-1, n)
+
+
+async def watch(path, metrics=None, proc=None, pid=None, stop_on=('death',),
+                patience=3, rel_tol=0.01, sim_len=SIM_LEN, poll=0.5, report=86400,
+                window=WINDOW_DAYS):
+    """
+    Follow `path` until the simulation ends or a stop condition in
+    `stop_on` holds; then stop `proc` (asyncio subprocess) or `pid`.
+    Returns `(metrics, reason)`, reason None if the run ended by itself
+    (or 'death' if it stopped itself at the death threshold).
+    """
+    if metrics is None:
+        metrics = RunningMetrics()
+    done = asyncio.Event()
+
+    async def wait_end():
+        if proc is not None:
+            await proc.wait()
+        elif pid is not None:
+            while _alive(pid):
+                await asyncio.sleep(poll)
+        else:
+            return  # nothing to wait for: follow until interrupted
+        done.set()
+
+    waiter = asyncio.create_task(wait_end())
+    reason = None
+    next_report = report
+    async for lines in follow(path, poll, done):
+        metrics.feed(_parse(lines, metrics))
+        if metrics.soc is None:
+            continue
+        if metrics.time >= next_report:
+            print(metrics.summary(), flush=True)
+            next_report = (metrics.time // report + 1) * report
+        if 'death' in stop_on and metrics.dead():
+            reason = 'death'
+        elif 'survival' in stop_on and metrics.survives(patience, sim_len, window):
+            reason = 'survival'
+        elif 'prediction' in stop_on and metrics.prediction_stable(patience, rel_tol):
+            reason = 'prediction'
+        if reason is not None:
+            _stop(proc, pid)
+            break
+    waiter.cancel()
+    if reason is None and done.is_set():
+        metrics.finish(sim_len)
+        if metrics.dead():
+            reason = 'death'
+    return metrics, reason
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _stop(proc, pid):
+    # the rows still buffered by the simulator are lost, the answer is known
+    if proc is not None and proc.returncode is None:
+        proc.terminate()
+    elif pid is not None and _alive(pid):
+        os.kill(pid, signal.SIGTERM)
+
+
+async def _main(args):
+    proc = None
+    if args.run:
+        # never mistake the trace of a previous run for the new one
+        if os.path.exists(args.trace):
+            os.remove(args.trace)
+        proc = await asyncio.create_subprocess_exec(*args.run)
+    t0 = time.perf_counter()
+    metrics, reason = await watch(args.trace, RunningMetrics(death_soc=args.death_soc),
+                                  proc, args.pid, args.stop_on, args.patience,
+                                  args.rel_tol, args.sim_len, args.poll,
+                                  window=args.window)
+    if proc is not None:
+        await proc.wait()
+
+    print('-' * 40)
+    print(metrics.summary())
+    status = f'stopped early ({reason})' if reason else 'run completed'
+    print(f"{status} after {time.perf_counter() - t0:.1f} s wall, {metrics.rows} rows")
+    if metrics.dead():
+        print(f"DEAD at {metrics.death_time / 86400:.2f} days ({metrics.death_time:.0f} s)")
+    elif metrics.predict_death() is not None:
+        print(f"predicted death: {metrics.predict_death() / 86400:.2f} days")
+    n = metrics.eff_discharge.sum()
+    if n:
+        centers = (EFF_BINS[:-1] + EFF_BINS[1:]) / 2
+        print(f"mean discharge efficiency: {np.sum(centers * metrics.eff_discharge) / n:.2f}%")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Follow a growing sim_trace.txt')
+    parser.add_argument('trace', type=str, help='Trace file to follow')
+    parser.add_argument('--run', nargs=argparse.REMAINDER,
+                        help='Start this simulator command and follow its trace')
+    parser.add_argument('--pid', type=int, help='Attach to a running simulator')
+    parser.add_argument('--stop-on', nargs='*', choices=STOP_REASONS, default=['death'],
+                        help='Conditions that stop the simulation early')
+    parser.add_argument('--death-soc', type=float, default=DEATH_SOC)
+    parser.add_argument('--patience', type=int, default=3,
+                        help='Days a metric must stay stable before stopping')
+    parser.add_argument('--rel-tol', type=float, default=0.01,
+                        help='Relative spread of death predictions considered stable')
+    parser.add_argument('--sim-len', type=float, default=SIM_LEN,
+                        help='Simulated time (s) of the run, for survival')
+    parser.add_argument('--window', type=int, default=WINDOW_DAYS,
+                        help='Days of one weather cycle, for survival')
+    parser.add_argument('--poll', type=float, default=0.5, help='Polling period (s)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,330 @@
+"""
+Single command-line entry point for the tools of the three labs.
+
+Only the standard library is imported at startup; NumPy, pandas,
+matplotlib, scikit-image and the lab modules are imported inside the
+subcommand that needs them, so cheap commands (help, `workload gen`,
+`workload stats`) start in a few tens of milliseconds and can be called
+from batch jobs thousands of times. Tools that already have their own
+command line (fleet_sim.py, psm_explorer.py, codegen.py, trace_watch.py,
+...) are run in-process with their arguments, paths are resolved against
+the current directory and the defaults point into the repository, so
+`emiot` works from anywhere. `--perf` / `--profile` switch on the
+per-stage instrumentation of tools/emiot_perf.py for the command and
+every tool it runs.
+
+Usage (from anywhere, `emiot` is the wrapper at the repository root):
+    emiot dpm sweep -wl lab1/workloads/workloads/workload_1.txt -t 0 101 5 --no-show
+    emiot dpm fleet -psm lab1/dpm-simulator/dpm-simulator/example/psm.txt --synthetic 1000
+    emiot workload gen --pattern 10:120000 10:4 --cycles 50 -o workload_hover.txt
+    emiot workload stats lab1/workloads/workloads/workload_1.txt
+    emiot codegen -f lab3/lab3-em4iot/sim_setting/parallel.json
+    emiot simulate lab3/lab3-em4iot/sim_setting/parallel.json --watch
+    emiot trace analyze sim_trace.txt
+    emiot image power scan lab2/test_images --ratio 0.05 -o power.csv
+    emiot --perf perf.jsonl --profile 'image.*' image power scan lab2/myscreen
+"""
+import argparse
+import os
+import sys
+
+__all__ = ['ROOT', 'SCRIPTS', 'build_parser', 'main']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOOLS_DIR = os.path.join(ROOT, 'tools')
+DPM_DIR = os.path.join(ROOT, 'lab1', 'dpm-simulator', 'dpm-simulator')
+WORKLOAD_DIR = os.path.join(ROOT, 'lab1', 'workloads', 'workloads')
+JUMPER_DIR = os.path.join(ROOT, 'lab1', 'extra_jumper', 'jumper')
+LAB2_DIR = os.path.join(ROOT, 'lab2')
+LAB3_SCRIPTS = os.path.join(ROOT, 'lab3', 'scripts')
+LAB3_SIM_DIR = os.path.join(ROOT, 'lab3', 'lab3-em4iot')
+CODEGEN_DIR = os.path.join(LAB3_SIM_DIR, 'simulator', 'codegen')
+
+# (group, command): (script, arguments put before the user's, help).
+# The script parses the remaining arguments itself (`emiot dpm fleet -h`).
+SCRIPTS = {
+    ('dpm', 'fleet'): (os.path.join(DPM_DIR, 'fleet_sim.py'), [],
+                       'Vectorized simulation of many devices (fleet_sim.py)'),
+    ('dpm', 'explore'): (os.path.join(DPM_DIR, 'psm_explorer.py'), [],
+                         'Rank PSM variants on workloads (psm_explorer.py)'),
+    ('workload', 'capture'): (os.path.join(JUMPER_DIR, 'gpio_capture.py'), ['capture'],
+                              'Jumper GPIO capture to a workload (gpio_capture.py)'),
+    ('workload', 'convert'): (os.path.join(JUMPER_DIR, 'gpio_capture.py'), ['convert'],
+                              'Jumper timestamp log to a workload (gpio_capture.py)'),
+    ('codegen', None): (os.path.join(CODEGEN_DIR, 'codegen.py'),
+                        ['-t', os.path.join(CODEGEN_DIR, 'templates'),
+                         '-o', os.path.join(LAB3_SIM_DIR, 'simulator')],
+                        'Generate the lab3 simulator sources (codegen.py)'),
+    ('trace', 'watch'): (os.path.join(LAB3_SCRIPTS, 'trace_watch.py'), [],
+                         'Follow a trace while it is written (trace_watch.py)'),
+    ('trace', 'query'): (os.path.join(LAB3_SCRIPTS, 'trace_index.py'), [],
+                         'Threshold crossing query on a trace (trace_index.py)'),
+    ('lifetime', 'surrogate'): (os.path.join(LAB3_SCRIPTS, 'harvest_surrogate.py'), [],
+                                'Fast lifetime estimate (harvest_surrogate.py)'),
+    ('lifetime', 'montecarlo'): (os.path.join(LAB3_SCRIPTS, 'lifetime_montecarlo.py'), [],
+                                 'Lifetime over irradiance scenarios (lifetime_montecarlo.py)'),
+    ('figures', None): (os.path.join(TOOLS_DIR, 'figure_farm.py'), [],
+                        'Render the report figures (figure_farm.py)'),
+    ('results', None): (os.path.join(TOOLS_DIR, 'results_store.py'), [],
+                        'Results store (results_store.py)'),
+}
+
+
+def run_script(path, argv):
+    """Run a tool script as `__main__` in this process, with `argv`."""
+    import runpy
+
+    sys.path.insert(0, os.path.dirname(path))
+    sys.argv = [path] + list(argv)
+    try:
+        runpy.run_path(path, run_name='__main__')
+    except SystemExit as e:
+        return e.code or 0
+    return 0
+
+
+# ==============================================================================
+# Commands implemented here
+# ==============================================================================
+def cmd_dpm_sweep(args, extra):
+    argv = ['-wl', os.path.abspath(args.wl), '-psm', os.path.abspath(args.psm),
+            '--sim', os.path.abspath(args.sim)]
+    if args.t:
+        argv += ['-t'] + [str(v) for v in args.t]
+    if args.db:
+        argv += ['--db', os.path.abspath(args.db), '--state', args.state]
+    if args.no_show:
+        argv.append('--no-show')
+    return run_script(os.path.join(DPM_DIR, 'run_all.py'), argv)
+
+
+def _pattern(text):
+    active, _, idle = text.partition(':')
+    try:
+        return float(active), float(idle)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected ACTIVE:IDLE (ms), got {text!r}')
+
+
+def cmd_workload_gen(args, extra):
+    sys.path.insert(0, WORKLOAD_DIR)
+    from get_workload import generate_file
+
+    generate_file(args.o, args.pattern * args.cycles)
+    return 0
+
+
+def cmd_workload_stats(args, extra):
+    # plain Python: no NumPy import for a few thousand lines
+    items = []
+    with open(args.workload) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 2:
+                items.append((float(fields[0]), float(fields[1])))
+    if not items:
+        print(f'{args.workload}: no work items')
+        return 1
+    idle = [b[0] - (a[0] + a[1]) for a, b in zip(items, items[1:])]
+    idle = sorted(t for t in idle if t > 0)
+    active = sum(d for _, d in items)
+    span = items[-1][0] + items[-1][1] - items[0][0]
+    print(f'{args.workload}: {len(items)} items over {span:.3f} ms, '
+          f'active {active:.3f} ms ({100 * active / span:.2f}%)')
+    if idle:
+        def pct(p):
+            return idle[min(int(p * len(idle)), len(idle) - 1)]
+        print(f'inactive periods: {len(idle)}, min {idle[0]:g}, median {pct(0.5):g}, '
+              f'p90 {pct(0.9):g}, max {idle[-1]:g} ms')
+        for t_be in args.breakeven:
+            share = sum(t for t in idle if t > t_be)
+            print(f'  > {t_be:g} ms: {sum(t > t_be for t in idle)} periods, '
+                  f'{100 * share / sum(idle):.1f}% of the inactive time')
+    return 0
+
+
+def cmd_simulate(args, extra):
+    import subprocess
+
+    settings = os.path.relpath(os.path.abspath(args.settings), LAB3_SIM_DIR)
+    env = dict(os.environ)
+    if args.watch:
+        env['WATCH'] = '1'
+    return subprocess.call(['bash', 'simulate.sh', settings] + extra, cwd=LAB3_SIM_DIR, env=env)
+
+
+def cmd_trace_analyze(args, extra):
+    sys.path.insert(0, LAB3_SCRIPTS)
+    import numpy as np
+    from trace_index import TraceIndex
+    from trace_reader import read_trace
+
+    df = read_trace(args.trace)
+    idx = TraceIndex(df)
+    rows = idx.rows(args.start, None)
+    t, soc = idx.time[rows], idx['soc'][rows]
+    print(f'{args.trace}: {len(idx)} rows, {t[0]:.0f} s to {t[-1]:.0f} s '
+          f'({t[-1] / 86400:.2f} days)')
+    print(f'SOC: start {soc[0]:.4f}, min {soc.min():.4f}, final {soc[-1]:.4f}')
+    dead = idx.first_crossing('soc', args.death_soc, start=args.start)
+    if dead is None:
+        print(f'alive: SOC stays above {args.death_soc}')
+    else:
+        print(f'dead: SOC <= {args.death_soc} at t = {dead[1]:.0f} s ({dead[1] / 86400:.2f} days)')
+    if 'i_tot' in df:
+        print(f"battery discharging {100 * np.count_nonzero(idx['i_tot'][rows] > 0) / len(t):.1f}% "
+              f"of the time")
+    return 0
+
+
+def cmd_image_power_scan(args, extra):
+    sys.path.insert(0, LAB2_DIR)
+    from image_corpus import iter_images
+    from image_power import compute_power, estimate_power
+
+    rows = []
+    for name, img in iter_images(args.folder, limit=args.limit):
+        power = (compute_power(img) if args.ratio is None else
+                 estimate_power(img, ratio=args.ratio)[0])
+        rows.append((name, img.shape[1], img.shape[0], power))
+        print(f'{name:40s} {img.shape[1]:5d}x{img.shape[0]:<5d} {power:.6e}')
+    if args.o:
+        with open(args.o, 'w') as f:
+            f.write('image,width,height,power\n')
+            f.writelines(f'{n},{w},{h},{p:.9e}\n' for n, w, h, p in rows)
+    if rows:
+        print(f'{len(rows)} images, mean power {sum(r[3] for r in rows) / len(rows):.6e}')
+    return 0
+
+
+# ==============================================================================
+# Parser
+# ==============================================================================
+def build_parser():
+    parser = argparse.ArgumentParser(prog='emiot', description='EMIoT lab tools')
+    parser.add_argument('--perf', type=str, metavar='FILE',
+                        help="Append a per-stage timing record to FILE ('-': stderr)")
+    parser.add_argument('--profile', type=str, metavar='STAGES',
+                        help='Profile these stages (comma-separated patterns, e.g. dpm.*)')
+    parser.add_argument('--profiler', choices=('cprofile', 'pyinstrument'), default='cprofile')
+    groups = parser.add_subparsers(dest='group', metavar='COMMAND')
+    subs = {}
+
+    def group(name, help):
+        subs[name] = groups.add_parser(name, help=help).add_subparsers(dest='command',
+                                                                       metavar='COMMAND')
+        return subs[name]
+
+    dpm = group('dpm', 'Lab1 DPM simulator')
+    sweep = dpm.add_parser('sweep', help='Timeout sweep with the C simulator (run_all.py)')
+    sweep.add_argument('-wl', type=str, default=os.path.join(WORKLOAD_DIR, 'workload_1.txt'),
+                       help='Workload file')
+    sweep.add_argument('-psm', type=str, default=os.path.join(DPM_DIR, 'example', 'psm.txt'),
+                       help='PSM file')
+    sweep.add_argument('-t', type=int, nargs=3, metavar=('START', 'STOP', 'STEP'),
+                       help='Timeout range (ms)')
+    sweep.add_argument('--sim', type=str, default=os.path.join(DPM_DIR, 'dpm_simulator'),
+                       help='Simulator executable')
+    sweep.add_argument('--db', type=str, help='Results store to append to')
+    sweep.add_argument('--state', type=str, default='sleep', choices=('idle', 'sleep'),
+                       help='State the timeout policy moves to, recorded in the results store')
+    sweep.add_argument('--no-show', action='store_true', help='Only save the plot')
+    sweep.set_defaults(func=cmd_dpm_sweep)
+
+    workload = group('workload', 'Lab1 workloads')
+    gen = workload.add_parser('gen', help='Workload from repeated active/idle patterns')
+    gen.add_argument('--pattern', type=_pattern, nargs='+', required=True, metavar='ACTIVE:IDLE',
+                     help='Active and idle durations (ms) of one cycle, in order')
+    gen.add_argument('--cycles', type=int, default=1, help='Repetitions of the pattern')
+    gen.add_argument('-o', type=str, default='workload_generated.txt', help='Output workload file')
+    gen.set_defaults(func=cmd_workload_gen)
+    stats = workload.add_parser('stats', help='Work items and inactive periods of a workload')
+    stats.add_argument('workload', type=str)
+    stats.add_argument('--breakeven', type=float, nargs='*', default=[0.783, 4.236],
+                       help='Inactive times to report the share above (ms; psm.txt Idle, Sleep)')
+    stats.set_defaults(func=cmd_workload_stats)
+
+    simulate = groups.add_parser('simulate', help='Codegen, build and run the lab3 simulator '
+                                                  '(simulate.sh; codegen flags are passed on)')
+    simulate.add_argument('settings', type=str, help='Settings JSON')
+    simulate.add_argument('--watch', action='store_true',
+                          help='Analyse the trace live while it runs (trace_watch.py)')
+    simulate.set_defaults(func=cmd_simulate, extra_ok=True)
+
+    trace = group('trace', 'Lab3 simulation traces')
+    analyze = trace.add_parser('analyze', help='SOC, lifetime and battery use of a trace')
+    analyze.add_argument('trace', type=str, nargs='?', default='sim_trace.txt')
+    analyze.add_argument('--death-soc', type=float, default=0.0101)
+    analyze.add_argument('--start', type=float, default=10.0,
+                         help='Ignore samples before this time (s)')
+    analyze.set_defaults(func=cmd_trace_analyze)
+
+    group('lifetime', 'Lab3 lifetime estimates')
+
+    image = group('image', 'Lab2 display images')
+    power = image.add_parser('power', help='OLED power model').add_subparsers(
+        dest='action', metavar='ACTION')
+    scan = power.add_parser('scan', help='Power of every image of a folder')
+    scan.add_argument('folder', type=str)
+    scan.add_argument('--limit', type=int, default=None, help='Only the first N images')
+    scan.add_argument('--ratio', type=float, default=None,
+                      help='Estimate on this fraction of the pixels (default: exact)')
+    scan.add_argument('-o', type=str, help='CSV output')
+    scan.set_defaults(func=cmd_image_power_scan)
+
+    # commands handled by the tool's own command line
+    for (name, command), (script, _, help) in SCRIPTS.items():
+        if command is None:
+            groups.add_parser(name, help=help, add_help=False)
+        else:
+            subs[name].add_parser(command, help=help, add_help=False)
+    return parser
+
+
+# options of emiot itself (before the command) -> environment of tools/emiot_perf.py
+GLOBAL_OPTIONS = {'--perf': 'EMIOT_PERF', '--profile': 'EMIOT_PROFILE',
+                  '--profiler': 'EMIOT_PROFILER'}
+
+
+def _command(argv):
+    """(stage name, function running the command) for the arguments after the options."""
+    # delegated tools get their arguments untouched (including -h)
+    for n in (2, 1):
+        key = tuple(argv[:n]) + (None,) * (2 - n)
+        if len(argv) >= n and key in SCRIPTS:
+            script, prefix, _ = SCRIPTS[key]
+            return '.'.join(argv[:n]), lambda: run_script(script, prefix + argv[n:])
+
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if not hasattr(args, 'func'):
+        # a group without its command: show the help of that group
+        parser.parse_args(argv[:1] + ['-h'] if argv else ['-h'])
+    if extra and not getattr(args, 'extra_ok', False):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    name = '.'.join(filter(None, (args.group, getattr(args, 'command', None),
+                                  getattr(args, 'action', None))))
+    return name, lambda: args.func(args, extra)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    while argv and argv[0] in GLOBAL_OPTIONS:
+        if len(argv) < 2:
+            build_parser().error(f'{argv[0]} needs a value')
+        os.environ[GLOBAL_OPTIONS[argv[0]]] = argv[1]
+        argv = argv[2:]
+    if 'EMIOT_PROFILE' in os.environ:
+        os.environ.setdefault('EMIOT_PERF', '-')
+
+    name, run = _command(argv)
+    if 'EMIOT_PERF' not in os.environ:
+        return run()
+    from emiot_tools import stage
+
+    with stage(f'emiot.{name}'):
+        return run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+Stage timers, counters and peak-memory sampling shared by the lab tools.
+
+Instrumentation is off unless `EMIOT_PERF` is set (to a JSON-lines file,
+or `-` for stderr); `stage()` and `count()` are then no-ops costing one
+attribute lookup. When on, every process appends one record at exit:
+
+    {"run": ..., "tool": "run_all.py", "wall_s": ..., "peak_rss_mb": ...,
+     "stages": {"dpm.simulate": {"calls": 101, "total_s": ..., "min_s": ...,
+                                 "max_s": ..., "peak_rss_mb": ...}, ...},
+     "counters": {"dpm.runs": 101, ...}}
+
+Stages nest (`trace.read` inside `emiot.trace.analyze`); each reports its
+own total time. The peak RSS of a stage is sampled by a background thread
+(every `EMIOT_PERF_INTERVAL` s, 0.01 by default) while the stage is open,
+so short stages may show the RSS at their start only. Processes started
+by a tool (or by simulate.sh through `emiot_perf.py run`) inherit
+`EMIOT_PERF_RUN`, so their records are grouped under the same run.
+
+`EMIOT_PROFILE` (comma-separated stage name patterns) profiles the
+matching stages with cProfile, or with pyinstrument if
+`EMIOT_PROFILER=pyinstrument`, into `EMIOT_PROFILE_DIR` (default
+`perf_profiles/`): one `<stage>.prof` / `<stage>.html` per stage, all its
+calls together.
+
+The lab modules import it through emiot_tools.py, which falls back to
+no-ops if this file cannot be imported.
+
+    from emiot_perf import count, stage
+    with stage('dpm.simulate'):
+        output = run_simulation(...)
+    count('dpm.runs')
+
+Usage (from the repository root):
+    EMIOT_PERF=perf.jsonl ./emiot dpm sweep -t 0 101 5 --no-show
+    python tools/emiot_perf.py report perf.jsonl
+    python tools/emiot_perf.py run make -- make -C lab3/lab3-em4iot/simulator
+"""
+import argparse
+import atexit
+import fnmatch
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+__all__ = ['enabled', 'stage', 'timed', 'count', 'snapshot', 'rss_mb', 'load_records',
+           'summarize']
+
+_ENV = os.environ.get('EMIOT_PERF')
+_PROFILE = [p for p in os.environ.get('EMIOT_PROFILE', '').split(',') if p]
+
+
+def enabled():
+    return _ENV is not None
+
+
+def rss_mb():
+    """Current resident set size of the process (MB)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        import resource  # no /proc: peak instead of current RSS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+class _Recorder:
+    def __init__(self):
+        import uuid
+
+        self.run = os.environ.setdefault('EMIOT_PERF_RUN', uuid.uuid4().hex[:12])
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.open = []                 # [name, peak rss] of the stages in progress
+        self.peak = rss_mb()
+        self.profilers = {}
+        self.profiling = False
+        self._lock = threading.Lock()
+        interval = float(os.environ.get('EMIOT_PERF_INTERVAL', 0.01))
+        threading.Thread(target=self._sample, args=(interval,), daemon=True).start()
+        atexit.register(self.emit)
+
+    def _sample(self, interval):
+        while True:
+            rss = rss_mb()
+            with self._lock:
+                self.peak = max(self.peak, rss)
+                for entry in self.open:
+                    entry[1] = max(entry[1], rss)
+            time.sleep(interval)
+
+    def add(self, name, seconds, peak):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                self.stages[name] = {'calls': 1, 'total_s': seconds, 'min_s': seconds,
+                                     'max_s': seconds, 'peak_rss_mb': peak}
+            else:
+                s['calls'] += 1
+                s['total_s'] += seconds
+                s['min_s'] = min(s['min_s'], seconds)
+                s['max_s'] = max(s['max_s'], seconds)
+                s['peak_rss_mb'] = max(s['peak_rss_mb'], peak)
+
+    def record(self):
+        return {'run': self.run, 'tool': os.path.basename(sys.argv[0]) if sys.argv else None,
+                'argv': sys.argv[1:], 'pid': os.getpid(), 'time': time.time(),
+                'wall_s': time.perf_counter() - self.start,
+                'peak_rss_mb': round(max(self.peak, rss_mb()), 1),
+                'stages': {k: {f: (round(v, 6) if isinstance(v, float) else v)
+                               for f, v in s.items()} for k, s in self.stages.items()},
+                'counters': dict(self.counters)}
+
+    def emit(self):
+        self._save_profiles()
+        line = json.dumps(self.record())
+        if _ENV == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(_ENV, 'a') as f:
+                f.write(line + '\n')
+
+    # ------------------------------------------------------------------ profiling
+    def profiler(self, name):
+        """Profiler of stage `name` if it is selected and no outer stage is profiled."""
+        if self.profiling or not any(fnmatch.fnmatch(name, p) for p in _PROFILE):
+            return None
+        if name not in self.profilers:
+            if os.environ.get('EMIOT_PROFILER', 'cprofile') == 'pyinstrument':
+                from pyinstrument import Profiler
+                self.profilers[name] = Profiler()
+            else:
+                import cProfile
+                self.profilers[name] = cProfile.Profile()
+        return self.profilers[name]
+
+    def _save_profiles(self):
+        if not self.profilers:
+            return
+        out = os.environ.get('EMIOT_PROFILE_DIR', 'perf_profiles')
+        os.makedirs(out, exist_ok=True)
+        for name, prof in self.profilers.items():
+            if hasattr(prof, 'dump_stats'):
+                prof.dump_stats(os.path.join(out, f'{name}.prof'))
+            else:
+                with open(os.path.join(out, f'{name}.html'), 'w') as f:
+                    f.write(prof.output_html())
+
+
+_recorder = None
+
+
+def _get():
+    global _recorder
+    if _recorder is None:
+        _recorder = _Recorder()
+    return _recorder
+
+
+class _Stage:
+    __slots__ = ('name', 'entry', 'tic', 'prof')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        rec = _get()
+        self.entry = [self.name, rss_mb()]
+        with rec._lock:
+            rec.open.append(self.entry)
+        self.prof = rec.profiler(self.name)
+        if self.prof is not None:
+            rec.profiling = True
+            if hasattr(self.prof, 'enable'):
+                self.prof.enable()     # cProfile
+            else:
+                self.prof.start()      # pyinstrument
+        self.tic = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.tic
+        rec = _recorder
+        if self.prof is not None:
+            if hasattr(self.prof, 'disable'):
+                self.prof.disable()
+            else:
+                self.prof.stop()
+            rec.profiling = False
+        with rec._lock:
+            rec.open = [e for e in rec.open if e is not self.entry]
+        rec.add(self.name, seconds, self.entry[1])
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Context manager timing the block as stage `name`."""
+    return _Stage(name) if _ENV is not None else _NO_STAGE
+
+
+def timed(name):
+    """Decorator: every call of the function is a call of stage `name`."""
+    def wrap(func):
+        if _ENV is None:
+            return func
+
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def count(name, n=1):
+    """Add `n` to counter `name`."""
+    if _ENV is not None:
+        rec = _get()
+        with rec._lock:
+            rec.counters[name] = rec.counters.get(name, 0) + n
+
+
+def snapshot():
+    """The record this process would emit now (None when instrumentation is off)."""
+    return _get().record() if _ENV is not None else None
+
+
+# ==============================================================================
+# Reports
+# ==============================================================================
+def load_records(path, run=None):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if run == 'last' and records:
+        run = records[-1]['run']
+    return [r for r in records if run is None or r['run'] == run]
+
+
+def summarize(records):
+    """Stages and counters of several records (processes) merged by name."""
+    stages, counters = {}, {}
+    for r in records:
+        for name, s in r['stages'].items():
+            t = stages.setdefault(name, {'calls': 0, 'total_s': 0.0, 'min_s': s['min_s'],
+                                         'max_s': 0.0, 'peak_rss_mb': 0.0})
+            t['calls'] += s['calls']
+            t['total_s'] += s['total_s']
+            t['min_s'] = min(t['min_s'], s['min_s'])
+            t['max_s'] = max(t['max_s'], s['max_s'])
+            t['peak_rss_mb'] = max(t['peak_rss_mb'], s['peak_rss_mb'])
+        for name, n in r['counters'].items():
+            counters[name] = counters.get(name, 0) + n
+    return stages, counters
+
+
+def _run_command(name, command):
+    """Time an external command as one stage (peak RSS of the child from rusage)."""
+    import resource
+    import subprocess
+
+    rec = _get() if _ENV is not None else None
+    tic = time.perf_counter()
+    code = subprocess.call(command)
+    seconds = time.perf_counter() - tic
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    peak /= 2**20 if sys.platform == 'darwin' else 2**10
+    if rec is not None:
+        rec.add(name, seconds, peak)
+        rec.peak = max(rec.peak, peak)
+        count(f'{name}.exit_{code}')
+    return code
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-stage performance records')
+    sub = parser.add_subparsers(dest='cmd')
+    rep = sub.add_parser('report', help='Per-stage breakdown of a records file')
+    rep.add_argument('path', type=str)
+    rep.add_argument('--run', type=str, default='last', help="Run id, 'last' or 'all'")
+    rep.add_argument('--json', action='store_true', help='Print the merged breakdown as JSON')
+    run = sub.add_parser('run', help='Run a command as one stage: run NAME -- COMMAND ...')
+    run.add_argument('name', type=str)
+    run.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.cmd == 'run':
+        command = args.command[1:] if args.command[:1] == ['--'] else args.command
+        sys.exit(_run_command(args.name, command))
+    elif args.cmd == 'report':
+        records = load_records(args.path, None if args.run == 'all' else args.run)
+        stages, counters = summarize(records)
+        if args.json:
+            print(json.dumps({'records': len(records), 'stages': stages, 'counters': counters},
+                             indent=1))
+        else:
+            wall = sum(r['wall_s'] for r in records)
+            print(f"{len(records)} records, {wall:.3f} s wall "
+                  f"(run {records[-1]['run'] if records else '-'})")
+            print(f"{'stage':32s} {'calls':>7s} {'total s':>10s} {'mean ms':>10s} "
+                  f"{'max ms':>10s} {'peak MB':>9s}")
+            for name, s in sorted(stages.items(), key=lambda kv: -kv[1]['total_s']):
+                print(f"{name:32s} {s['calls']:7d} {s['total_s']:10.3f} "
+                      f"{1e3 * s['total_s'] / s['calls']:10.3f} {1e3 * s['max_s']:10.3f} "
+                      f"{s['peak_rss_mb']:9.1f}")
+            for name, n in sorted(counters.items()):
+                print(f'{name:32s} {n:7d}')
+    else:
+        parser.print_help()
@@ -0,0 +1,43 @@
+"""
+What the lab modules import from tools/: the stage timers of
+emiot_perf.py and the results store (results_store.py).
+
+Each lab module appends tools/ to sys.path once and imports from here,
+so the fallbacks live in one place:
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+    from emiot_tools import count, stage, timed
+
+If emiot_perf.py cannot be imported, `stage()`, `timed()` and `count()`
+are no-ops (with a warning on stderr when `EMIOT_PERF` asks for the
+report). `ResultsStore` and `montecarlo_topology` are imported from
+results_store.py on first use, so the modules that never write to the
+store do not load it.
+"""
+import os
+import sys
+
+__all__ = ['stage', 'timed', 'count', 'ResultsStore', 'montecarlo_topology']
+
+try:
+    from emiot_perf import count, stage, timed
+except ImportError as e:
+    if os.environ.get('EMIOT_PERF'):
+        print(f"emiot_tools: EMIOT_PERF is set but emiot_perf cannot be imported ({e}); "
+              "no stage timings are recorded", file=sys.stderr)
+    from contextlib import nullcontext as stage
+
+    def timed(name):
+        return lambda func: func
+
+    def count(name, n=1):
+        pass
+
+_STORE_NAMES = ('ResultsStore', 'montecarlo_topology')
+
+
+def __getattr__(name):
+    if name in _STORE_NAMES:
+        import results_store
+        return getattr(results_store, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,449 @@
+"""
+Headless, parallel and incremental rendering of the report figures.
+
+The report figures (energy vs timeout of the DPM sweeps, SOC lifetime,
+converter efficiency histograms and power breakdowns of the lab3 traces)
+are declared in `report_figures`. A build runs in two process-pool stages
+with the Agg backend, so nothing is shown and no window blocks the run:
+
+1. prepare: every input is read once (only the columns its figures need)
+   and reduced to the few arrays a figure draws (decimated SOC, histogram
+   counts, mean powers), cached as .npz under `.figure_cache/`;
+2. render: each figure is drawn from its cached data.
+
+A figure is skipped when its key is unchanged: the hash of its inputs,
+of its parameters and of the code that prepares and draws it. Input
+hashes are kept in the manifest with the file size and mtime, so an
+unchanged 7.7M-row trace is not read again.
+
+Usage (from the repository root):
+    python tools/figure_farm.py                   # build the stale figures
+    python tools/figure_farm.py --list
+    python tools/figure_farm.py --only 'lab3/*' -j 4 --force
+"""
+import argparse
+import fnmatch
+import glob
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from results_store import LFS_POINTER, ROOT, file_hash
+
+__all__ = ['FIGURE_DIR', 'CACHE_DIR', 'KINDS', 'Figure', 'report_figures', 'plan', 'build']
+
+FIGURE_DIR = os.path.join(ROOT, 'figures')
+CACHE_DIR = os.path.join(ROOT, '.figure_cache')
+MANIFEST = '.figures.json'
+LAB3_SCRIPTS = os.path.join(ROOT, 'lab3', 'scripts')
+
+V_BUS = 3.3
+LOAD_COLUMNS = ('i_mcu', 'i_rf', 'i_air_quality_sensor', 'i_methane_sensor',
+                'i_temperature_sensor', 'i_mic_click_sensor')
+# columns a figure can do without (a trace recorded with fewer --trace-signals)
+OPTIONAL_COLUMNS = frozenset(LOAD_COLUMNS)
+
+# name: report-wide unique id (also the output path below FIGURE_DIR, without .png)
+Figure = namedtuple('Figure', 'name kind inputs params')
+
+
+# ==============================================================================
+# Loaders (run once per input in the prepare stage)
+# ==============================================================================
+def _load_table(path, columns):
+    import pandas as pd
+    return pd.read_csv(path, sep='\t', usecols=lambda c: c in columns)
+
+
+def _load_trace(path, columns):
+    if LAB3_SCRIPTS not in sys.path:
+        sys.path.insert(0, LAB3_SCRIPTS)
+    from trace_reader import read_trace, trace_columns
+    # only the columns the trace has: a missing one fails its figures, not the input
+    available = set(trace_columns(path))
+    df = read_trace(path, columns=[c for c in columns if c != 'time' and c in available])
+    df.columns = df.columns.str.replace('%', '')
+    return df
+
+
+# ==============================================================================
+# Figure kinds: prepare (DataFrame -> small arrays) and render (arrays -> Axes)
+# ==============================================================================
+def prepare_energy_timeout(df, params):
+    return {'timeout': df['timeout'].to_numpy(), 'energy_dpm': df['energy_dpm'].to_numpy(),
+            'transitions': df['transitions'].to_numpy()}
+
+
+def render_energy_timeout(plt, data, params):
+    plt.style.use('seaborn-v0_8-whitegrid')
+    fig, ax1 = plt.subplots(figsize=(14, 7))
+    color = 'tab:blue'
+    ax1.set_xlabel('Timeout (ms)', fontsize=14)
+    ax1.set_ylabel('Total Energy (J)', color=color, fontsize=14)
+    ax1.plot(data['timeout'], data['energy_dpm'], color=color, marker='o', label='Total Energy w/ DPM')
+    ax1.tick_params(axis='y', labelcolor=color)
+
+    if not np.isnan(data['energy_dpm']).all():  # a failed sweep has no energy
+        best = int(np.nanargmin(data['energy_dpm']))
+        ax1.scatter(data['timeout'][best], data['energy_dpm'][best], color='red', s=150, zorder=5,
+                    label=f"Optimal Point\nt={int(data['timeout'][best])}ms, "
+                          f"E={data['energy_dpm'][best]:.4f}J")
+
+    ax2 = ax1.twinx()
+    color = 'tab:green'
+    ax2.set_ylabel('Number of Transitions', color=color, fontsize=14)
+    ax2.plot(data['timeout'], data['transitions'], color=color, linestyle='--', marker='x',
+             label='Transitions')
+    ax2.tick_params(axis='y', labelcolor=color)
+
+    plt.title(f"Analysis for {params['title']}", fontsize=16, fontweight='bold')
+    fig.tight_layout()
+    fig.legend(loc='upper right', bbox_to_anchor=(1, 1), bbox_transform=ax1.transAxes)
+    return fig
+
+
+def prepare_soc_lifetime(df, params):
+    from trace_index import TraceIndex
+
+    idx = TraceIndex(df)
+    rows = idx.rows(10, None)
+    t, soc = idx['time'][rows], idx['soc'][rows]
+    lifetime, final_soc = t[-1] / 86400.0, soc[-1]
+    dead = final_soc <= 0.015
+    if dead:
+        hit = idx.first_crossing('soc', 0.0101, start=10)
+        if hit is not None:
+            lifetime = hit[1] / 86400.0
+    step = params['step']
+    return {'days': t[::step] / 86400.0, 'soc': soc[::step], 'lifetime_days': lifetime,
+            'final_soc': final_soc, 'dead': dead}
+
+
+def render_soc_lifetime(plt, data, params):
+    status, color_status = (('DEAD (Depleted)', 'red') if data['dead'] else
+                            ('ALIVE (Running)', 'green'))
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(data['days'], data['soc'], color='green', linewidth=1.5, label='Battery SOC')
+    ax.axhline(y=0.01, color='red', linestyle=':', alpha=0.5, label='Death Threshold (1%)')
+    info_text = (f"Status: {status}\n"
+                 f"Lifetime: {data['lifetime_days']:.2f} Days\n"
+                 f"Final SOC: {data['final_soc'] * 100:.1f}%")
+    ax.text(0.97, 0.97, info_text, transform=ax.transAxes,
+            fontsize=12, verticalalignment='top', horizontalalignment='right',
+            bbox=dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor=color_status))
+    ax.set_xlabel('Time (Days)')
+    ax.set_ylabel('SOC (0.0 - 1.0)')
+    ax.set_title(f"Lifetime: {params['title']} (Sampled 1/{params['step']})")
+    ax.grid(True, linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    return fig
+
+
+def prepare_efficiency(df, params):
+    # same formulas and cleaning as part3_first_and_second_analysis.py and
+    # part3_analysis_charge_distribution.py, reduced to histogram counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_pv_in = df['i_pv'].to_numpy() * df['v_pv'].to_numpy()
+        pv = np.where(p_pv_in > 0, df['real_i_pv'].to_numpy() * V_BUS / p_pv_in * 100, np.nan)
+        i_tot, i_batt = df['i_tot'].to_numpy(), df['i_batt'].to_numpy()
+        p_batt = np.abs(i_batt) * df['v_batt'].to_numpy()
+        discharge = np.where((i_tot > 0) & (i_batt > 0), i_tot * V_BUS / p_batt * 100, np.nan)
+        charge = np.where((i_tot < 0) & (p_batt > 1e-6), np.abs(i_tot) * V_BUS / p_batt * 100, np.nan)
+    data = {}
+    for name, eff in (('pv', pv), ('discharge', discharge), ('charge', charge)):
+        eff = eff[(eff >= 0) & (eff <= 100)]
+        counts, edges = np.histogram(eff, bins=params['bins']) if eff.size else (np.zeros(0), np.zeros(0))
+        data[f'{name}_counts'], data[f'{name}_edges'] = counts, edges
+        data[f'{name}_mean'] = eff.mean() if eff.size else np.nan
+    return data
+
+
+def render_efficiency(plt, data, params):
+    panels = (('pv', 'PV Converter Efficiency', 'blue'),
+              ('discharge', 'Battery Converter Discharge Efficiency', 'orange'),
+              ('charge', 'Battery Converter Charging Efficiency', 'mediumseagreen'))
+    fig, axs = plt.subplots(1, 3, figsize=(18, 5))
+    for ax, (name, title, color) in zip(axs, panels):
+        counts, edges = data[f'{name}_counts'], data[f'{name}_edges']
+        if counts.size:
+            ax.hist(edges[:-1], edges, weights=counts, color=color, alpha=0.7, edgecolor='black')
+        ax.set_title(f"{title}\n(mean {data[f'{name}_mean']:.2f}%)")
+        ax.set_xlabel('Efficiency (%)')
+        ax.set_ylabel('Frequency (Seconds)')
+        ax.grid(axis='y', alpha=0.75)
+    fig.suptitle(params['title'])
+    plt.tight_layout()
+    return fig
+
+
+def prepare_power_breakdown(df, params):
+    loads = [c for c in LOAD_COLUMNS if c in df]
+    i_tot = df['i_tot'].to_numpy()
+    p_batt = df['i_batt'].to_numpy() * df['v_batt'].to_numpy()
+    return {'labels': np.array([c[2:].replace('_sensor', '') for c in loads]),
+            'load_mw': np.array([df[c].mean() * V_BUS for c in loads]),
+            'pv_mw': df['real_i_pv'].mean() * V_BUS,
+            'batt_discharge_mw': p_batt[p_batt > 0].sum() / len(p_batt),
+            'batt_charge_mw': -p_batt[p_batt < 0].sum() / len(p_batt),
+            'discharging': np.count_nonzero(i_tot > 0) / len(i_tot)}
+
+
+def render_power_breakdown(plt, data, params):
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6), gridspec_kw={'width_ratios': [3, 2]})
+    labels = list(data['labels']) + ['PV supplied', 'Battery out', 'Battery in']
+    values = list(data['load_mw']) + [data['pv_mw'], data['batt_discharge_mw'], data['batt_charge_mw']]
+    colors = ['tab:red'] * len(data['labels']) + ['tab:blue', 'tab:orange', 'tab:green']
+    bars = ax1.bar(labels, values, color=colors, alpha=0.8, edgecolor='black')
+    ax1.bar_label(bars, fmt='%.3f', fontsize=9)
+    ax1.set_ylabel('Average Power (mW)')
+    ax1.set_title('Average Power per Load and Source')
+    ax1.tick_params(axis='x', rotation=30)
+    ax1.grid(axis='y', alpha=0.5)
+
+    sizes = [data['discharging'], 1 - data['discharging']]
+    ax2.pie(sizes, explode=(0.1, 0), colors=['#ff9999', '#66b3ff'], autopct='%1.1f%%',
+            labels=['Battery Discharging\n(PV Not Enough)', 'PV Sufficient\n(Battery Charging or Idle)'],
+            startangle=140, textprops={'fontsize': 11})
+    ax2.set_title('How Often is the Battery Used?')
+    fig.suptitle(params['title'])
+    plt.tight_layout()
+    return fig
+
+
+# kind: (loader, columns, prepare, render, default params)
+KINDS = {
+    'energy_timeout': (_load_table, ('timeout', 'energy_dpm', 'transitions'),
+                       prepare_energy_timeout, render_energy_timeout, {'dpi': 100}),
+    'soc_lifetime': (_load_trace, ('time', 'soc'),
+                     prepare_soc_lifetime, render_soc_lifetime, {'step': 1000, 'dpi': 200}),
+    'efficiency': (_load_trace, ('time', 'i_pv', 'v_pv', 'real_i_pv', 'i_tot', 'i_batt', 'v_batt'),
+                   prepare_efficiency, render_efficiency, {'bins': 50, 'dpi': 150}),
+    'power_breakdown': (_load_trace, ('time', 'real_i_pv', 'i_tot', 'i_batt', 'v_batt') + LOAD_COLUMNS,
+                        prepare_power_breakdown, render_power_breakdown, {'dpi': 150}),
+}
+
+
+def _figure(name, kind, path, **params):
+    merged = dict(KINDS[kind][4], title=params.pop('title', os.path.basename(path)), **params)
+    return Figure(name, kind, (path,), merged)
+
+
+def report_figures(root=ROOT):
+    """The declared report figure set (one entry per figure)."""
+    figures = []
+    lab1 = os.path.join(root, 'lab1')
+    sweeps = (glob.glob(os.path.join(lab1, 'results', 'log_results', '*.txt')) +
+              glob.glob(os.path.join(lab1, 'dpm-simulator', 'dpm-simulator', 'results_*.txt')))
+    for path in sorted(sweeps):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        figures.append(_figure(f'lab1/energy_{stem}', 'energy_timeout', path, title=stem))
+
+    lab3 = os.path.join(root, 'lab3')
+    for stem in ('sim_trace', 'se_sim_trace'):
+        path = os.path.join(lab3, stem + '.txt')
+        figures += [_figure(f'lab3/{kind}_{stem}', kind, path)
+                    for kind in ('soc_lifetime', 'efficiency', 'power_breakdown')]
+    for path in sorted(glob.glob(os.path.join(lab3, 'sim_trace_record', '*', 'sim_trace.txt'))):
+        scenario = os.path.basename(os.path.dirname(path))
+        figures.append(_figure(f"lab3/soc_lifetime_{scenario.replace(' ', '_')}", 'soc_lifetime',
+                               path, title=scenario))
+    return figures
+
+
+# ==============================================================================
+# Keys and manifest
+# ==============================================================================
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _input_hash(path, known):
+    """Content hash of an input, reused from the manifest while size and mtime match."""
+    st = os.stat(path)
+    rel = os.path.relpath(path, ROOT)
+    entry = known.get(rel)
+    if entry and entry[:2] == [st.st_size, st.st_mtime]:
+        return entry[2]
+    h = file_hash(path)
+    known[rel] = [st.st_size, st.st_mtime, h]
+    return h
+
+
+def _fetched(path):
+    with open(path, 'rb') as f:
+        return f.read(len(LFS_POINTER)) != LFS_POINTER
+
+
+def plan(figures, out_dir=FIGURE_DIR, force=False):
+    """
+    Split `figures` into (stale, up_to_date, unavailable) and compute their
+    keys. stale entries are (figure, data_key, figure_key).
+    """
+    manifest = _read_manifest(out_dir)
+    stale, fresh, missing = [], [], []
+    for fig in figures:
+        if not all(os.path.exists(p) and _fetched(p) for p in fig.inputs):
+            missing.append(fig)
+            continue
+        loader, columns, prepare, render, _ = KINDS[fig.kind]
+        inputs = [_input_hash(p, manifest['inputs']) for p in fig.inputs]
+        data_params = {k: v for k, v in fig.params.items() if k not in ('dpi', 'title')}
+        data_key = _digest(fig.kind, inputs, data_params, inspect.getsource(prepare))
+        fig_key = _digest(data_key, fig.params, inspect.getsource(render))
+        out = os.path.join(out_dir, fig.name + '.png')
+        if not force and manifest['figures'].get(fig.name) == fig_key and os.path.exists(out):
+            fresh.append(fig)
+        else:
+            stale.append((fig, data_key, fig_key))
+    _write_manifest(out_dir, manifest)  # keep the refreshed input hashes
+    return stale, fresh, missing
+
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'inputs': {}, 'figures': {}}
+
+
+def _write_manifest(out_dir, manifest):
+    os.makedirs(out_dir, exist_ok=True)
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+
+# ==============================================================================
+# Workers
+# ==============================================================================
+def _cache_path(data_key, cache_dir):
+    return os.path.join(cache_dir, data_key[:32] + '.npz')
+
+
+def _prepare_input(path, jobs, cache_dir):
+    """
+    Read one input once and cache the data of every figure that needs it.
+    Returns (path, seconds, {data_key: error}) with the figures that failed.
+    """
+    tic = time.perf_counter()
+    columns = sorted({c for kind, _, _ in jobs for c in KINDS[kind][1]})
+    df = KINDS[jobs[0][0]][0](path, columns)
+    errors = {}
+    for kind, params, data_key in jobs:
+        try:
+            missing = [c for c in KINDS[kind][1] if c not in df and c not in OPTIONAL_COLUMNS]
+            if missing:
+                raise KeyError(f'columns not in the input: {missing}')
+            data = KINDS[kind][2](df, params)
+        except Exception as e:
+            errors[data_key] = repr(e)
+            continue
+        tmp = _cache_path(data_key, cache_dir) + '.tmp.npz'
+        np.savez(tmp, **data)
+        os.replace(tmp, _cache_path(data_key, cache_dir))
+    return path, time.perf_counter() - tic, errors
+
+
+def _render(fig, data_key, out, cache_dir):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    tic = time.perf_counter()
+    with np.load(_cache_path(data_key, cache_dir), allow_pickle=False) as npz:
+        data = {k: (v.item() if v.ndim == 0 else v) for k, v in npz.items()}
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with plt.style.context('default'):
+        figure = KINDS[fig.kind][3](plt, data, fig.params)
+        figure.savefig(out, dpi=fig.params['dpi'])
+    plt.close('all')
+    return fig.name, time.perf_counter() - tic
+
+
+def build(figures, out_dir=FIGURE_DIR, cache_dir=CACHE_DIR, workers=None, force=False, log=print):
+    """Render the stale figures of `figures`; returns (rendered, skipped, unavailable) names."""
+    stale, fresh, missing = plan(figures, out_dir, force)
+    for fig in missing:
+        log(f'[skip] {fig.name}: input not available (missing or git-LFS pointer)')
+    if not stale:
+        return [], [f.name for f in fresh], [f.name for f in missing]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # group the uncached data by input, so a trace is read once for all its figures
+    by_input = {}
+    for fig, data_key, _ in stale:
+        if not os.path.exists(_cache_path(data_key, cache_dir)):
+            jobs = by_input.setdefault(fig.inputs[0], [])
+            if all(key != data_key for _, _, key in jobs):
+                jobs.append((fig.kind, fig.params, data_key))
+
+    rendered = []
+    manifest = _read_manifest(out_dir)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        prepared = {path: pool.submit(_prepare_input, path, jobs, cache_dir)
+                    for path, jobs in by_input.items()}
+        failed, data_errors = set(), {}
+        for path, future in prepared.items():
+            try:
+                _, seconds, errors = future.result()
+            except Exception as e:
+                failed.add(path)
+                log(f'[error] {os.path.relpath(path, ROOT)}: {e!r}')
+                continue
+            data_errors.update(errors)
+            log(f'[data] {os.path.relpath(path, ROOT)} ({seconds:.2f} s)')
+        futures = []
+        for fig, data_key, fig_key in stale:
+            if data_key in data_errors:
+                log(f'[error] {fig.name}: {data_errors[data_key]}')
+            elif fig.inputs[0] not in failed:
+                out = os.path.join(out_dir, fig.name + '.png')
+                futures.append((fig, fig_key, pool.submit(_render, fig, data_key, out, cache_dir)))
+        for fig, fig_key, future in futures:
+            try:
+                seconds = future.result()[1]
+            except Exception as e:
+                log(f'[error] {fig.name}: {e!r}')
+                continue
+            manifest['figures'][fig.name] = fig_key
+            rendered.append(fig.name)
+            log(f'[figure] {fig.name}.png ({seconds:.2f} s)')
+    _write_manifest(out_dir, manifest)
+    return rendered, [f.name for f in fresh], [f.name for f in missing]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the report figures')
+    parser.add_argument('--only', type=str, nargs='+', help='Figure name patterns (e.g. lab3/*)')
+    parser.add_argument('-o', type=str, default=FIGURE_DIR, help='Output directory')
+    parser.add_argument('--cache', type=str, default=CACHE_DIR, help='Data cache directory')
+    parser.add_argument('-j', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Render even if up to date')
+    parser.add_argument('--list', action='store_true', help='List the figures and their state')
+    args = parser.parse_args()
+
+    figures = report_figures()
+    if args.only:
+        figures = [f for f in figures if any(fnmatch.fnmatch(f.name, p) for p in args.only)]
+
+    if args.list:
+        stale, fresh, missing = plan(figures, args.o, args.force)
+        state = {f.name: 'stale' for f, _, _ in stale}
+        state.update({f.name: 'up to date' for f in fresh})
+        state.update({f.name: 'no input' for f in missing})
+        for fig in figures:
+            print(f'{fig.name:60s} {fig.kind:16s} {state[fig.name]}')
+    else:
+        tic = time.perf_counter()
+        rendered, skipped, missing = build(figures, args.o, args.cache, args.j, args.force)
+        print(f'{len(rendered)} rendered, {len(skipped)} up to date, {len(missing)} without input '
+              f'in {time.perf_counter() - tic:.1f} s -> {args.o}')
@@ -0,0 +1,428 @@
+"""
+SQLite store for the results of all labs: DPM sweeps, fleet runs, lab3
+simulations and lifetime studies.
+
+Every run is one row of `runs` with its metadata (kind, workload and PSM
+with their content hashes, policy and parameters as JSON, scenario JSON,
+topology, git revision, runtime); its scalar results are rows of
+`metrics` and the files it produced (traces, figures) rows of `blobs`
+(path, sha256, size; a git-LFS pointer is recorded with the hash of the
+object it points to). Writes are append-only; importing the same file
+twice does not duplicate its runs.
+
+    from results_store import ResultsStore
+    with ResultsStore() as store:
+        store.add_run('dpm_sweep', {'energy_dpm': 0.36}, params={'timeout': 5},
+                      workload='lab1/workloads/workloads/workload_1.txt', policy='timeout')
+        store.best_timeout()
+
+Usage (from the repository root):
+    python tools/results_store.py import            # existing result files
+    python tools/results_store.py best-timeout --metric energy_dpm
+    python tools/results_store.py lifetime
+    python tools/results_store.py sql "SELECT kind, COUNT(*) FROM runs GROUP BY kind"
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import time
+
+__all__ = ['ROOT', 'DEFAULT_DB', 'ResultsStore', 'file_hash', 'git_revision',
+           'import_dpm_results', 'import_fleet_results', 'import_lifetimes', 'topology_name',
+           'montecarlo_topology',
+           'import_trace_record', 'import_all']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(ROOT, 'results.db')
+WORKLOAD_DIR = os.path.join(ROOT, 'lab1', 'workloads', 'workloads')
+LFS_POINTER = b'version https://git-lfs.github.com/spec/v1'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id        INTEGER PRIMARY KEY,
+    kind          TEXT NOT NULL,
+    lab           TEXT,
+    created       TEXT NOT NULL,
+    git_rev       TEXT,
+    runtime_s     REAL,
+    workload      TEXT,
+    workload_hash TEXT,
+    psm           TEXT,
+    psm_hash      TEXT,
+    policy        TEXT,
+    params        TEXT,
+    scenario      TEXT,
+    scenario_hash TEXT,
+    topology      TEXT,
+    source        TEXT,
+    source_row    INTEGER,
+    UNIQUE (source, source_row)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name   TEXT NOT NULL,
+    value  REAL,
+    PRIMARY KEY (run_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    role   TEXT NOT NULL,
+    path   TEXT NOT NULL,
+    sha256 TEXT,
+    size   INTEGER,
+    lfs    INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_workload ON runs (kind, workload_hash, policy);
+CREATE INDEX IF NOT EXISTS runs_topology ON runs (kind, topology);
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics (name, value);
+CREATE INDEX IF NOT EXISTS blobs_run ON blobs (run_id);
+"""
+
+_hash_cache = {}
+_git_rev = None
+
+
+def _rel(path):
+    """Repository-relative path (as stored), or the path itself outside the repo."""
+    path = os.path.abspath(path)
+    rel = os.path.relpath(path, ROOT)
+    return path if rel.startswith('..') else rel
+
+
+def file_hash(path):
+    """sha256 of a file (cached per path, size and mtime); None if it does not exist."""
+    if path is None or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if key not in _hash_cache:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _hash_cache[key] = h.hexdigest()
+    return _hash_cache[key]
+
+
+def git_revision():
+    global _git_rev
+    if _git_rev is None:
+        try:
+            _git_rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                      capture_output=True, text=True).stdout.strip()
+        except OSError:
+            _git_rev = ''
+    return _git_rev or None
+
+
+def _blob(path):
+    """(sha256, size, lfs) of a file, following a git-LFS pointer."""
+    with open(path, 'rb') as f:
+        head = f.read(len(LFS_POINTER))
+    if head == LFS_POINTER:
+        with open(path) as f:
+            fields = dict(line.split(' ', 1) for line in f.read().splitlines() if ' ' in line)
+        return fields['oid'].split(':', 1)[1], int(fields['size']), 1
+    return file_hash(path), os.path.getsize(path), 0
+
+
+class ResultsStore:
+    """Append-only results database (a single SQLite file)."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+        self._batch = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def add_run(self, kind, metrics, params=None, workload=None, psm=None, policy=None,
+                scenario=None, topology=None, lab=None, runtime=None, blobs=None,
+                source=None, source_row=None):
+        """
+        Append one run; returns its id, or None if `(source, source_row)` is
+        already stored. `scenario` is a settings dict or JSON file path,
+        `blobs` a {role: path} dict of produced files.
+        """
+        if isinstance(scenario, str) and os.path.exists(scenario):
+            with open(scenario) as f:
+                scenario = json.load(f)
+        scenario_json = json.dumps(scenario, sort_keys=True) if scenario is not None else None
+        row = {
+            'kind': kind, 'lab': lab, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_rev': git_revision(), 'runtime_s': runtime,
+            'workload': _rel(workload) if workload else None, 'workload_hash': file_hash(workload),
+            'psm': _rel(psm) if psm else None, 'psm_hash': file_hash(psm),
+            'policy': policy, 'params': json.dumps(params, sort_keys=True) if params else None,
+            'scenario': scenario_json,
+            'scenario_hash': hashlib.sha256(scenario_json.encode()).hexdigest() if scenario_json else None,
+            'topology': topology, 'source': _rel(source) if source else None,
+            'source_row': source_row,
+        }
+        if self._batch:
+            return self._insert(row, metrics, blobs)
+        with self.conn:
+            return self._insert(row, metrics, blobs)
+
+    def add_runs(self, runs):
+        """Append many runs (dicts of `add_run` arguments) in one transaction."""
+        self._batch = True
+        try:
+            with self.conn:
+                return [self.add_run(**run) for run in runs]
+        finally:
+            self._batch = False
+
+    def _insert(self, row, metrics, blobs):
+        cur = self.conn.execute(
+            f"INSERT OR IGNORE INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            list(row.values()))
+        if cur.rowcount == 0:
+            return None
+        run_id = cur.lastrowid
+        self.conn.executemany(
+            'INSERT INTO metrics VALUES (?, ?, ?)',
+            [(run_id, k, float(v)) for k, v in metrics.items() if v is not None and v == v])
+        for role, path in (blobs or {}).items():
+            sha, size, lfs = _blob(path)
+            self.conn.execute('INSERT INTO blobs VALUES (?, ?, ?, ?, ?, ?)',
+                              (run_id, role, _rel(path), sha, size, lfs))
+        return run_id
+
+    def query(self, sql, params=()):
+        """Result of a SQL query as a DataFrame."""
+        import pandas as pd
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def runs(self, kind=None):
+        """Runs with their metrics as columns (one row per run)."""
+        import pandas as pd
+        where, args = ('WHERE r.kind = ?', (kind,)) if kind else ('', ())
+        long = self.query(f'SELECT r.run_id, r.kind, r.workload, r.policy, r.params, r.topology, '
+                          f'm.name, m.value FROM runs r JOIN metrics m USING (run_id) {where}', args)
+        if long.empty:
+            return long
+        keys = ['run_id', 'kind', 'workload', 'policy', 'params', 'topology']
+        wide = long.pivot_table(index='run_id', columns='name', values='value')
+        meta = long.drop_duplicates('run_id').set_index('run_id')[keys[1:]]
+        return pd.concat([meta, wide], axis=1).reset_index()
+
+    def best_timeout(self, metric='energy_dpm'):
+        """
+        Per workload (by content) and PSM: the timeout with the lowest
+        `metric`. A sweep whose workload file is unknown is its own group,
+        shown by its result file.
+        """
+        return self.query("""
+            WITH t AS (
+                SELECT COALESCE(r.workload, r.source) AS workload, r.psm, r.params,
+                       json_extract(r.params, '$.timeout') AS timeout, m.value,
+                       ROW_NUMBER() OVER (PARTITION BY COALESCE(r.workload_hash, r.source),
+                                          r.psm_hash,
+                                          json_extract(r.params, '$.state'),
+                                          json_extract(r.params, '$.variant')
+                                          ORDER BY m.value) AS rank
+                FROM runs r JOIN metrics m USING (run_id)
+                WHERE r.policy = 'timeout' AND m.name = ?)
+            SELECT workload, psm, json_extract(params, '$.variant') AS variant,
+                   json_extract(params, '$.state') AS state, timeout, value AS best
+            FROM t WHERE rank = 1 ORDER BY workload, psm, variant, state""", (metric,))
+
+    def lifetime_by_topology(self):
+        """Lifetime (days) statistics of the lab3 runs per topology."""
+        return self.query("""
+            SELECT r.kind, r.topology, COUNT(*) AS runs, MIN(m.value) AS min_days,
+                   AVG(m.value) AS mean_days, MAX(m.value) AS max_days
+            FROM runs r JOIN metrics m USING (run_id)
+            WHERE m.name = 'lifetime_days' AND r.topology IS NOT NULL
+            GROUP BY r.kind, r.topology ORDER BY mean_days DESC""")
+
+
+# ==============================================================================
+# Importers for the existing result files
+# ==============================================================================
+def _read_table(path, sep='\t'):
+    import pandas as pd
+    return pd.read_csv(path, sep=sep)
+
+
+def import_dpm_results(store, path, workload=None, psm=None, state=None):
+    """
+    A timeout sweep of run_all.py (`results_<workload>.txt`, one run per
+    row). The workload is found from the file name; the target state from
+    the `Tout_IDLE_` / `_idle_` / `_sleep_` prefixes of the logs.
+    """
+    name = os.path.basename(path)
+    if workload is None:
+        m = re.search(r'results_(.+)\.txt$', name)
+        candidate = os.path.join(WORKLOAD_DIR, m.group(1) + '.txt') if m else None
+        workload = candidate if candidate and os.path.exists(candidate) else None
+    if state is None:
+        state = 'idle' if re.search(r'idle', name, re.I) else 'sleep'
+    variant = name.split('results_')[0].rstrip('_') or None
+    runs = []
+    for i, row in enumerate(_read_table(path).to_dict('records')):
+        timeout = row.pop('timeout', None)
+        params = {'timeout': timeout, 'state': state}
+        if variant:
+            params['variant'] = variant
+        runs.append(dict(kind='dpm_sweep', metrics=row, params=params, workload=workload, psm=psm,
+                         policy='timeout', lab='lab1', source=path, source_row=i))
+    return sum(r is not None for r in store.add_runs(runs))
+
+
+def import_fleet_results(store, path, psm=None):
+    """Per-device results of fleet_sim.py -o (one run per device and policy)."""
+    runs = []
+    for i, row in enumerate(_read_table(path).to_dict('records')):
+        device, policy, timeout = row.pop('device'), row.pop('policy'), row.pop('timeout')
+        workload = os.path.join(WORKLOAD_DIR, str(device))
+        params = {'device': device}
+        if timeout == timeout:
+            params['timeout'] = timeout
+        runs.append(dict(kind='dpm_fleet', metrics=row, params=params, psm=psm, policy=policy,
+                         lab='lab1', workload=workload if os.path.exists(workload) else None,
+                         source=path, source_row=i))
+    return sum(r is not None for r in store.add_runs(runs))
+
+
+def import_lifetimes(store, path, scenario=None):
+    """Per-scenario lifetimes of lifetime_montecarlo.py -o (CSV)."""
+    runs = [dict(kind='lab3_montecarlo', metrics={'lifetime_days': row.pop('lifetime_days')},
+                 params=row, scenario=scenario, topology=montecarlo_topology(row), lab='lab3',
+                 source=path, source_row=i)
+            for i, row in enumerate(_read_table(path, sep=',').to_dict('records'))]
+    return sum(r is not None for r in store.add_runs(runs))
+
+
+def topology_name(n_pv, n_batt, arrangement=None):
+    """
+    Canonical topology of every lab3 importer: absolute PV panel and
+    battery counts, plus how the extra ones are connected. The simulator
+    (bus.cpp, battery_voc.cpp) and the surrogate multiply the PV current
+    and the battery capacity, i.e. a parallel connection, which is the
+    default when there is more than one of either.
+    """
+    arrangement = _arrangement(n_pv, n_batt, arrangement)
+    return f'pv x{n_pv:g} batt x{n_batt:g}' + (f' {arrangement}' if arrangement else '')
+
+
+def _arrangement(n_pv, n_batt, arrangement):
+    return (arrangement or 'parallel') if n_pv > 1 or n_batt > 1 else None
+
+
+def montecarlo_topology(config):
+    return topology_name(config['n_pv'], config['n_batt'], config.get('arrangement'))
+
+
+_COUNTS = {'one': 1, 'two': 2, 'three': 3}
+# the Part 3 third analysis adds sources to the one-panel, one-battery system
+_BASE = {'pv': 1, 'batt': 1}
+
+
+def _topology(description):
+    """'add two batt in serial' -> ('pv x1 batt x3 serial', params)."""
+    n = dict(_BASE)
+    for count, what in re.findall(r'(one|two|three)\s+(pv|batt)', description):
+        n[what] += _COUNTS[count]
+    arrangement = ('serial' if 'serial' in description else
+                   'parallel' if 'para' in description else None)
+    params = {'n_pv': n['pv'], 'n_batt': n['batt'],
+              'arrangement': _arrangement(n['pv'], n['batt'], arrangement)}
+    return topology_name(n['pv'], n['batt'], arrangement), params
+
+
+def import_trace_record(store, folder):
+    """A lab3 `sim_trace_record/<scenario>/` run: topology from the folder name, trace as blob."""
+    description = os.path.basename(os.path.normpath(folder))
+    topology, params = _topology(description)
+    params['description'] = description
+    trace = os.path.join(folder, 'sim_trace.txt')
+    metrics = {}
+    if os.path.exists(trace) and not _blob(trace)[2]:
+        import pandas as pd
+        df = pd.read_csv(trace, sep=r'\s+', usecols=['%time', 'soc'])
+        df = df[df['%time'] >= 10]
+        dead = df[df['soc'] <= 0.0101]
+        end = dead['%time'].iloc[0] if len(dead) else df['%time'].iloc[-1]
+        metrics = {'lifetime_days': end / 86400, 'final_soc': df['soc'].iloc[-1],
+                   'dead': float(len(dead) > 0)}
+    blobs = {'trace': trace} if os.path.exists(trace) else None
+    return store.add_run('lab3_sim', metrics, params=params, topology=topology, lab='lab3',
+                         blobs=blobs, source=trace, source_row=0) is not None
+
+
+def import_all(store):
+    """Import every known result file of the repository; returns {importer: runs added}."""
+    lab1 = os.path.join(ROOT, 'lab1')
+    psm = os.path.join(lab1, 'dpm-simulator', 'dpm-simulator', 'example', 'psm.txt')
+    counts = {'dpm_sweep': 0, 'lab3_sim': 0}
+    for path in sorted(glob.glob(os.path.join(lab1, 'dpm-simulator', 'dpm-simulator', 'results_*.txt'))):
+        counts['dpm_sweep'] += import_dpm_results(store, path, psm=psm)
+    # the report logs were produced with edited PSMs: no PSM file to link
+    for path in sorted(glob.glob(os.path.join(lab1, 'results', 'log_results', '*.txt'))):
+        counts['dpm_sweep'] += import_dpm_results(store, path)
+    for folder in sorted(glob.glob(os.path.join(ROOT, 'lab3', 'sim_trace_record', '*', ''))):
+        counts['lab3_sim'] += import_trace_record(store, folder)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Results store of the EMIoT labs')
+    parser.add_argument('--db', type=str, default=DEFAULT_DB, help='Database file')
+    sub = parser.add_subparsers(dest='cmd')
+    sub.add_parser('import', help='Import the existing result files of the repository')
+    imp = sub.add_parser('import-file', help='Import one result file')
+    imp.add_argument('type', choices=['dpm', 'fleet', 'lifetime', 'trace-record'])
+    imp.add_argument('path', type=str)
+    imp.add_argument('--psm', type=str, help='PSM file used for the runs')
+    imp.add_argument('--scenario', type=str, help='Settings JSON used for the runs')
+    best = sub.add_parser('best-timeout', help='Best timeout per workload')
+    best.add_argument('--metric', type=str, default='energy_dpm')
+    sub.add_parser('lifetime', help='Lifetime by battery / PV topology')
+    runs = sub.add_parser('runs', help='Runs and their metrics')
+    runs.add_argument('--kind', type=str)
+    sql = sub.add_parser('sql', help='Run a SQL query')
+    sql.add_argument('query', type=str)
+    args = parser.parse_args()
+
+    with ResultsStore(args.db) as store:
+        if args.cmd == 'import':
+            for kind, n in import_all(store).items():
+                print(f'{kind}: {n} new runs')
+        elif args.cmd == 'import-file':
+            if args.type == 'dpm':
+                n = import_dpm_results(store, args.path, psm=args.psm)
+            elif args.type == 'fleet':
+                n = import_fleet_results(store, args.path, psm=args.psm)
+            elif args.type == 'lifetime':
+                n = import_lifetimes(store, args.path, scenario=args.scenario)
+            else:
+                n = import_trace_record(store, args.path)
+            print(f'{int(n)} new runs')
+        elif args.cmd == 'best-timeout':
+            print(store.best_timeout(args.metric).to_string(index=False))
+        elif args.cmd == 'lifetime':
+            print(store.lifetime_by_topology().to_string(index=False))
+        elif args.cmd == 'runs':
+            print(store.runs(args.kind).to_string(index=False))
+        elif args.cmd == 'sql':
+            print(store.query(args.query).to_string(index=False))
+        else:
+            parser.print_help()